@@ -0,0 +1,139 @@
+"""
+Materialized adherence statistics.
+
+Every medication log write refreshes the rollup row for that medication and
+day, then recomputes the row for the surrounding week from its (at most
+seven) daily rows. There is one log per (medication_id, date), so a daily
+rollup always equals that log's contribution. Both steps are plain
+overwrites, which makes them idempotent and safe to re-run inside the
+writer's transaction. History views then read O(days) rollup rows instead
+of every dose.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import bindparam, func, literal, select
+
+from database import insert_for
+from schedule_times import parse_scheduled_time
+import models
+
+COUNTERS = ("taken", "missed", "pending", "delay_minutes_total", "delay_samples")
+
+rollups = models.AdherenceRollup.__table__
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _scheduled_at(day: date, scheduled_time: Optional[str]) -> Optional[datetime]:
+    minutes = parse_scheduled_time(scheduled_time)
+    if minutes is None:
+        return None
+    return datetime.combine(day, datetime.min.time()) + timedelta(minutes=minutes)
+
+
+def contribution(day: date, status: str, taken_at: Optional[datetime], scheduled_time: Optional[str]) -> dict:
+    counts = dict.fromkeys(COUNTERS, 0)
+    if status in ("taken", "missed", "pending"):
+        counts[status] = 1
+    scheduled_at = _scheduled_at(day, scheduled_time)
+    if status == "taken" and taken_at is not None and scheduled_at is not None:
+        if taken_at.tzinfo is not None:
+            # scheduled_time is wall-clock time in the server's zone, as the dose scheduler reads it
+            taken_at = taken_at.astimezone().replace(tzinfo=None)
+        counts["delay_minutes_total"] = round((taken_at - scheduled_at).total_seconds() / 60)
+        counts["delay_samples"] = 1
+    return counts
+
+
+def _upsert(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=[rollups.c.medication_id, rollups.c.period, rollups.c.period_start],
+        set_={name: getattr(stmt.excluded, name) for name in COUNTERS}
+    )
+
+
+def record(conn, entries):
+    """
+    Refresh rollups after medication logs were written in the current transaction.
+    `entries` are dicts with user_id, medication_id, date, status, taken_at and scheduled_time.
+    """
+    day_rows = {}
+    for entry in entries:
+        row = {
+            "user_id": entry["user_id"],
+            "medication_id": entry["medication_id"],
+            "period": "day",
+            "period_start": entry["date"],
+        }
+        row.update(contribution(entry["date"], entry["status"], entry.get("taken_at"), entry.get("scheduled_time")))
+        day_rows[(entry["medication_id"], entry["date"])] = row
+    if not day_rows:
+        return
+
+    insert = insert_for(conn.get_bind() if hasattr(conn, "get_bind") else conn)
+    conn.execute(_upsert(insert(rollups)), list(day_rows.values()))
+
+    # Recompute each touched week from its daily rows
+    daily = rollups.alias("daily")
+    week_select = select(
+        daily.c.user_id,
+        daily.c.medication_id,
+        literal("week"),
+        bindparam("week_start"),
+        *[func.sum(getattr(daily.c, name)) for name in COUNTERS]
+    ).where(
+        daily.c.medication_id == bindparam("med_id"),
+        daily.c.period == "day",
+        daily.c.period_start >= bindparam("week_start"),
+        daily.c.period_start <= bindparam("week_end")
+    ).group_by(daily.c.user_id, daily.c.medication_id)
+    stmt = _upsert(insert(rollups).from_select(
+        ["user_id", "medication_id", "period", "period_start", *COUNTERS], week_select
+    ))
+    weeks = {(med_id, week_start(day)) for med_id, day in day_rows}
+    conn.execute(stmt, [
+        {"med_id": med_id, "week_start": start, "week_end": start + timedelta(days=6)}
+        for med_id, start in weeks
+    ])
+
+
+def rebuild(conn, chunk_size: int = 5000):
+    """Recompute every rollup from medication_logs (used to backfill existing databases)."""
+    conn.execute(rollups.delete())
+    logs = models.MedicationLog.__table__
+    meds = models.Medication.__table__
+    result = conn.execution_options(yield_per=chunk_size).execute(
+        select(logs.c.user_id, logs.c.medication_id, logs.c.date, logs.c.status, logs.c.taken_at, meds.c.scheduled_time)
+        .select_from(logs.join(meds, meds.c.id == logs.c.medication_id))
+        .where(logs.c.date.isnot(None))
+    )
+    for partition in result.partitions(chunk_size):
+        record(conn, [dict(row._mapping) for row in partition])
+
+
+def stats(db, user_id: int, period: str, start_date: date, end_date: date, medication_id: Optional[int] = None):
+    if period == "week":
+        start_date = week_start(start_date)
+    query = db.query(rollups).filter(
+        rollups.c.user_id == user_id,
+        rollups.c.period == period,
+        rollups.c.period_start >= start_date,
+        rollups.c.period_start <= end_date
+    )
+    if medication_id is not None:
+        query = query.filter(rollups.c.medication_id == medication_id)
+    return [
+        {
+            "medication_id": row.medication_id,
+            "period": row.period,
+            "period_start": row.period_start,
+            "taken": row.taken,
+            "missed": row.missed,
+            "pending": row.pending,
+            "mean_delay_minutes": row.delay_minutes_total / row.delay_samples if row.delay_samples else None,
+        }
+        for row in query.order_by(rollups.c.period_start, rollups.c.medication_id)
+    ]
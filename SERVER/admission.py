@@ -0,0 +1,326 @@
+"""
+Admission control and priority lanes (ADMISSION_ENABLED=1).
+
+Every request is classified into a lane by method and path (ROUTES):
+
+- emergency: triggering, resolving and reading alerts. Never rate limited, queued
+  or shed, and not counted against the shared slots below. At startup the
+  threadpool is sized to ADMISSION_MAX_CONCURRENCY + ADMISSION_EMERGENCY_THREADS,
+  so even with every shared slot busy an emergency request finds a thread.
+- interactive: everything else the app does on behalf of a user.
+- bulk: log range reads, batch log writes, stats and /sync.
+
+interactive and bulk share ADMISSION_MAX_CONCURRENCY in-flight slots, bulk using
+at most ADMISSION_BULK_CONCURRENCY of them. Requests beyond that wait in their
+lane's FIFO queue; a freed slot goes to the interactive queue first. A request is
+shed with 503 + Retry-After when its lane's queue is full or it has waited
+ADMISSION_QUEUE_TIMEOUT_MS.
+
+Token buckets limit non-emergency requests per user (a hash of the bearer token,
+or the client address without one) and globally; over the limit the answer is
+429 with Retry-After. The token-less auth routes (AUTH_ROUTES) are limited per
+client address in buckets of their own (RATE_LIMIT_AUTH_*), so a user's traffic
+does not lock them out of logging in. The client address is the peer's, or the
+X-Forwarded-For entry added by a proxy in RATE_LIMIT_TRUSTED_PROXIES.
+
+Buckets, slots and queues live in each worker process: with N workers the
+effective limits are N times the configured ones. Everything runs on the event
+loop, so no locks are needed.
+"""
+import asyncio
+import hashlib
+import math
+import re
+import time
+from collections import Counter, deque
+
+import anyio.to_thread
+
+from cache import TTLCache
+from config import settings
+import serialization
+
+EMERGENCY, INTERACTIVE, BULK = "emergency", "interactive", "bulk"
+
+# (lane, method or None for any, path pattern); first match wins, None means not admitted through a lane
+ROUTES = [
+    (None, "OPTIONS", r".*"),
+    (None, None, r"/(ready|stats|metrics(/slow)?)?"),
+    (None, "GET", r"/emergency/stream"),  # long-lived; would hold a slot for hours
+    (EMERGENCY, None, r"/emergency(/.*)?"),
+    (BULK, "GET", r"/medications/(logs|stats)"),
+    (BULK, "POST", r"/medications/logs/batch"),
+    (BULK, "GET", r"/sync"),
+]
+_ROUTES = [(lane, method, re.compile(pattern)) for lane, method, pattern in ROUTES]
+AUTH_ROUTES = re.compile(r"/auth/(login|register|check-user)")
+
+
+def classify(method: str, path: str):
+    for lane, route_method, pattern in _ROUTES:
+        if (route_method is None or route_method == method) and pattern.fullmatch(path):
+            return lane
+    return INTERACTIVE
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float = None) -> float:
+        """Take a token; returns 0 if one was available, else the seconds until one is."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Lane:
+    def __init__(self, name: str, limit: int, queue_limit: int):
+        self.name = name
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.active = 0
+        self.waiters = deque()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = None, bulk_concurrency: int = None, queue_limit: int = None,
+                 bulk_queue_limit: int = None, queue_timeout: float = None, user_rate: float = None,
+                 user_burst: float = None, global_rate: float = None, global_burst: float = None,
+                 auth_rate: float = None, auth_burst: float = None):
+        self.max_concurrency = max_concurrency or settings.ADMISSION_MAX_CONCURRENCY
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000
+        # Highest priority first
+        self.lanes = {
+            INTERACTIVE: Lane(INTERACTIVE, self.max_concurrency,
+                              queue_limit if queue_limit is not None else settings.ADMISSION_QUEUE_LIMIT),
+            BULK: Lane(BULK, min(self.max_concurrency, bulk_concurrency or settings.ADMISSION_BULK_CONCURRENCY),
+                       bulk_queue_limit if bulk_queue_limit is not None else settings.ADMISSION_BULK_QUEUE_LIMIT),
+        }
+        self.active = 0
+        self.emergency_active = 0
+
+        self.user_rate = user_rate if user_rate is not None else settings.RATE_LIMIT_USER_PER_SECOND
+        self.user_burst = user_burst or settings.RATE_LIMIT_USER_BURST or self.user_rate
+        self._user_buckets = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE,
+                                      ttl=self.user_burst / self.user_rate + 1 if self.user_rate > 0 else 1)
+        self.auth_rate = auth_rate if auth_rate is not None else settings.RATE_LIMIT_AUTH_PER_SECOND
+        self.auth_burst = auth_burst or settings.RATE_LIMIT_AUTH_BURST or self.auth_rate
+        self._auth_buckets = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE,
+                                      ttl=self.auth_burst / self.auth_rate + 1 if self.auth_rate > 0 else 1)
+        global_rate = global_rate if global_rate is not None else settings.RATE_LIMIT_GLOBAL_PER_SECOND
+        self._global_bucket = TokenBucket(global_rate, global_burst or settings.RATE_LIMIT_GLOBAL_BURST or global_rate) if global_rate > 0 else None
+
+        self.admitted = Counter()  # lane
+        self.queued = Counter()  # lane
+        self.shed = Counter()  # (lane, reason)
+
+    # --- rate limits -------------------------------------------------------
+
+    @staticmethod
+    def _take_keyed(buckets: TTLCache, key: str, rate: float, burst: float) -> float:
+        if rate <= 0:
+            return 0.0
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+        wait = bucket.take()
+        # Re-set on every request: an idle bucket expires once it would be full again
+        buckets.set(key, bucket)
+        return wait
+
+    def rate_limit(self, key: str, auth: bool = False) -> float:
+        """Seconds the caller must wait before retrying (0 if the request may proceed)."""
+        if auth:
+            wait = self._take_keyed(self._auth_buckets, key, self.auth_rate, self.auth_burst)
+        else:
+            wait = self._take_keyed(self._user_buckets, key, self.user_rate, self.user_burst)
+        if wait:
+            return wait
+        if self._global_bucket is not None:
+            return self._global_bucket.take()
+        return 0.0
+
+    # --- slots ---------------------------------------------------------------
+
+    def _has_slot(self, lane: Lane) -> bool:
+        return self.active < self.max_concurrency and lane.active < lane.limit
+
+    def _take(self, lane: Lane):
+        lane.active += 1
+        self.active += 1
+        self.admitted[lane.name] += 1
+
+    def _waiting_ahead(self, lane: Lane) -> bool:
+        for other in self.lanes.values():
+            if other.waiters:
+                return True
+            if other is lane:
+                return False
+        return False
+
+    async def acquire(self, name: str) -> bool:
+        """Wait for a slot in lane `name`; False means the request should be shed."""
+        lane = self.lanes[name]
+        if self._has_slot(lane) and not self._waiting_ahead(lane):
+            self._take(lane)
+            return True
+        if len(lane.waiters) >= lane.queue_limit:
+            self.shed[(name, "queue_full")] += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        self.queued[name] += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return True  # granted just as the wait ran out
+            self.shed[(name, "queue_timeout")] += 1
+            return False
+        except asyncio.CancelledError:
+            # The client went away; hand back a slot granted in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release(name)
+            raise
+        finally:
+            if waiter in lane.waiters:
+                lane.waiters.remove(waiter)
+        return True
+
+    def release(self, name: str):
+        lane = self.lanes[name]
+        lane.active -= 1
+        self.active -= 1
+        self._grant()
+
+    def _grant(self):
+        for lane in self.lanes.values():
+            while lane.waiters and self._has_slot(lane):
+                waiter = lane.waiters.popleft()
+                if waiter.done():
+                    continue  # timed out or cancelled
+                self._take(lane)
+                waiter.set_result(True)
+
+    def retry_after(self, name: str) -> int:
+        # Roughly the time for the queue ahead to drain, given the current wait budget
+        lane = self.lanes[name]
+        return max(1, math.ceil(self.queue_timeout * len(lane.waiters) / max(1, lane.limit)))
+
+    # --- reporting -----------------------------------------------------------
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": {EMERGENCY: self.emergency_active, **{name: lane.active for name, lane in self.lanes.items()}},
+            "queue_depth": {name: len(lane.waiters) for name, lane in self.lanes.items()},
+            "admitted": dict(self.admitted),
+            "queued": dict(self.queued),
+            "shed": {f"{lane}:{reason}": count for (lane, reason), count in self.shed.items()},
+        }
+
+    def metrics(self):
+        """Collector for instrumentation.registry."""
+        yield "lumi_admission_queue_depth", "gauge", "Requests waiting for a slot per lane.", [
+            ({"lane": name}, len(lane.waiters)) for name, lane in self.lanes.items()
+        ]
+        yield "lumi_admission_in_flight", "gauge", "Requests holding a slot per lane.", [
+            ({"lane": EMERGENCY}, self.emergency_active)
+        ] + [({"lane": name}, lane.active) for name, lane in self.lanes.items()]
+        yield "lumi_admission_admitted_total", "counter", "Requests admitted per lane.", [
+            ({"lane": name}, count) for name, count in sorted(self.admitted.items())
+        ]
+        yield "lumi_admission_shed_total", "counter", "Requests rejected per lane and reason.", [
+            ({"lane": lane, "reason": reason}, count) for (lane, reason), count in sorted(self.shed.items())
+        ]
+
+
+controller = AdmissionController()
+
+
+def configure_threadpool():
+    """Leave ADMISSION_EMERGENCY_THREADS worker threads that only emergency requests can reach."""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, settings.ADMISSION_MAX_CONCURRENCY + settings.ADMISSION_EMERGENCY_THREADS)
+
+
+def _client_address(scope) -> str:
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    trusted = settings.RATE_LIMIT_TRUSTED_PROXIES
+    if address not in trusted:
+        return address
+    for name, value in scope.get("headers", ()):
+        if name == b"x-forwarded-for":
+            # The rightmost hop not added by one of our proxies; anything left of it is client-supplied
+            for hop in reversed(value.decode("latin-1").split(",")):
+                hop = hop.strip()
+                if hop and hop not in trusted:
+                    return hop
+            break
+    return address
+
+
+def _client_key(scope) -> str:
+    # The token is not decoded here (that would run jwt.decode on the event loop); a token
+    # maps to one user, and forged ones are rejected downstream and still hit the global bucket
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.partition(b" ")
+            if scheme.lower() == b"bearer" and token:
+                return "token:" + hashlib.blake2b(token, digest_size=16).hexdigest()
+            break
+    return "addr:" + _client_address(scope)
+
+
+async def _reject(send, status: int, retry_after: float, detail: str):
+    body = serialization.dumps({"detail": detail})
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController = None):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        lane = classify(scope["method"], scope["path"])
+        if lane is None:
+            return await self.app(scope, receive, send)
+        control = self.controller or controller
+
+        if lane == EMERGENCY:
+            control.emergency_active += 1
+            control.admitted[EMERGENCY] += 1
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                control.emergency_active -= 1
+
+        if AUTH_ROUTES.fullmatch(scope["path"]):
+            wait = control.rate_limit("addr:" + _client_address(scope), auth=True)
+        else:
+            wait = control.rate_limit(_client_key(scope))
+        if wait:
+            control.shed[(lane, "rate_limited")] += 1
+            return await _reject(send, 429, wait, "Too many requests")
+        if not await control.acquire(lane):
+            return await _reject(send, 503, control.retry_after(lane), "Server busy, retry later")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            control.release(lane)
@@ -0,0 +1,246 @@
+"""
+Latency and throughput benchmark for the Lumi API.
+
+Runs main.app in-process against a temporary SQLite database, seeds N users
+with seed.py, and drives a concurrent mixed workload of logins, dashboard
+reads, medication log writes and emergency polling. Reports p50/p95/p99
+latency and requests/second per endpoint as JSON.
+
+    python benchmarks/bench_api.py --users 50 --concurrency 32 --duration 20
+    python benchmarks/bench_api.py --transport uvicorn --output bench.json
+    python benchmarks/bench_api.py --baseline bench.json --max-regression 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+# Default mix of operations per simulated client step
+WORKLOAD = {
+    "dashboard": 40,
+    "emergency_poll": 30,
+    "log_write": 20,
+    "logs_range": 8,
+    "login": 2,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, errors, elapsed):
+    report = {}
+    for name in sorted(set(samples) | set(errors)):
+        values = sorted(samples.get(name, []))
+        report[name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": _ms(percentile(values, 50)),
+            "p95_ms": _ms(percentile(values, 95)),
+            "p99_ms": _ms(percentile(values, 99)),
+            "max_ms": _ms(values[-1] if values else None),
+        }
+    return report
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def regressions(report, baseline, max_regression):
+    """Endpoints whose p95 latency grew by more than `max_regression` (a fraction) over the baseline."""
+    failed = {}
+    for name, current in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not before.get("p95_ms") or current["p95_ms"] is None:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            failed[name] = {"baseline_p95_ms": before["p95_ms"], "p95_ms": current["p95_ms"]}
+    return failed
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_uvicorn(app):
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def seed_users(count):
+    import seed
+    from database import SessionLocal
+
+    phones = []
+    db = SessionLocal()
+    try:
+        for i in range(count):
+            phone = f"7{i:09d}"
+            seed.seed_data(db, phone=phone, fullname=f"Bench User {i}", verbose=False)
+            phones.append(phone)
+    finally:
+        db.close()
+    return phones
+
+
+class Runner:
+    def __init__(self, client, phones, workload):
+        self.client = client
+        self.phones = phones
+        self.names, self.weights = zip(*workload.items())
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sessions = {}
+
+    async def timed(self, name, method, url, expected=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+        except Exception:
+            self.errors[name] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        if resp.status_code in expected:
+            self.samples[name].append(elapsed)
+        else:
+            self.errors[name] += 1
+        return resp
+
+    async def login(self, phone):
+        resp = await self.timed("login", "POST", "/auth/login", json={"phone": phone, "otp": "1234"})
+        if resp is None or resp.status_code != 200:
+            return
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        meds = await self.client.get("/medications/", headers=headers)
+        self.sessions[phone] = (headers, [m["id"] for m in meds.json()])
+
+    async def step(self, rng, phone):
+        headers, med_ids = self.sessions[phone]
+        today = date.today()
+        op = rng.choices(self.names, self.weights)[0]
+        if op == "dashboard":
+            await self.timed(op, "GET", "/dashboard/", headers=headers)
+        elif op == "emergency_poll":
+            await self.timed(op, "GET", "/emergency/active", expected=(200, 404), headers=headers)
+        elif op == "log_write" and med_ids:
+            med_id = rng.choice(med_ids)
+            await self.timed(op, "POST", f"/medications/{med_id}/log", headers=headers, json={
+                "medication_id": med_id, "status": rng.choice(["taken", "pending"]), "date": str(today),
+            })
+        elif op == "logs_range":
+            await self.timed(op, "GET", "/medications/logs", headers=headers, params={
+                "start_date": str(today - timedelta(days=14)), "end_date": str(today),
+            })
+        elif op == "login":
+            await self.login(phone)
+
+    async def client_loop(self, worker, deadline):
+        rng = random.Random(worker)
+        while time.perf_counter() < deadline:
+            await self.step(rng, self.phones[rng.randrange(len(self.phones))])
+
+
+async def run(args):
+    import httpx
+    import main, migrations
+
+    # The app no longer creates its schema on import; migrate the scratch database first
+    migrations.upgrade()
+    phones = seed_users(args.users)
+    server = None
+    if args.transport == "uvicorn":
+        server, thread, base_url = start_uvicorn(main.app)
+        client = httpx.AsyncClient(base_url=base_url, limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+
+    async with client:
+        runner = Runner(client, phones, WORKLOAD)
+        await asyncio.gather(*(runner.login(phone) for phone in phones))
+        runner.samples.clear()
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(runner.client_loop(worker, deadline) for worker in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    if server is not None:
+        server.should_exit = True
+        thread.join(5)
+
+    total = sum(len(v) for v in runner.samples.values())
+    return {
+        "config": {
+            "transport": args.transport,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "workload": WORKLOAD,
+        },
+        "total": {"requests": total, "errors": sum(runner.errors.values()), "rps": round(total / elapsed, 1)},
+        "endpoints": summarize(runner.samples, runner.errors, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds of measured load")
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed p95 growth vs. baseline (fraction)")
+    args = parser.parse_args()
+
+    # Must be configured before the app modules create their engine
+    tmpdir = tempfile.mkdtemp(prefix="lumi-bench-api-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ.setdefault("SCHEDULER_ENABLED", "0")
+    # Measure the endpoints, not the per-user rate limiter
+    os.environ.setdefault("RATE_LIMIT_USER_PER_SECOND", "0")
+
+    report = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as fh:
+            report["regressions"] = regressions(report, json.load(fh), args.max_regression)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Concurrent write throughput for the SQLite engine profiles in database.py.
+
+Runs the same workload (medication log upserts + emergency alert inserts from
+many threads, one commit per write like the routers do) against a fresh
+temporary database for each profile and prints the results as JSON.
+
+    python benchmarks/bench_sqlite_writes.py --threads 16 --writes 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import models
+from database import Base, build_engine
+
+
+def run_profile(profile: str, threads: int, writes: int) -> dict:
+    tmpdir = tempfile.mkdtemp(prefix=f"lumi-bench-{profile}-")
+    engine = build_engine(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}", profile=profile)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    with Session() as db:
+        user = models.User(fullname="Bench", phone="bench", dob=date(1950, 1, 1), blood_group="O+")
+        db.add(user)
+        db.flush()
+        meds = [models.Medication(user_id=user.id, name=f"Med {i}", dosage="1", scheduled_time="08:00", start_date=date.today()) for i in range(threads)]
+        db.add_all(meds)
+        db.commit()
+        user_id, med_ids = user.id, [m.id for m in meds]
+
+    ok, locked = [0] * threads, [0] * threads
+
+    def worker(n):
+        db = Session()
+        try:
+            for i in range(writes):
+                try:
+                    if i % 10 == 0:
+                        db.add(models.EmergencyAlert(user_id=user_id, stage="voice_alert", is_active=False))
+                    else:
+                        db.add(models.MedicationLog(medication_id=med_ids[n], user_id=user_id, status="taken", date=date.today() - timedelta(days=i)))
+                    db.commit()
+                    ok[n] += 1
+                except OperationalError:
+                    db.rollback()
+                    locked[n] += 1
+        finally:
+            db.close()
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    engine.dispose()
+    return {
+        "profile": profile,
+        "journal_mode": journal_mode,
+        "threads": threads,
+        "writes_attempted": threads * writes,
+        "writes_committed": sum(ok),
+        "database_locked_errors": sum(locked),
+        "elapsed_s": round(elapsed, 3),
+        "writes_per_s": round(sum(ok) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=200, help="writes per thread")
+    parser.add_argument("--profiles", nargs="+", default=["default", "production"])
+    args = parser.parse_args()
+
+    results = [run_profile(p, args.threads, args.writes) for p in args.profiles]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
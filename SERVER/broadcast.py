@@ -0,0 +1,116 @@
+"""
+Cross-worker messaging over the shared SQLite database.
+
+With several worker processes (serve.py), in-process state such as the principal
+cache and the SSE event hub only sees what happens in its own worker. The
+SQLiteNotifier appends messages to the `notifications` table and every worker polls
+it for rows newer than the last id it has seen, dispatching them to the handlers
+registered for the message's channel. Old rows are pruned after
+BROADCAST_RETENTION_SECONDS.
+
+Enable with BROADCAST_BACKEND=sqlite (serve.py does this for more than one worker).
+"""
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from config import settings
+from database import engine as default_engine
+import events, models
+
+logger = logging.getLogger(__name__)
+
+notifications = models.Notification.__table__
+
+
+class SQLiteNotifier:
+    def __init__(self, engine=default_engine, poll_interval: float = None, retention: float = None):
+        self.engine = engine
+        self.poll_interval = poll_interval if poll_interval is not None else settings.BROADCAST_POLL_MS / 1000
+        self.retention = retention if retention is not None else settings.BROADCAST_RETENTION_SECONDS
+        self._handlers = {}  # channel -> [callable(payload)]
+        self._last_id = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def subscribe(self, channel: str, handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, payload):
+        with self.engine.begin() as conn:
+            conn.execute(notifications.insert().values(channel=channel, payload=json.dumps(payload)))
+
+    def start(self):
+        if self.running:
+            return
+        with self.engine.connect() as conn:
+            self._last_id = conn.execute(select(func.max(notifications.c.id))).scalar() or 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="broadcast-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def poll(self):
+        """Dispatch notifications newer than the last seen id; returns how many were handled."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(notifications.c.id, notifications.c.channel, notifications.c.payload)
+                .where(notifications.c.id > self._last_id).order_by(notifications.c.id)
+            ).all()
+        for row in rows:
+            self._last_id = row.id
+            for handler in self._handlers.get(row.channel, ()):
+                try:
+                    handler(json.loads(row.payload))
+                except Exception:
+                    logger.exception("broadcast handler for %s failed", row.channel)
+        return len(rows)
+
+    def prune(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        with self.engine.begin() as conn:
+            conn.execute(notifications.delete().where(notifications.c.created_at < cutoff))
+
+    def _run(self):
+        polls = 0
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+                polls += 1
+                if polls * self.poll_interval >= self.retention:
+                    polls = 0
+                    self.prune()
+            except Exception:
+                logger.exception("broadcast poll failed")
+
+
+class NotifierBroker(events.Broker):
+    """Event hub broker delivering every published event to all workers' hubs."""
+
+    CHANNEL = "events"
+
+    def __init__(self, notifier: SQLiteNotifier):
+        self.notifier = notifier
+
+    def start(self, deliver):
+        super().start(deliver)
+        self.notifier.subscribe(self.CHANNEL, lambda message: deliver(message["user_id"], message["event"]))
+
+    def publish(self, user_id: int, event: dict):
+        self.notifier.publish(self.CHANNEL, {"user_id": user_id, "event": event})
+
+
+notifier = SQLiteNotifier()
@@ -0,0 +1,66 @@
+"""
+Change tracking for delta sync (GET /sync).
+
+Every user has a counter in sync_versions. A write transaction touching a user's
+nominees, medications, logs or alerts takes the next value with bump() and
+stamps it on the rows it writes (row_version, updated_at); deletes leave a
+tombstone carrying the version instead. A client that last synced at version N
+then needs exactly the rows and tombstones with row_version > N.
+
+bump() is an upsert on the user's counter row, so concurrent writers for the
+same user serialize on it: the version order matches the commit order and a
+reader never misses a row committed under a smaller version than one it has
+already seen.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select
+
+from database import insert_for
+import models
+
+versions = models.SyncVersion.__table__
+tombstones = models.SyncTombstone.__table__
+
+
+def bump(db, user_id: int) -> int:
+    """Take the user's next change version (in the caller's transaction)."""
+    insert = insert_for(db.get_bind())
+    stmt = insert(versions).values(user_id=user_id, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[versions.c.user_id],
+        set_={"version": versions.c.version + 1}
+    ).returning(versions.c.version)
+    return db.execute(stmt).scalar_one()
+
+
+def stamp(db, user_id: int) -> dict:
+    """Column values marking a row as written in a new change version."""
+    return {"row_version": bump(db, user_id), "updated_at": datetime.utcnow()}
+
+
+def stamp_rows(db, rows: Iterable[dict]) -> List[dict]:
+    """stamp() a list of row dicts, taking one version per user rather than per row."""
+    rows = list(rows)
+    by_user: Dict[int, list] = defaultdict(list)
+    for row in rows:
+        by_user[row["user_id"]].append(row)
+    stamped = []
+    for user_id, user_rows in by_user.items():
+        values = stamp(db, user_id)
+        stamped.extend({**row, **values} for row in user_rows)
+    return stamped
+
+
+def current_version(db, user_id: int) -> int:
+    return db.execute(select(versions.c.version).where(versions.c.user_id == user_id)).scalar() or 0
+
+
+def tombstone(db, user_id: int, entity: str, entity_id: int):
+    """Record the delete of `entity` #`entity_id` under a new change version."""
+    db.execute(tombstones.insert().values(
+        user_id=user_id, entity=entity, entity_id=entity_id,
+        row_version=bump(db, user_id), deleted_at=datetime.utcnow()
+    ))
@@ -5,13 +5,145 @@ class Settings:
     PROJECT_VERSION: str = "1.0.0"
     
     # Database
-    DATABASE_URL: str = "sqlite:///./lumi.db"
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./lumi.db")
+    # Engine profile: "production" applies the SQLite pragmas below on every new
+    # connection, "default" leaves SQLite with its stock settings
+    DB_PROFILE: str = os.getenv("DB_PROFILE", "production")
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB, i.e. 64MB
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    # Connection pool: "queue", "null", "static" or "singleton"; empty keeps SQLAlchemy's choice
+    DB_POOL_CLASS: str = os.getenv("DB_POOL_CLASS", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+    # Serve the read/polling endpoints from an async engine (requires aiosqlite)
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "0") == "1"
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
     
+    # Per-endpoint loader strategies, e.g. "medications.list=selectin,nominees.list=joined"
+    # (see loaders.py; endpoints not listed use column projection)
+    LOADER_STRATEGIES: dict = dict(
+        item.split("=", 1) for item in os.getenv("LOADER_STRATEGIES", "").split(",") if "=" in item
+    )
+
+    # Dose scheduler: creates "pending" logs when doses fall due and marks them
+    # "missed" once SCHEDULER_MISSED_AFTER_MINUTES have passed; at startup, doses
+    # missed while it was down are recorded up to SCHEDULER_BACKFILL_DAYS back
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "0") == "1"
+    SCHEDULER_MISSED_AFTER_MINUTES: int = int(os.getenv("SCHEDULER_MISSED_AFTER_MINUTES", "120"))
+    SCHEDULER_BATCH_SIZE: int = int(os.getenv("SCHEDULER_BATCH_SIZE", "1000"))
+    SCHEDULER_BACKFILL_DAYS: int = int(os.getenv("SCHEDULER_BACKFILL_DAYS", "7"))
+
     # Security
     SECRET_KEY: str = "super_secret_key_for_hackathon_12345"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days for demo
-    
+
+    # Principal cache used by get_current_user (keyed by token subject)
+    AUTH_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+    AUTH_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+    # Verified tokens are memoized until they expire (bounded LRU)
+    AUTH_TOKEN_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_TOKEN_CACHE_MAX_SIZE", "50000"))
+
+    # Per-user response cache for /users/me, /nominees/ and /medications/ (response_cache.py):
+    # "memory", "sqlite" (shared by the workers on a host) or "off"
+    RESPONSE_CACHE: str = os.getenv("RESPONSE_CACHE", "memory")
+    RESPONSE_CACHE_MAX_BYTES: int = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    # Users whose version counter the memory backend keeps (least recently written dropped first)
+    RESPONSE_CACHE_MAX_USERS: int = int(os.getenv("RESPONSE_CACHE_MAX_USERS", "100000"))
+    RESPONSE_CACHE_PATH: str = os.getenv("RESPONSE_CACHE_PATH", "./lumi-cache.db")
+
+    # Startup: a plain `uvicorn main:app` (local development) applies pending
+    # migrations in the app's lifespan. serve.py migrates once in its parent and
+    # sets AUTO_MIGRATE=0, as should any deploy that runs `python migrations.py`
+    AUTO_MIGRATE: bool = os.getenv("AUTO_MIGRATE", "1") == "1"
+    # Pooled connections opened before the worker reports ready
+    DB_WARM_CONNECTIONS: int = int(os.getenv("DB_WARM_CONNECTIONS", "4"))
+
+    # Multi-worker serving (serve.py): WORKERS=0 sizes to the available cores.
+    # BROADCAST_BACKEND=sqlite shares events and cache invalidation between workers
+    # through the notifications table, polled every BROADCAST_POLL_MS.
+    WORKERS: int = int(os.getenv("WORKERS", "0"))
+    BROADCAST_BACKEND: str = os.getenv("BROADCAST_BACKEND", "local")
+    BROADCAST_POLL_MS: int = int(os.getenv("BROADCAST_POLL_MS", "100"))
+    BROADCAST_RETENTION_SECONDS: int = int(os.getenv("BROADCAST_RETENTION_SECONDS", "60"))
+    # Only the worker holding this file lock runs the dose scheduler and escalation engine (empty: every worker)
+    SCHEDULER_LOCK_FILE: str = os.getenv("SCHEDULER_LOCK_FILE", "")
+    # Write transactions retried when SQLite reports the database as locked/busy
+    DB_BUSY_RETRIES: int = int(os.getenv("DB_BUSY_RETRIES", "5"))
+
+    # How long an Idempotency-Key's first response is replayed
+    IDEMPOTENCY_KEY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+    # Write-behind for POST /medications/{id}/log (see writebehind.py): updates are
+    # journaled, acknowledged with 202 and flushed in grouped transactions
+    LOG_WRITE_BEHIND: bool = os.getenv("LOG_WRITE_BEHIND", "0") == "1"
+    LOG_FLUSH_INTERVAL_MS: int = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "200"))
+    LOG_FLUSH_MAX_PENDING: int = int(os.getenv("LOG_FLUSH_MAX_PENDING", "500"))
+    LOG_JOURNAL_DIR: str = os.getenv("LOG_JOURNAL_DIR", "./journal")
+    LOG_JOURNAL_FSYNC: bool = os.getenv("LOG_JOURNAL_FSYNC", "0") == "1"
+
+    # Nominee notifications (dispatch.py): outbox rows are always written with the alert;
+    # DISPATCH_ENABLED runs the sender in this worker
+    DISPATCH_ENABLED: bool = os.getenv("DISPATCH_ENABLED", "0") == "1"
+    DISPATCH_GATEWAY: str = os.getenv("DISPATCH_GATEWAY", "log")
+    DISPATCH_CONCURRENCY: int = int(os.getenv("DISPATCH_CONCURRENCY", "50"))
+    DISPATCH_PROVIDER_CONCURRENCY: int = int(os.getenv("DISPATCH_PROVIDER_CONCURRENCY", "10"))
+    DISPATCH_MAX_ATTEMPTS: int = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "6"))
+    DISPATCH_POLL_MS: int = int(os.getenv("DISPATCH_POLL_MS", "1000"))
+    DISPATCH_SEND_TIMEOUT_SECONDS: int = int(os.getenv("DISPATCH_SEND_TIMEOUT_SECONDS", "15"))
+
+    # Admission control (admission.py): non-emergency requests share ADMISSION_MAX_CONCURRENCY
+    # slots, bulk endpoints at most ADMISSION_BULK_CONCURRENCY; emergency requests are never
+    # queued or shed and get ADMISSION_EMERGENCY_THREADS threads of their own
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "0") == "1"
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+    ADMISSION_BULK_CONCURRENCY: int = int(os.getenv("ADMISSION_BULK_CONCURRENCY", "4"))
+    ADMISSION_EMERGENCY_THREADS: int = int(os.getenv("ADMISSION_EMERGENCY_THREADS", "8"))
+    ADMISSION_QUEUE_LIMIT: int = int(os.getenv("ADMISSION_QUEUE_LIMIT", "200"))
+    ADMISSION_BULK_QUEUE_LIMIT: int = int(os.getenv("ADMISSION_BULK_QUEUE_LIMIT", "20"))
+    ADMISSION_QUEUE_TIMEOUT_MS: int = int(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+    # Token buckets for non-emergency requests (a rate of 0 disables; a burst of 0 means one second's worth)
+    RATE_LIMIT_USER_PER_SECOND: float = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "20"))
+    RATE_LIMIT_USER_BURST: float = float(os.getenv("RATE_LIMIT_USER_BURST", "100"))
+    RATE_LIMIT_GLOBAL_PER_SECOND: float = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "0"))
+    RATE_LIMIT_GLOBAL_BURST: float = float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "0"))
+    # /auth/login, /auth/register and /auth/check-user carry no token: they are limited per
+    # client address in buckets of their own. Behind a reverse proxy, list its addresses in
+    # RATE_LIMIT_TRUSTED_PROXIES so the client address is read from X-Forwarded-For
+    RATE_LIMIT_AUTH_PER_SECOND: float = float(os.getenv("RATE_LIMIT_AUTH_PER_SECOND", "5"))
+    RATE_LIMIT_AUTH_BURST: float = float(os.getenv("RATE_LIMIT_AUTH_BURST", "50"))
+    RATE_LIMIT_TRUSTED_PROXIES: set = {
+        item.strip() for item in os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "").split(",") if item.strip()
+    }
+
+    # Server-side emergency escalation (escalation.py): seconds an active alert may stay in
+    # each stage before the server moves it on; runs in the worker that runs the scheduler
+    ESCALATION_ENABLED: bool = os.getenv("ESCALATION_ENABLED", "1") == "1"
+    ESCALATION_VOICE_ALERT_SECONDS: int = int(os.getenv("ESCALATION_VOICE_ALERT_SECONDS", "30"))
+    ESCALATION_WAITING_RESPONSE_SECONDS: int = int(os.getenv("ESCALATION_WAITING_RESPONSE_SECONDS", "60"))
+    ESCALATION_NOTIFYING_RELATIVES_SECONDS: int = int(os.getenv("ESCALATION_NOTIFYING_RELATIVES_SECONDS", "120"))
+
+    # Days of medication logs sent by a full GET /sync (since=0); deltas are not windowed
+    SYNC_FULL_LOG_DAYS: int = int(os.getenv("SYNC_FULL_LOG_DAYS", "90"))
+
+    # Request instrumentation: per-route timings, SQL counts, Server-Timing, GET /metrics and
+    # GET /stats (unauthenticated: keep them off the public listener)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "0") == "1"
+    SERVER_TIMING: bool = os.getenv("SERVER_TIMING", "1") == "1"
+    # Sample thread stacks of requests slower than this (0 disables the profiler)
+    PROFILE_SLOW_REQUEST_MS: int = int(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+
+    # Encode listings straight from row tuples with orjson; FAST_JSON_VALIDATE checks
+    # every such response against its response schema (used by the tests)
+    FAST_JSON: bool = os.getenv("FAST_JSON", "1") == "1"
+    FAST_JSON_VALIDATE: bool = os.getenv("FAST_JSON_VALIDATE", "0") == "1"
+
     # CORS
     CORS_ORIGINS: list = [
         "http://localhost:5173",
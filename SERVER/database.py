@@ -1,20 +1,156 @@
-from sqlalchemy import create_engine
+import functools
+import random
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool, StaticPool, SingletonThreadPool
 from config import settings
+import instrumentation
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+POOL_CLASSES = {
+    "queue": QueuePool,
+    "null": NullPool,
+    "static": StaticPool,
+    "singleton": SingletonThreadPool,
+}
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.split("://", 1)[-1] in ("", "/"))
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.close()
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool arguments for create_engine / create_async_engine built from settings."""
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    pool_class = POOL_CLASSES.get(settings.DB_POOL_CLASS)
+    if is_async and pool_class is QueuePool:
+        pool_class = AsyncAdaptedQueuePool
+    if pool_class is not None:
+        options["poolclass"] = pool_class
+    if pool_class in (QueuePool, AsyncAdaptedQueuePool) or (pool_class is None and not _is_sqlite_memory(url)):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    return options
+
+def apply_profile(engine, profile: str = None):
+    if engine.dialect.name == "sqlite" and (profile or settings.DB_PROFILE) == "production":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = None):
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args, **engine_options(url))
+    return apply_profile(engine, profile)
+
+engine = build_engine()
+if settings.METRICS_ENABLED:
+    instrumentation.instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def insert_for(bind):
+    """Dialect-specific insert() supporting ON CONFLICT upserts."""
+    if bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {bind.dialect.name}")
+    return insert
+
+def is_busy_error(exc: OperationalError) -> bool:
+    message = str(exc.orig).lower()
+    return "database is locked" in message or "database is busy" in message
+
+def retry_on_busy(fn):
+    """
+    Re-run a sync write (endpoint or job) when SQLite still reports the database as
+    locked after busy_timeout, e.g. a read transaction that could not be upgraded to a
+    write while another worker process held the lock. Sessions passed to `fn` are
+    rolled back before each retry, so `fn` must not have side effects before commit.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(settings.DB_BUSY_RETRIES + 1):
+            try:
+                return fn(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == settings.DB_BUSY_RETRIES or not is_busy_error(exc):
+                    raise
+                for value in (*args, *kwargs.values()):
+                    if isinstance(value, Session):
+                        value.rollback()
+                time.sleep(min(1.0, 0.02 * 2 ** attempt) * random.uniform(0.5, 1.5))
+    return wrapper
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def warm_connections(engine, count: int):
+    """Open `count` pooled connections up front so the first requests don't pay for connect + pragmas."""
+    connections = []
+    try:
+        for _ in range(count):
+            conn = engine.connect()
+            conn.exec_driver_sql("SELECT 1")
+            connections.append(conn)
+    finally:
+        for conn in connections:
+            conn.close()
+
+async def warm_async_connections(engine, count: int):
+    connections = []
+    try:
+        for _ in range(count):
+            conn = await engine.connect()
+            await conn.exec_driver_sql("SELECT 1")
+            connections.append(conn)
+    finally:
+        for conn in connections:
+            await conn.close()
+
+def to_async_url(url: str) -> str:
+    # Map the sync driver in DATABASE_URL to its asyncio counterpart
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    _async_url = settings.ASYNC_DATABASE_URL or to_async_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(_async_url, **engine_options(_async_url, is_async=True))
+    apply_profile(async_engine.sync_engine)
+    if settings.METRICS_ENABLED:
+        instrumentation.instrument_engine(async_engine.sync_engine)
+    # expire_on_commit=False: attribute access after commit must not trigger implicit IO
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,15 +1,25 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
 from datetime import datetime, timedelta
 from typing import Optional
+import time
+import uuid
 
 from config import settings
-from database import get_db
-import models, schemas
+from database import get_db, get_async_db
+from cache import TTLCache
+import broadcast, models, revocation, schemas
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
+
+# Column snapshots of recently authenticated users, keyed by phone (the token "sub").
+principal_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+# Decoded, signature-checked token claims keyed by the raw token, each kept until the token expires
+token_cache = TTLCache(maxsize=settings.AUTH_TOKEN_CACHE_MAX_SIZE, ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -17,26 +27,85 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti identifies the token for logout; iat orders it against forced sign-outs
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def invalidate_user(phone: str):
+    """Drop a cached principal after the user row has been written, in every worker."""
+    principal_cache.invalidate(phone)
+    if broadcast.notifier.running:
+        broadcast.notifier.publish("auth.invalidate", phone)
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+def _token_data(token: str) -> schemas.TokenData:
+    token_data = token_cache.get(token)
+    if token_data is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            raise _credentials_exception()
         phone: str = payload.get("sub")
         if phone is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(phone=phone)
-    except JWTError:
-        raise credentials_exception
-        
+            raise _credentials_exception()
+        token_data = schemas.TokenData(phone=phone, jti=payload.get("jti"), issued_at=payload.get("iat"), expires_at=payload.get("exp"))
+        token_cache.set(token, token_data, ttl=token_data.expires_at - time.time() if token_data.expires_at else None)
+    # Checked on every request, cached or not, so revocation applies immediately
+    if revocation.index.is_revoked(token_data.jti, token_data.phone, token_data.issued_at):
+        raise _credentials_exception()
+    return token_data
+
+def get_token_data(token: str = Depends(oauth2_scheme)) -> schemas.TokenData:
+    return _token_data(token)
+
+def _snapshot(user: models.User) -> dict:
+    return {attr.key: getattr(user, attr.key) for attr in inspect(models.User).column_attrs}
+
+def _detached(snapshot: dict) -> models.User:
+    # Rebuild the user as a detached, clean instance; merging it with load=False attaches
+    # it to a session without a SELECT, so relationships and updates behave as if queried.
+    user = models.User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+# Plain `def` on purpose: a cache miss does blocking DB I/O, so FastAPI runs this in the
+# threadpool instead of on the event loop. Async routers use get_current_user_async.
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    token_data = _token_data(token)
+
+    cached = principal_cache.get(token_data.phone)
+    if cached is not None:
+        return db.merge(_detached(cached), load=False)
+
     user = db.query(models.User).filter(models.User.phone == token_data.phone).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    principal_cache.set(token_data.phone, _snapshot(user))
+    return user
+
+def get_stream_user(token: Optional[str] = Depends(oauth2_scheme_optional), access_token: Optional[str] = None, db: Session = Depends(get_db)):
+    # EventSource cannot send headers, so push channels also accept ?access_token=
+    if not (token or access_token):
+        raise _credentials_exception()
+    return get_current_user(token or access_token, db)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db=Depends(get_async_db)):
+    token_data = _token_data(token)
+
+    cached = principal_cache.get(token_data.phone)
+    if cached is not None:
+        return await db.merge(_detached(cached), load=False)
+
+    result = await db.execute(select(models.User).where(models.User.phone == token_data.phone))
+    user = result.scalars().first()
+    if user is None:
+        raise _credentials_exception()
+    principal_cache.set(token_data.phone, _snapshot(user))
     return user
@@ -0,0 +1,211 @@
+"""
+Emergency notifications to a user's nominees.
+
+trigger/resolve call enqueue() inside the alert's transaction, which writes one
+notification_outbox row per nominee with a single INSERT ... SELECT; the API never
+waits on a provider. The Dispatcher (DISPATCH_ENABLED=1) runs on the worker's
+event loop: it claims due rows, sends them through a Gateway with a global
+concurrency bound plus a per-provider limit, and records the outcome. Failed sends
+are retried with exponential backoff up to DISPATCH_MAX_ATTEMPTS.
+
+Claiming sets status='sending' with a lease (next_attempt_at); rows whose lease
+ran out, e.g. because the worker died mid-send, are claimed again, so delivery is
+at-least-once and several workers can share the outbox.
+
+Gateways: "log" (LoggingGateway, a local stand-in) or "package.module:Class".
+"""
+import asyncio
+import importlib
+import logging
+import random
+from collections import deque
+from datetime import datetime, timedelta
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import literal, select
+
+from config import settings
+from database import engine as default_engine
+import models
+
+logger = logging.getLogger(__name__)
+
+outbox = models.NotificationOutbox.__table__
+nominees = models.Nominee.__table__
+
+
+class DeliveryError(Exception):
+    """Raised by gateways. Permanent errors (e.g. an invalid number) are not retried."""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class Gateway:
+    """SMS/call provider. send() delivers one message or raises."""
+
+    name = "gateway"
+    concurrency = None  # in-flight sends allowed; None uses DISPATCH_PROVIDER_CONCURRENCY
+
+    async def send(self, channel: str, phone: str, message: str):
+        raise NotImplementedError
+
+
+class LoggingGateway(Gateway):
+    """Local stand-in: logs each message and keeps the most recent ones in `sent`."""
+
+    name = "log"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = deque(maxlen=1000)
+
+    async def send(self, channel: str, phone: str, message: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        logger.info("[%s to %s] %s", channel, phone, message)
+        self.sent.append((channel, phone, message))
+
+
+GATEWAYS = {"log": LoggingGateway}
+
+
+def gateway_from_settings() -> Gateway:
+    name = settings.DISPATCH_GATEWAY
+    if name in GATEWAYS:
+        return GATEWAYS[name]()
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)()
+
+
+def enqueue(db, alert_id: int, user_id: int, message: str, channel: str = "sms") -> int:
+    """Queue `message` for each of the user's nominees in the caller's transaction."""
+    now = datetime.utcnow()
+    rows = select(
+        literal(alert_id), nominees.c.user_id, nominees.c.id, literal(channel), nominees.c.phone,
+        literal(message), literal("pending"), literal(0), literal(now), literal(now),
+    ).where(nominees.c.user_id == user_id)
+    columns = ["alert_id", "user_id", "nominee_id", "channel", "phone", "message", "status", "attempts", "next_attempt_at", "created_at"]
+    return db.execute(outbox.insert().from_select(columns, rows)).rowcount
+
+
+def backoff(attempts: int) -> float:
+    return min(300.0, 2.0 ** attempts) * random.uniform(0.5, 1.0)
+
+
+class Dispatcher:
+    def __init__(self, gateway: Gateway = None, engine=default_engine, concurrency: int = None,
+                 max_attempts: int = None, poll_interval: float = None, send_timeout: float = None):
+        self.gateway = gateway
+        self.engine = engine
+        self.concurrency = concurrency or settings.DISPATCH_CONCURRENCY
+        self.max_attempts = max_attempts or settings.DISPATCH_MAX_ATTEMPTS
+        self.poll_interval = poll_interval if poll_interval is not None else settings.DISPATCH_POLL_MS / 1000
+        self.send_timeout = send_timeout or settings.DISPATCH_SEND_TIMEOUT_SECONDS
+        self.stats = {"sent": 0, "retried": 0, "failed": 0}
+        self._loop = None
+        self._task = None
+        self._inflight = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Start on the running event loop (the app's lifespan)."""
+        if self.running:
+            return
+        self.gateway = self.gateway or gateway_from_settings()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._provider = asyncio.Semaphore(self.gateway.concurrency or settings.DISPATCH_PROVIDER_CONCURRENCY)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            # Unfinished sends keep their lease and are picked up again after it runs out
+            await asyncio.wait(self._inflight, timeout=timeout)
+
+    def wake(self):
+        """Thread-safe nudge after new rows were committed."""
+        if self.running:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def claim(self, limit: int):
+        now = datetime.utcnow()
+        due = select(outbox.c.id).where(
+            outbox.c.status.in_(("pending", "sending")), outbox.c.next_attempt_at <= now
+        ).order_by(outbox.c.id).limit(limit)
+        with self.engine.begin() as conn:
+            return conn.execute(
+                outbox.update()
+                .where(outbox.c.id.in_(due.scalar_subquery()), outbox.c.status.in_(("pending", "sending")), outbox.c.next_attempt_at <= now)
+                .values(status="sending", attempts=outbox.c.attempts + 1, next_attempt_at=now + timedelta(seconds=2 * self.send_timeout))
+                .returning(outbox.c.id, outbox.c.channel, outbox.c.phone, outbox.c.message, outbox.c.attempts)
+            ).all()
+
+    def finish(self, outbox_id: int, values: dict):
+        with self.engine.begin() as conn:
+            conn.execute(outbox.update().where(outbox.c.id == outbox_id, outbox.c.status == "sending").values(**values))
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            free = self.concurrency - len(self._inflight)
+            rows = []
+            if free > 0:
+                try:
+                    rows = await run_in_threadpool(self.claim, free)
+                except Exception:
+                    logger.exception("claiming notifications failed")
+            for row in rows:
+                await self._slots.acquire()
+                task = asyncio.create_task(self._deliver(row))
+                self._inflight.add(task)
+                task.add_done_callback(self._done)
+            if rows and len(rows) == free:
+                continue  # more may be due
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _done(self, task):
+        self._inflight.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("notification delivery crashed", exc_info=task.exception())
+        self._wakeup.set()
+
+    async def _deliver(self, row):
+        now = datetime.utcnow
+        try:
+            async with self._provider:
+                await asyncio.wait_for(self.gateway.send(row.channel, row.phone, row.message), self.send_timeout)
+        except Exception as exc:
+            permanent = isinstance(exc, DeliveryError) and exc.permanent
+            if permanent or row.attempts >= self.max_attempts:
+                self.stats["failed"] += 1
+                values = {"status": "failed", "last_error": repr(exc)}
+                logger.warning("Giving up on notification %s after %d attempts: %r", row.id, row.attempts, exc)
+            else:
+                self.stats["retried"] += 1
+                values = {"status": "pending", "last_error": repr(exc),
+                          "next_attempt_at": now() + timedelta(seconds=backoff(row.attempts))}
+        else:
+            self.stats["sent"] += 1
+            values = {"status": "sent", "sent_at": now(), "last_error": None}
+        await run_in_threadpool(self.finish, row.id, values)
+
+
+dispatcher = Dispatcher()
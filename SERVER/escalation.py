@@ -0,0 +1,200 @@
+"""
+Server-driven emergency escalation (ESCALATION_ENABLED=1).
+
+STAGES is the state machine: an active alert sits in a stage until the client
+moves it forward or the stage's timeout passes, at which point the server moves
+it to `next`. Alerts only ever move forward (see forward_only()), so a late or
+repeated client trigger cannot undo an escalation.
+
+The deadline of the next transition is stored on the alert (escalate_at) and
+each active alert has one timer in a TimerQueue keyed by alert id. Transitions
+are conditional updates (still active, still in the stage the timer was armed
+for), so a timer racing a resolve or a client stage change does nothing; the
+alert is then re-armed from what the row says. At startup the engine reads the
+active alerts once; after that there are no table scans.
+
+With several workers the engine runs in the one holding the scheduler lock, and
+the others reach it through the notifier (arm/cancel messages on CHANNEL).
+"""
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import case, select
+
+from config import settings
+from database import SessionLocal
+from timers import TimerQueue
+import broadcast, changes, dispatch, events, loaders, models
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 5
+CHANNEL = "escalation"
+
+alerts = models.EmergencyAlert.__table__
+
+# timeout: seconds before the server moves the alert on (None: terminal stage)
+# message: sent to the nominees when the server moves an alert into this stage
+Stage = namedtuple("Stage", "rank timeout next message")
+
+STAGES = {
+    "voice_alert": Stage(0, settings.ESCALATION_VOICE_ALERT_SECONDS, "waiting_response", None),
+    "waiting_response": Stage(1, settings.ESCALATION_WAITING_RESPONSE_SECONDS, "notifying_relatives", None),
+    "notifying_relatives": Stage(2, settings.ESCALATION_NOTIFYING_RELATIVES_SECONDS, "calling_ambulance",
+                                 "Lumi: {name} has not responded to their emergency alert. Please check on them now."),
+    # Lumi has no emergency-services integration: the nominees are asked to make the call
+    "calling_ambulance": Stage(3, None, None,
+                               "Lumi: {name} has still not responded to their emergency alert. "
+                               "Please call emergency services or go to them now."),
+}
+
+
+def escalate_at(stage: str, now: datetime):
+    """When an alert entering `stage` at `now` escalates next (None if it never does)."""
+    timeout = STAGES[stage].timeout if stage in STAGES else None
+    return now + timedelta(seconds=timeout) if timeout is not None else None
+
+
+def forward_only(current, proposed):
+    """SQL condition: stage `proposed` ranks above stage `current` (unknown stages rank lowest)."""
+    ranks = {name: stage.rank for name, stage in STAGES.items()}
+    return case(ranks, value=proposed, else_=-1) > case(ranks, value=current, else_=-1)
+
+
+def _timestamp(at: datetime) -> float:
+    return at.replace(tzinfo=timezone.utc).timestamp()
+
+
+class EscalationEngine:
+    def __init__(self, session_factory=SessionLocal, now=datetime.utcnow):
+        self.session_factory = session_factory
+        self.now = now
+        self.timers = TimerQueue(self._fire, name="escalation", max_batch=settings.SCHEDULER_BATCH_SIZE)
+        self.running = False
+        self.stats = {"escalated": 0, "stale": 0, "failed_batches": 0}
+
+    def __len__(self):
+        return len(self.timers)
+
+    def arm(self, alert_id: int, user_id: int, stage: str, at: datetime = None):
+        if at is None:
+            self.timers.cancel(alert_id)
+        else:
+            self.timers.schedule(alert_id, _timestamp(at), (user_id, stage))
+
+    def cancel(self, alert_id: int):
+        self.timers.cancel(alert_id)
+
+    def load(self):
+        """Arm a timer for every active alert that can still escalate."""
+        db = self.session_factory()
+        try:
+            rows = db.execute(
+                select(alerts.c.id, alerts.c.user_id, alerts.c.stage, alerts.c.escalate_at)
+                .where(alerts.c.is_active == True, alerts.c.escalate_at.isnot(None))
+            ).all()
+        finally:
+            db.close()
+        self.timers.schedule_many((row.id, _timestamp(row.escalate_at), (row.user_id, row.stage)) for row in rows)
+        return len(rows)
+
+    def start(self):
+        if self.running:
+            return
+        count = self.load()
+        self.timers.start()
+        self.running = True
+        logger.info("Escalation engine started with %d active alerts", count)
+
+    def stop(self):
+        self.timers.stop()
+        self.running = False
+
+    def _on_message(self, message: dict):
+        # Every worker receives the message; only the one running the engine keeps timers
+        if not self.running:
+            return
+        at = message["escalate_at"]
+        self.arm(message["id"], message["user_id"], message["stage"], datetime.fromisoformat(at) if at else None)
+
+    # --- firing --------------------------------------------------------------
+
+    def _fire(self, batch):
+        try:
+            self.process(batch)
+        except Exception:
+            self.stats["failed_batches"] += 1
+            logger.exception("Escalation batch failed; retrying in %ss", RETRY_SECONDS)
+            retry_at = self.now() + timedelta(seconds=RETRY_SECONDS)
+            for alert_id, (user_id, stage) in batch:
+                if alert_id not in self.timers:
+                    self.arm(alert_id, user_id, stage, retry_at)
+
+    def process(self, batch):
+        """Move each fired (alert_id, (user_id, stage)) alert to its next stage, in one transaction."""
+        now = self.now()
+        advanced, stale, notify = [], [], []
+        db = self.session_factory()
+        try:
+            for alert_id, (user_id, stage) in batch:
+                following = STAGES[stage].next if stage in STAGES else None
+                if following is None:
+                    continue
+                row = db.execute(
+                    alerts.update()
+                    .where(alerts.c.id == alert_id, alerts.c.is_active == True, alerts.c.stage == stage)
+                    .values(stage=following, escalate_at=escalate_at(following, now), **changes.stamp(db, user_id))
+                    .returning(*loaders.ALERT_COLUMNS)
+                ).first()
+                if row is None:
+                    stale.append(alert_id)
+                    continue
+                advanced.append(row)
+                if STAGES[following].message:
+                    notify.append(row)
+            notified = 0
+            if notify:
+                users = models.User.__table__
+                names = dict(db.execute(select(users.c.id, users.c.fullname).where(users.c.id.in_({row.user_id for row in notify}))).all())
+                for row in notify:
+                    notified += dispatch.enqueue(db, row.id, row.user_id, STAGES[row.stage].message.format(name=names.get(row.user_id) or "A Lumi user"))
+            # Resolved or moved on elsewhere: re-arm from what the row says now
+            current = db.execute(
+                select(alerts.c.id, alerts.c.user_id, alerts.c.stage, alerts.c.escalate_at, alerts.c.is_active)
+                .where(alerts.c.id.in_(stale))
+            ).all() if stale else []
+            db.commit()
+        finally:
+            db.close()
+
+        self.stats["escalated"] += len(advanced)
+        self.stats["stale"] += len(stale)
+        for row in advanced:
+            self.arm(row.id, row.user_id, row.stage, row.escalate_at)
+            events.hub.publish(row.user_id, {"type": "alert", "data": row._asdict()})
+        for row in current:
+            if row.is_active and row.escalate_at is not None:
+                self.arm(row.id, row.user_id, row.stage, row.escalate_at)
+        if notified:
+            dispatch.dispatcher.wake()
+
+
+engine = EscalationEngine()
+
+
+def arm(alert_id: int, user_id: int, stage: str, at: datetime = None):
+    """Tell the escalation engine, wherever it runs, about an alert's current stage."""
+    if engine.running:
+        engine.arm(alert_id, user_id, stage, at)
+    if broadcast.notifier.running:
+        broadcast.notifier.publish(CHANNEL, jsonable_encoder({"id": alert_id, "user_id": user_id, "stage": stage, "escalate_at": at}))
+
+
+def cancel(alert_id: int, user_id: int):
+    arm(alert_id, user_id, None, None)
+
+
+def subscribe(notifier):
+    notifier.subscribe(CHANNEL, engine._on_message)
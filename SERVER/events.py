@@ -0,0 +1,96 @@
+"""
+Per-user event fan-out for push channels (e.g. the emergency SSE stream).
+
+Endpoints publish through `hub`; the hub hands events to a Broker, which is
+responsible for delivering them back to every worker's hub. LocalBroker
+delivers in-process; another broker can be plugged in with hub.set_broker()
+so several workers share the same events.
+"""
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+
+from fastapi.encoders import jsonable_encoder
+
+
+class Broker:
+    """Transport interface: publish() must eventually call the deliver callback given to start()."""
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def stop(self):
+        pass
+
+    def publish(self, user_id: int, event: dict):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    def publish(self, user_id: int, event: dict):
+        self._deliver(user_id, event)
+
+
+class EventHub:
+    def __init__(self, broker: Broker = None, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers = {}  # user_id -> set of (loop, queue)
+        self._lock = threading.Lock()
+        self.broker = None
+        self.set_broker(broker or LocalBroker())
+
+    def set_broker(self, broker: Broker):
+        if self.broker is not None:
+            self.broker.stop()
+        self.broker = broker
+        broker.start(self._deliver)
+
+    def publish(self, user_id: int, event: dict):
+        """Thread-safe; callable from sync endpoints running in the threadpool."""
+        self.broker.publish(user_id, jsonable_encoder(event))
+
+    def subscriber_count(self, user_id: int = None) -> int:
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    @contextmanager
+    def subscribe(self, user_id: int):
+        """Register an asyncio.Queue receiving this user's events; must be used on the event loop."""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                subs = self._subscribers.get(user_id)
+                if subs is not None:
+                    subs.discard(entry)
+                    if not subs:
+                        del self._subscribers[user_id]
+
+    def _deliver(self, user_id: int, event: dict):
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subs:
+            try:
+                loop.call_soon_threadsafe(_put_latest, queue, event)
+            except RuntimeError:
+                pass  # subscriber's loop already closed
+
+
+def _put_latest(queue: asyncio.Queue, event: dict):
+    # A slow consumer loses its oldest events rather than blocking publishers
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+hub = EventHub()
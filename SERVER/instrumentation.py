@@ -0,0 +1,239 @@
+"""
+Opt-in request instrumentation (METRICS_ENABLED=1).
+
+- InstrumentationMiddleware (pure ASGI) times every request per route and adds
+  a Server-Timing header (total time, DB time, statement count).
+- SQLAlchemy cursor hooks on the app engines count statements and accumulate
+  DB time for the request that issued them (tracked via a contextvar, which
+  Starlette copies into the threadpool for sync endpoints).
+- `registry` renders everything in Prometheus text format for GET /metrics;
+  other modules can add gauges with registry.register_collector().
+- With PROFILE_SLOW_REQUEST_MS set, a stack sampler runs while any request is
+  slower than that threshold and keeps the collapsed stacks of recent slow
+  requests for GET /metrics/slow.
+"""
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time", "started")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.started = time.perf_counter()
+
+
+_current = ContextVar("lumi_request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(Histogram)  # (method, route) -> Histogram
+        self.requests = Counter()  # (method, route, status)
+        self.db_statements = Counter()  # route
+        self.db_seconds = Counter()  # route
+        self._collectors = []
+
+    def register_collector(self, collector):
+        """collector() returns an iterable of (name, type, help, [(labels dict, value), ...])."""
+        self._collectors.append(collector)
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            self.durations[(method, route)].observe(seconds)
+            self.requests[(method, route, status)] += 1
+            self.db_statements[route] += stats.statements
+            self.db_seconds[route] += stats.db_time
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            lines += ["# HELP lumi_request_duration_seconds Request latency per route.",
+                      "# TYPE lumi_request_duration_seconds histogram"]
+            for (method, route), hist in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), hist.counts):
+                    cumulative += count
+                    lines.append(f"lumi_request_duration_seconds_bucket{{{_labels(method=method, route=route, le=bound)}}} {cumulative}")
+                lines.append(f"lumi_request_duration_seconds_sum{{{_labels(method=method, route=route)}}} {hist.total:.6f}")
+                lines.append(f"lumi_request_duration_seconds_count{{{_labels(method=method, route=route)}}} {cumulative}")
+
+            lines += ["# HELP lumi_requests_total Requests per route and status.", "# TYPE lumi_requests_total counter"]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"lumi_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+
+            lines += ["# HELP lumi_db_statements_total SQL statements issued per route.", "# TYPE lumi_db_statements_total counter"]
+            for route, count in sorted(self.db_statements.items()):
+                lines.append(f"lumi_db_statements_total{{{_labels(route=route)}}} {count}")
+
+            lines += ["# HELP lumi_db_seconds_total Time spent in SQL per route.", "# TYPE lumi_db_seconds_total counter"]
+            for route, seconds in sorted(self.db_seconds.items()):
+                lines.append(f"lumi_db_seconds_total{{{_labels(route=route)}}} {seconds:.6f}")
+
+        for collector in self._collectors:
+            try:
+                for name, kind, help_text, samples in collector():
+                    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                    for labels, value in samples:
+                        lines.append(f"{name}{{{_labels(**labels)}}} {value}" if labels else f"{name} {value}")
+            except Exception:
+                logger.exception("metrics collector failed")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# --- SQL hooks -------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("lumi_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["lumi_query_start"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start time so the
+    # stack on this (pooled) connection stays paired with the next statement
+    conn = context.connection
+    if conn is None or not conn.info.get("lumi_query_start"):
+        return
+    _after_cursor_execute(conn, None, context.statement, context.parameters, context.execution_context, False)
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# --- slow request sampler --------------------------------------------------
+
+class SlowRequestSampler:
+    """Samples all thread stacks while a request runs past `threshold` seconds."""
+
+    def __init__(self, threshold: float, interval: float = 0.005, keep: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.reports = deque(maxlen=keep)
+        self._inflight = {}  # token -> [started, Counter of collapsed stacks]
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="slow-request-sampler", daemon=True)
+        self._thread.start()
+
+    def begin(self, token, started: float):
+        with self._lock:
+            self._inflight[token] = [started, Counter()]
+
+    def end(self, token, method: str, route: str, seconds: float, stats: RequestStats):
+        with self._lock:
+            _, stacks = self._inflight.pop(token, (None, Counter()))
+        if seconds < self.threshold:
+            return
+        report = {
+            "method": method,
+            "route": route,
+            "duration_ms": round(seconds * 1000, 1),
+            "db_statements": stats.statements,
+            "db_ms": round(stats.db_time * 1000, 1),
+            "stacks": [{"stack": stack, "samples": count} for stack, count in stacks.most_common(10)],
+        }
+        self.reports.append(report)
+        logger.warning("Slow request %s %s took %.0fms (%d SQL statements, %.0fms in DB)",
+                       method, route, report["duration_ms"], stats.statements, report["db_ms"])
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                slow = [stacks for started, stacks in self._inflight.values() if now - started >= self.threshold]
+            if not slow:
+                continue
+            collapsed = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None and len(names) < 40:
+                    names.append(f"{frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                collapsed.append(";".join(reversed(names)))
+            for stacks in slow:
+                stacks.update(collapsed)
+
+
+# --- ASGI middleware -------------------------------------------------------
+
+class InstrumentationMiddleware:
+    def __init__(self, app, server_timing: bool = True, sampler: SlowRequestSampler = None):
+        self.app = app
+        self.server_timing = server_timing
+        self.sampler = sampler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status_code = 500
+        if self.sampler is not None:
+            self.sampler.begin(id(stats), stats.started)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    total_ms = (time.perf_counter() - stats.started) * 1000
+                    value = f'app;dur={total_ms:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries"'
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            seconds = time.perf_counter() - stats.started
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            registry.observe(scope["method"], route_path, status_code, seconds, stats)
+            if self.sampler is not None:
+                self.sampler.end(id(stats), scope["method"], route_path, seconds, stats)
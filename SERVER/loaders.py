@@ -0,0 +1,47 @@
+from sqlalchemy.orm import Session, selectinload, joinedload
+from config import settings
+import models
+
+# Column projections matching the response schemas, so listings can be served as plain
+# row tuples without building ORM objects or touching lazy relationships.
+MEDICATION_COLUMNS = (
+    models.Medication.id, models.Medication.user_id, models.Medication.name, models.Medication.dosage,
+    models.Medication.scheduled_time, models.Medication.start_date, models.Medication.end_date,
+)
+LOG_COLUMNS = (
+    models.MedicationLog.id, models.MedicationLog.medication_id, models.MedicationLog.user_id,
+    models.MedicationLog.status, models.MedicationLog.taken_at, models.MedicationLog.date,
+)
+NOMINEE_COLUMNS = (
+    models.Nominee.id, models.Nominee.user_id, models.Nominee.name, models.Nominee.relationship, models.Nominee.phone,
+)
+ALERT_COLUMNS = (
+    models.EmergencyAlert.id, models.EmergencyAlert.user_id, models.EmergencyAlert.stage, models.EmergencyAlert.is_active,
+    models.EmergencyAlert.created_at, models.EmergencyAlert.resolved_at, models.EmergencyAlert.escalate_at,
+)
+
+LOADERS = {
+    "selectin": selectinload,
+    "joined": joinedload,
+}
+
+def strategy_for(endpoint: str) -> str:
+    """Loader strategy configured for an endpoint: "projection" (default), "selectin" or "joined"."""
+    return settings.LOADER_STRATEGIES.get(endpoint, "projection")
+
+def load_user_children(db: Session, user: models.User, relationship: str, columns, endpoint: str):
+    """
+    Load one of the User's one-to-many collections using the endpoint's strategy.
+    "projection" selects only `columns`; the relationship strategies load the ORM
+    collection eagerly in a fixed number of statements instead of lazily.
+    """
+    strategy = strategy_for(endpoint)
+    attr = getattr(models.User, relationship)
+    if strategy in LOADERS:
+        owner = db.query(models.User).options(LOADERS[strategy](attr)).filter(
+            models.User.id == user.id
+        ).populate_existing().one()
+        return getattr(owner, relationship)
+
+    model = attr.property.mapper.class_
+    return db.query(*columns).filter(model.user_id == user.id).order_by(model.id).all()
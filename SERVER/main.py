@@ -1,17 +1,95 @@
+from contextlib import asynccontextmanager
+import logging
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from config import settings
-from database import engine, Base
-from routers import auth, users, nominees, medications, emergency
+import database
+from routers import auth, users, nominees, medications, emergency, dashboard, sync
+import admission, broadcast, dependencies, dispatch, escalation, events, instrumentation, migrations, response_cache, revocation, scheduling, serialization, writebehind
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+def _scheduler_lock():
+    """With several workers, the one holding SCHEDULER_LOCK_FILE runs the dose scheduler."""
+    if not settings.SCHEDULER_LOCK_FILE:
+        return True
+    import fcntl
+    handle = open(settings.SCHEDULER_LOCK_FILE, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    app.state.scheduler_lock = handle  # held until the process exits
+    return True
+
+def _schema_pending():
+    with database.engine.connect() as conn:
+        return migrations.pending(conn)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # No DDL at import time: the schema is migrated once per deploy (python migrations.py),
+    # so a new worker only checks the version, warms its pool and starts serving.
+    app.state.ready = False
+    app.state.not_ready_reason = "starting"
+    if settings.AUTO_MIGRATE:
+        await run_in_threadpool(migrations.upgrade, database.engine)
+    pending = await run_in_threadpool(_schema_pending)
+    if pending:
+        app.state.not_ready_reason = f"pending migrations {pending}; run python migrations.py"
+        logger.error("Database schema is behind: %s", app.state.not_ready_reason)
+    else:
+        if settings.ADMISSION_ENABLED:
+            admission.configure_threadpool()
+        await run_in_threadpool(revocation.load, database.engine)
+        await run_in_threadpool(response_cache.configure)
+        await run_in_threadpool(database.warm_connections, database.engine, settings.DB_WARM_CONNECTIONS)
+        if database.async_engine is not None:
+            await database.warm_async_connections(database.async_engine, settings.DB_WARM_CONNECTIONS)
+        if settings.BROADCAST_BACKEND == "sqlite":
+            # Share SSE events and principal cache invalidation with the other workers
+            broadcast.notifier.subscribe("auth.invalidate", dependencies.principal_cache.invalidate)
+            revocation.subscribe(broadcast.notifier)
+            response_cache.subscribe(broadcast.notifier)
+            scheduling.subscribe(broadcast.notifier)
+            escalation.subscribe(broadcast.notifier)
+            events.hub.set_broker(broadcast.NotifierBroker(broadcast.notifier))
+            await run_in_threadpool(broadcast.notifier.start)
+        if settings.LOG_WRITE_BEHIND:
+            # Replays journals of crashed workers before accepting new writes
+            await run_in_threadpool(writebehind.buffer.start)
+        if settings.DISPATCH_ENABLED:
+            dispatch.dispatcher.start()
+        # Timer-driven engines run in one worker only
+        timer_owner = (settings.SCHEDULER_ENABLED or settings.ESCALATION_ENABLED) and _scheduler_lock()
+        if settings.SCHEDULER_ENABLED and timer_owner:
+            await run_in_threadpool(scheduling.scheduler.start)
+        if settings.ESCALATION_ENABLED and timer_owner:
+            await run_in_threadpool(escalation.engine.start)
+        app.state.ready = True
+        app.state.not_ready_reason = None
+    yield
+    app.state.ready = False
+    await dispatch.dispatcher.stop()
+    await run_in_threadpool(writebehind.buffer.stop)
+    scheduling.scheduler.stop()
+    escalation.engine.stop()
+    broadcast.notifier.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    version=settings.PROJECT_VERSION
+    version=settings.PROJECT_VERSION,
+    default_response_class=serialization.FastJSONResponse,
+    lifespan=lifespan
 )
 
+if settings.ADMISSION_ENABLED:
+    # Inside CORS, so 429/503 answers still carry the CORS headers
+    app.add_middleware(admission.AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -19,14 +97,73 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"
     ],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing", "Idempotent-Replayed", "Retry-After"],
 )
 
+if settings.METRICS_ENABLED:
+    sampler = None
+    if settings.PROFILE_SLOW_REQUEST_MS > 0:
+        sampler = instrumentation.SlowRequestSampler(settings.PROFILE_SLOW_REQUEST_MS / 1000)
+    app.add_middleware(instrumentation.InstrumentationMiddleware, server_timing=settings.SERVER_TIMING, sampler=sampler)
+
+    def _runtime_metrics():
+        cache = dependencies.principal_cache.stats()
+        yield "lumi_auth_cache_events_total", "counter", "Principal cache lookups and evictions.", [
+            ({"event": key}, value) for key, value in cache.items() if key in ("hits", "misses", "evictions")
+        ]
+        yield "lumi_event_subscribers", "gauge", "Open SSE subscriptions.", [({}, events.hub.subscriber_count())]
+        yield "lumi_scheduled_timers", "gauge", "Pending dose timers.", [({}, len(scheduling.scheduler))]
+        yield "lumi_escalation_timers", "gauge", "Active alerts waiting to escalate.", [({}, len(escalation.engine))]
+
+    instrumentation.registry.register_collector(_runtime_metrics)
+    if settings.ADMISSION_ENABLED:
+        instrumentation.registry.register_collector(admission.controller.metrics)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def read_metrics():
+        return PlainTextResponse(instrumentation.registry.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/metrics/slow", include_in_schema=False)
+    def read_slow_requests():
+        return list(sampler.reports) if sampler else []
+
+    @app.get("/stats", include_in_schema=False)
+    def read_stats():
+        return {
+            "auth_cache": dependencies.principal_cache.stats(),
+            "token_cache": dependencies.token_cache.stats(),
+            "revocations": len(revocation.index),
+            "log_write_behind": writebehind.buffer.stats,
+            "dispatch": dispatch.dispatcher.stats,
+            "response_cache": response_cache.stats,
+            "admission": admission.controller.stats(),
+            "escalation": {**escalation.engine.stats, "armed": len(escalation.engine)},
+        }
+
+if settings.DB_ASYNC:
+    # Async read/polling endpoints are registered first so they take precedence over the
+    # sync routes with the same path; writes keep using the sync routers below.
+    from routers.aio import users as aio_users, nominees as aio_nominees, medications as aio_medications, emergency as aio_emergency
+    app.include_router(aio_users.router)
+    app.include_router(aio_nominees.router)
+    app.include_router(aio_medications.router)
+    app.include_router(aio_emergency.router)
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(nominees.router)
 app.include_router(medications.router)
 app.include_router(emergency.router)
+app.include_router(dashboard.router)
+app.include_router(sync.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Lumi API"}
+
+@app.get("/ready", include_in_schema=False)
+def read_ready():
+    """Readiness probe: 200 once the schema is current and the connection pool is warm."""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse({"ready": False, "reason": getattr(app.state, "not_ready_reason", "starting")}, status_code=503)
+    return {"ready": True, "schema_version": migrations.latest_version()}
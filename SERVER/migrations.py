@@ -0,0 +1,140 @@
+"""
+Schema migrations for existing databases.
+
+Base.metadata.create_all only creates missing tables; it never adds indexes,
+constraints or columns to tables that already exist (e.g. an older lumi.db).
+Each migration below runs once and is recorded in the schema_migrations table.
+"""
+from datetime import datetime
+from sqlalchemy import bindparam, inspect, text
+from database import engine as default_engine, Base
+import models, adherence, escalation, schedule_times
+
+MIGRATIONS = []
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+def _create_indexes(conn, table, names=None):
+    for index in table.indexes:
+        if names is None or index.name in names:
+            index.create(conn, checkfirst=True)
+
+@migration(1, "composite indexes for per-user/per-date access and unique (medication_id, date) logs")
+def _composite_indexes(conn):
+    # The old check-then-insert path could leave duplicate logs behind; keep the newest
+    # one per (medication_id, date) so the unique index can be built.
+    conn.exec_driver_sql(
+        "DELETE FROM medication_logs WHERE id NOT IN "
+        "(SELECT MAX(id) FROM medication_logs GROUP BY medication_id, date)"
+    )
+    _create_indexes(conn, models.MedicationLog.__table__, {"ix_medication_logs_user_date", "uq_medication_logs_medication_date"})
+    _create_indexes(conn, models.EmergencyAlert.__table__, {"ix_emergency_alerts_user_active_created"})
+
+@migration(2, "backfill adherence rollups from existing medication logs")
+def _adherence_rollups(conn):
+    adherence.rebuild(conn)
+
+@migration(3, "normalized medications.schedule_minutes")
+def _schedule_minutes(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("medications")}
+    if "schedule_minutes" not in columns:
+        conn.exec_driver_sql("ALTER TABLE medications ADD COLUMN schedule_minutes INTEGER")
+    meds = models.Medication.__table__
+    rows = conn.execute(meds.select().with_only_columns(meds.c.id, meds.c.scheduled_time)).all()
+    updates = [{"med_id": row.id, "minutes": schedule_times.parse_scheduled_time(row.scheduled_time)} for row in rows]
+    if updates:
+        conn.execute(
+            meds.update().where(meds.c.id == bindparam("med_id")).values(schedule_minutes=bindparam("minutes")),
+            updates
+        )
+
+@migration(4, "notifications table for cross-worker broadcast")
+def _notifications(conn):
+    models.Notification.__table__.create(conn, checkfirst=True)
+
+@migration(5, "one active emergency alert per user; idempotency keys")
+def _single_active_alert(conn):
+    # Concurrent triggers could leave several active alerts; keep the newest per user
+    conn.execute(
+        text(
+            "UPDATE emergency_alerts SET is_active = :inactive, resolved_at = :now "
+            "WHERE is_active = :active AND id NOT IN "
+            "(SELECT MAX(id) FROM emergency_alerts WHERE is_active = :active GROUP BY user_id)"
+        ),
+        {"active": True, "inactive": False, "now": datetime.utcnow()},
+    )
+    _create_indexes(conn, models.EmergencyAlert.__table__, {"uq_emergency_alerts_user_active"})
+    models.IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+@migration(6, "token revocations")
+def _token_revocations(conn):
+    models.TokenRevocation.__table__.create(conn, checkfirst=True)
+
+@migration(7, "nominee notification outbox")
+def _notification_outbox(conn):
+    models.NotificationOutbox.__table__.create(conn, checkfirst=True)
+
+@migration(8, "row versions, updated_at and tombstones for delta sync")
+def _change_tracking(conn):
+    for model in (models.Nominee, models.Medication, models.MedicationLog, models.EmergencyAlert):
+        table = model.__table__
+        columns = {c["name"] for c in inspect(conn).get_columns(table.name)}
+        if "row_version" not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+        if "updated_at" not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN updated_at DATETIME")
+        _create_indexes(conn, table, {f"ix_{table.name}_user_version"})
+    models.SyncVersion.__table__.create(conn, checkfirst=True)
+    models.SyncTombstone.__table__.create(conn, checkfirst=True)
+
+@migration(9, "emergency_alerts.escalate_at for server-side escalation")
+def _escalate_at(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("emergency_alerts")}
+    if "escalate_at" not in columns:
+        conn.exec_driver_sql("ALTER TABLE emergency_alerts ADD COLUMN escalate_at DATETIME")
+    # Alerts already active escalate on the schedule they would have had from when they were raised
+    alerts = models.EmergencyAlert.__table__
+    rows = conn.execute(alerts.select().with_only_columns(alerts.c.id, alerts.c.stage, alerts.c.created_at).where(
+        alerts.c.is_active == True
+    )).all()
+    updates = [{"alert_id": row.id, "at": escalation.escalate_at(row.stage, row.created_at or datetime.utcnow())} for row in rows]
+    if updates:
+        conn.execute(
+            alerts.update().where(alerts.c.id == bindparam("alert_id")).values(escalate_at=bindparam("at")),
+            updates
+        )
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table(models.SchemaMigration.__tablename__):
+        return 0
+    version = conn.exec_driver_sql("SELECT MAX(version) FROM schema_migrations").scalar()
+    return version or 0
+
+def latest_version() -> int:
+    return max(version for version, _, _ in MIGRATIONS)
+
+def pending(conn) -> list:
+    current = current_version(conn)
+    return sorted(version for version, _, _ in MIGRATIONS if version > current)
+
+def upgrade(engine=default_engine):
+    """Create missing tables, then apply pending migrations in order."""
+    Base.metadata.create_all(bind=engine)
+    applied = []
+    with engine.begin() as conn:
+        current = current_version(conn)
+        for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version <= current:
+                continue
+            fn(conn)
+            conn.execute(models.SchemaMigration.__table__.insert().values(version=version, description=description))
+            applied.append(version)
+    return applied
+
+if __name__ == "__main__":
+    applied = upgrade()
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, Index
 from sqlalchemy.orm import relationship as sqlalchemy_relationship
 from database import Base
 import datetime
@@ -28,9 +28,16 @@ class Nominee(Base):
     name = Column(String)
     relationship = Column(String)
     phone = Column(String)
-    
+    # Change tracking for GET /sync (see changes.py)
+    row_version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
     user = sqlalchemy_relationship("User", back_populates="nominees")
 
+    __table_args__ = (
+        Index("ix_nominees_user_version", "user_id", "row_version"),
+    )
+
 class Medication(Base):
     __tablename__ = "medications"
 
@@ -39,12 +46,20 @@ class Medication(Base):
     name = Column(String)
     dosage = Column(String)
     scheduled_time = Column(String) # For simplicity, storing as string "HH:MM"
+    schedule_minutes = Column(Integer, nullable=True) # scheduled_time normalized to minutes after midnight
     start_date = Column(Date)
     end_date = Column(Date, nullable=True)
-    
+    # Change tracking for GET /sync (see changes.py)
+    row_version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
     user = sqlalchemy_relationship("User", back_populates="medications")
     logs = sqlalchemy_relationship("MedicationLog", back_populates="medication")
 
+    __table_args__ = (
+        Index("ix_medications_user_version", "user_id", "row_version"),
+    )
+
 class MedicationLog(Base):
     __tablename__ = "medication_logs"
 
@@ -54,10 +69,20 @@ class MedicationLog(Base):
     taken_at = Column(DateTime, nullable=True)
     status = Column(String) # 'taken', 'missed', 'pending'
     date = Column(Date) # The schedule date this log corresponds to
-    
+    # Change tracking for GET /sync (see changes.py)
+    row_version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
     medication = sqlalchemy_relationship("Medication", back_populates="logs")
     user = sqlalchemy_relationship("User", back_populates="medication_logs")
 
+    __table_args__ = (
+        Index("ix_medication_logs_user_date", "user_id", "date"),
+        # One log per medication per schedule date; also the target of the log upsert
+        Index("uq_medication_logs_medication_date", "medication_id", "date", unique=True),
+        Index("ix_medication_logs_user_version", "user_id", "row_version"),
+    )
+
 class EmergencyAlert(Base):
     __tablename__ = "emergency_alerts"
 
@@ -67,5 +92,118 @@ class EmergencyAlert(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     resolved_at = Column(DateTime, nullable=True)
-    
+    # When the server moves the alert to its next stage (escalation.py); NULL when it won't
+    escalate_at = Column(DateTime, nullable=True)
+    # Change tracking for GET /sync (see changes.py)
+    row_version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
     user = sqlalchemy_relationship("User", back_populates="emergency_alerts")
+
+    __table_args__ = (
+        Index("ix_emergency_alerts_user_active_created", "user_id", "is_active", "created_at"),
+        # At most one active alert per user; trigger upserts against this partial index
+        Index("uq_emergency_alerts_user_active", "user_id", unique=True,
+              sqlite_where=is_active == True, postgresql_where=is_active == True),
+        Index("ix_emergency_alerts_user_version", "user_id", "row_version"),
+    )
+
+class AdherenceRollup(Base):
+    """Per-medication adherence counters for one day or one (Monday-based) week."""
+    __tablename__ = "adherence_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    medication_id = Column(Integer, ForeignKey("medications.id"))
+    period = Column(String) # 'day' or 'week'
+    period_start = Column(Date)
+    taken = Column(Integer, default=0)
+    missed = Column(Integer, default=0)
+    pending = Column(Integer, default=0)
+    delay_minutes_total = Column(Integer, default=0) # taken_at minus scheduled time, summed
+    delay_samples = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("uq_adherence_rollups_medication_period", "medication_id", "period", "period_start", unique=True),
+        Index("ix_adherence_rollups_user_period", "user_id", "period", "period_start"),
+    )
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String)
+    applied_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class Notification(Base):
+    """Cross-worker messages (event fan-out, cache invalidation); see broadcast.py."""
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True)
+    channel = Column(String, nullable=False)
+    payload = Column(String, nullable=False)  # JSON
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class IdempotencyKey(Base):
+    """Responses of keyed requests (Idempotency-Key header), replayed for retries of the same key."""
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    response = Column(String)  # JSON body of the first response
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class TokenRevocation(Base):
+    """Logged-out tokens (jti) and forced sign-outs (subject: tokens issued up to revoked_at)."""
+    __tablename__ = "token_revocations"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, nullable=True, unique=True)
+    subject = Column(String, nullable=True, index=True)
+    revoked_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class NotificationOutbox(Base):
+    """Messages to a user's nominees, written with the alert change and sent by dispatch.py."""
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True)
+    alert_id = Column(Integer, ForeignKey("emergency_alerts.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    nominee_id = Column(Integer, ForeignKey("nominees.id"))
+    channel = Column(String, nullable=False)  # 'sms'
+    phone = Column(String, nullable=False)
+    message = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # 'pending', 'sending', 'sent', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    # When a pending row is due, or when the lease of a 'sending' row runs out
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_notification_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class SyncVersion(Base):
+    """Per-user change counter; each tracked write transaction takes the next value."""
+    __tablename__ = "sync_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class SyncTombstone(Base):
+    """Deleted rows, reported by GET /sync until clients have caught up."""
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    entity = Column(String, nullable=False)  # 'nominee', ...
+    entity_id = Column(Integer, nullable=False)
+    row_version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_sync_tombstones_user_version", "user_id", "row_version"),
+    )
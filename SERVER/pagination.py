@@ -0,0 +1,38 @@
+"""Keyset pagination over medication logs, ordered by (date, id)."""
+import base64
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+import models
+
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+def encode_cursor(log_date: date, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{log_date.isoformat()}|{log_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw_date, raw_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(raw_date), int(raw_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def log_range(statement, user_id: int, start_date: date, end_date: date, cursor: str = None):
+    """Filter a select()/Query to one user's logs in [start_date, end_date], after `cursor`, in (date, id) order."""
+    statement = statement.filter(
+        models.MedicationLog.user_id == user_id,
+        models.MedicationLog.date >= start_date,
+        models.MedicationLog.date <= end_date
+    )
+    if cursor:
+        statement = statement.filter(
+            tuple_(models.MedicationLog.date, models.MedicationLog.id) > tuple_(*decode_cursor(cursor))
+        )
+    return statement.order_by(models.MedicationLog.date, models.MedicationLog.id)
+
+def check_limit(limit):
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
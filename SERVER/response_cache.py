@@ -0,0 +1,241 @@
+"""
+Read-through cache for per-user responses that change rarely (/users/me,
+/nominees/, /medications/).
+
+Entries are keyed by (user_id, version, endpoint) and hold the encoded JSON body, so
+a hit skips both the queries and serialization. Writes call bump(user_id) after
+committing, which moves the user to a new version; entries of older versions are
+never read again and age out of the LRU. The version is read before the data is
+queried, so a response built concurrently with a write is stored under the old
+version and cannot be served afterwards.
+
+Backends (RESPONSE_CACHE):
+- "memory": per-process LRU bounded by RESPONSE_CACHE_MAX_BYTES. With the SQLite
+  broadcast channel enabled, bumps are forwarded to the other workers.
+- "sqlite": a separate SQLite file (RESPONSE_CACHE_PATH) shared by every worker on
+  the host, holding the version counters and the entries. The file outlives the
+  processes but only knows about writes made through the routers, so serve.py
+  deletes it (clear()) before starting the workers; a recreated or restored
+  lumi.db never meets cached bodies of the old one.
+- "off": no caching.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from sqlalchemy import Column, Integer, LargeBinary, Float, MetaData, String, Table, delete, func, select
+
+from config import settings
+import broadcast, serialization
+
+CHANNEL = "cache.bump"
+
+
+class CacheBackend:
+    def get_version(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    def bump(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, body: bytes):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Versions come from one counter shared by all users, and at most max_users of
+    them are kept. Users without one read `_base`, which an eviction raises above
+    every version handed out so far: an evicted user cannot fall back to a version
+    that still has entries.
+    """
+
+    def __init__(self, max_bytes: int, max_users: int = None):
+        self.max_bytes = max_bytes
+        self.max_users = max_users or settings.RESPONSE_CACHE_MAX_USERS
+        self.size = 0
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+        self._counter = 0
+        self._base = 0
+        self._lock = threading.Lock()
+
+    def get_version(self, user_id: int) -> int:
+        return self._versions.get(user_id, self._base)
+
+    def bump(self, user_id: int) -> int:
+        with self._lock:
+            self._counter += 1
+            self._versions[user_id] = version = self._counter
+            self._versions.move_to_end(user_id)
+            if len(self._versions) > self.max_users:
+                self._versions.popitem(last=False)
+                self._counter += 1
+                self._base = self._counter
+            return version
+
+    def get(self, key: str):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class SQLiteBackend(CacheBackend):
+    """Shared by the workers on one host. Eviction is oldest-stored-first once over max_bytes."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, max_bytes: int):
+        from database import build_engine
+        self.max_bytes = max_bytes
+        self.engine = build_engine(f"sqlite:///{path}")
+        metadata = MetaData()
+        self.versions = Table("cache_versions", metadata,
+                              Column("user_id", Integer, primary_key=True), Column("version", Integer, nullable=False))
+        self.entries = Table("cache_entries", metadata,
+                             Column("key", String, primary_key=True), Column("body", LargeBinary, nullable=False),
+                             Column("size", Integer, nullable=False), Column("stored_at", Float, nullable=False, index=True))
+        metadata.create_all(self.engine)
+        self._sets = 0
+
+    def get_version(self, user_id: int) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(self.versions.c.version).where(self.versions.c.user_id == user_id)).scalar() or 0
+
+    def bump(self, user_id: int) -> int:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(self.versions).values(user_id=user_id, version=1)
+        stmt = stmt.on_conflict_do_update(index_elements=[self.versions.c.user_id], set_={"version": self.versions.c.version + 1})
+        with self.engine.begin() as conn:
+            return conn.execute(stmt.returning(self.versions.c.version)).scalar()
+
+    def get(self, key: str):
+        with self.engine.connect() as conn:
+            return conn.execute(select(self.entries.c.body).where(self.entries.c.key == key)).scalar()
+
+    def set(self, key: str, body: bytes):
+        from sqlalchemy.dialects.sqlite import insert
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.entries).values(key=key, body=body, size=len(body), stored_at=time.time()).on_conflict_do_nothing())
+        self._sets += 1
+        if self._sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        with self.engine.begin() as conn:
+            total = conn.execute(select(func.coalesce(func.sum(self.entries.c.size), 0))).scalar()
+            if total <= self.max_bytes:
+                return
+            # Drop the oldest entries holding the excess bytes
+            running = select(
+                self.entries.c.key, self.entries.c.size,
+                func.sum(self.entries.c.size).over(order_by=self.entries.c.stored_at).label("upto")
+            ).subquery()
+            conn.execute(delete(self.entries).where(self.entries.c.key.in_(
+                select(running.c.key).where(running.c.upto - running.c.size < total - self.max_bytes)
+            )))
+
+
+backend = None
+stats = {"hits": 0, "misses": 0}
+
+
+def configure(kind: str = None):
+    """Create the backend selected by RESPONSE_CACHE (called from the app lifespan)."""
+    global backend
+    kind = kind or settings.RESPONSE_CACHE
+    if kind == "memory":
+        backend = MemoryBackend(settings.RESPONSE_CACHE_MAX_BYTES)
+    elif kind == "sqlite":
+        backend = SQLiteBackend(settings.RESPONSE_CACHE_PATH, settings.RESPONSE_CACHE_MAX_BYTES)
+    elif kind == "off":
+        backend = None
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE backend {kind!r}")
+    return backend
+
+
+def clear(path: str = None):
+    """Delete the SQLite backend's file; only while no worker has it open."""
+    path = path or settings.RESPONSE_CACHE_PATH
+    for name in (path, path + "-wal", path + "-shm"):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def subscribe(notifier):
+    # Another worker's bump: any change of the local version invalidates this worker's entries
+    notifier.subscribe(CHANNEL, lambda user_id: isinstance(backend, MemoryBackend) and backend.bump(user_id))
+
+
+def _lookup(user_id: int, endpoint: str):
+    key = f"{user_id}:{backend.get_version(user_id)}:{endpoint}"
+    body = backend.get(key)
+    stats["hits" if body is not None else "misses"] += 1
+    return key, body
+
+
+def _respond(key: str, body: bytes, state: str):
+    if state == "miss":
+        backend.set(key, body)
+    return Response(body, media_type="application/json", headers={"X-Cache": state})
+
+
+def cached_response(user_id: int, endpoint: str, schema, build):
+    """Serve `endpoint` for the user from the cache, or encode build()'s content and store it."""
+    if backend is None:
+        return serialization.respond(build(), schema)
+    key, body = _lookup(user_id, endpoint)
+    if body is not None:
+        return _respond(key, body, "hit")
+    return _respond(key, serialization.encode(build(), schema), "miss")
+
+
+async def cached_response_async(user_id: int, endpoint: str, schema, build):
+    """cached_response() for async routers; `build` is a coroutine function."""
+    if backend is None:
+        return serialization.respond(await build(), schema)
+    if not isinstance(backend, SQLiteBackend):
+        key, body = _lookup(user_id, endpoint)
+        if body is not None:
+            return _respond(key, body, "hit")
+        return _respond(key, serialization.encode(await build(), schema), "miss")
+    # The SQLite backend does blocking file I/O: keep it off the event loop
+    key, body = await run_in_threadpool(_lookup, user_id, endpoint)
+    if body is not None:
+        return _respond(key, body, "hit")
+    body = serialization.encode(await build(), schema)
+    await run_in_threadpool(backend.set, key, body)
+    return Response(body, media_type="application/json", headers={"X-Cache": "miss"})
+
+
+def bump(user_id: int):
+    """Invalidate the user's cached responses; call after the write has committed."""
+    if backend is None:
+        return
+    backend.bump(user_id)
+    if isinstance(backend, MemoryBackend) and broadcast.notifier.running:
+        broadcast.notifier.publish(CHANNEL, user_id)
@@ -0,0 +1,115 @@
+"""
+Token revocation: logout of a single token (by its `jti` claim) and forced sign-out
+of every token issued to a user before a point in time.
+
+Revocations are rows in token_revocations and are mirrored in `index`, an in-memory
+set/dict checked on every authenticated request. Each worker loads the index from
+the table at startup; with BROADCAST_BACKEND=sqlite new revocations also reach the
+other workers through the notifier. Rows are kept until the tokens they cover have
+expired anyway.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_
+
+from config import settings
+import broadcast, models
+
+revocations = models.TokenRevocation.__table__
+
+CHANNEL = "auth.revoke"
+
+
+class RevocationIndex:
+    def __init__(self):
+        self._jtis = {}  # jti -> expiry (epoch seconds)
+        self._subjects = {}  # subject -> tokens issued at or before this (epoch seconds) are revoked
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jtis) + len(self._subjects)
+
+    def add(self, jti: str = None, subject: str = None, revoked_at: float = None, expires_at: float = None):
+        with self._lock:
+            if jti:
+                self._jtis[jti] = expires_at
+            if subject:
+                self._subjects[subject] = max(revoked_at, self._subjects.get(subject, 0))
+
+    def is_revoked(self, jti: str, subject: str, issued_at: float) -> bool:
+        # Plain dict lookups; no lock needed for reads under the GIL
+        if jti is not None and jti in self._jtis:
+            return True
+        cutoff = self._subjects.get(subject)
+        return cutoff is not None and (issued_at or 0) <= cutoff
+
+    def prune(self, now: float = None):
+        now = now or time.time()
+        horizon = now - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        with self._lock:
+            self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp is None or exp > now}
+            self._subjects = {sub: cutoff for sub, cutoff in self._subjects.items() if cutoff > horizon}
+
+    def clear(self):
+        with self._lock:
+            self._jtis.clear()
+            self._subjects.clear()
+
+
+index = RevocationIndex()
+
+
+def _epoch(at: datetime) -> float:
+    # Stored values are naive UTC; token iat/exp are true epochs
+    return at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _message(row) -> dict:
+    return {
+        "jti": row["jti"],
+        "subject": row["subject"],
+        "revoked_at": _epoch(row["revoked_at"]),
+        "expires_at": _epoch(row["expires_at"]),
+    }
+
+
+def _apply(message: dict):
+    index.add(**message)
+
+
+def revoke(db, jti: str = None, subject: str = None, expires_at: datetime = None):
+    """
+    Revoke one token (`jti`, valid until `expires_at`) or every token issued to
+    `subject` so far, and commit. Takes effect in this worker immediately.
+    """
+    now = datetime.utcnow()
+    row = {
+        "jti": jti,
+        "subject": None if jti else subject,
+        "revoked_at": now,
+        "expires_at": expires_at or now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+    }
+    db.execute(revocations.insert().values(**row))
+    db.commit()
+    message = _message(row)
+    _apply(message)
+    if broadcast.notifier.running:
+        broadcast.notifier.publish(CHANNEL, message)
+
+
+def load(engine):
+    """Rebuild the index from unexpired revocations and drop the expired rows."""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(revocations.delete().where(revocations.c.expires_at <= now))
+        rows = conn.execute(revocations.select().where(or_(revocations.c.jti.isnot(None), revocations.c.subject.isnot(None)))).mappings().all()
+    index.clear()
+    for row in rows:
+        _apply(_message(row))
+    return len(rows)
+
+
+def subscribe(notifier):
+    notifier.subscribe(CHANNEL, _apply)
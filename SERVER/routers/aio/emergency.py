@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import models, schemas, dependencies
+from database import get_async_db
+
+router = APIRouter(
+    prefix="/emergency",
+    tags=["emergency"]
+)
+
+@router.get("/active", response_model=schemas.EmergencyAlert)
+async def get_active_alert(db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(dependencies.get_current_user_async)):
+    result = await db.execute(select(models.EmergencyAlert).where(
+        models.EmergencyAlert.user_id == current_user.id,
+        models.EmergencyAlert.is_active == True
+    ).order_by(models.EmergencyAlert.created_at.desc()).limit(1))
+    alert = result.scalars().first()
+
+    if not alert:
+        raise HTTPException(status_code=404, detail="No active emergency")
+
+    return alert
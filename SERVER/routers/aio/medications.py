@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from datetime import date
+import models, schemas, dependencies, loaders, pagination, response_cache, serialization, writebehind
+from database import get_async_db, AsyncSessionLocal
+
+router = APIRouter(
+    prefix="/medications",
+    tags=["medications"]
+)
+
+@router.get("/", response_model=List[schemas.Medication])
+async def get_medications(db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(dependencies.get_current_user_async)):
+    async def build():
+        result = await db.execute(select(*loaders.MEDICATION_COLUMNS).where(models.Medication.user_id == current_user.id).order_by(models.Medication.id))
+        return result.all()
+    return await response_cache.cached_response_async(current_user.id, "medications.list", List[schemas.Medication], build)
+
+@router.get("/logs", response_model=List[schemas.MedicationLog])
+async def get_medication_logs(response: Response, start_date: date, end_date: date, limit: Optional[int] = None, cursor: Optional[str] = None, format: Literal["json", "ndjson"] = "json", db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(dependencies.get_current_user_async)):
+    pagination.check_limit(limit)
+    if writebehind.buffer.has_pending(current_user.id):
+        await run_in_threadpool(writebehind.buffer.flush)
+    if format == "ndjson":
+        # Built here rather than in the generator, so a bad cursor is a 400 before the response starts
+        stmt = pagination.log_range(select(*loaders.LOG_COLUMNS), current_user.id, start_date, end_date, cursor)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return StreamingResponse(_stream_logs(stmt), media_type="application/x-ndjson")
+
+    stmt = pagination.log_range(select(*loaders.LOG_COLUMNS), current_user.id, start_date, end_date, cursor)
+    if limit is None:
+        return serialization.respond((await db.execute(stmt)).all(), List[schemas.MedicationLog])
+
+    logs = (await db.execute(stmt.limit(limit + 1))).all()
+    if len(logs) > limit:
+        logs = logs[:limit]
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(logs[-1].date, logs[-1].id)
+    return serialization.respond(logs, List[schemas.MedicationLog], response)
+
+async def _stream_logs(stmt):
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=pagination.STREAM_CHUNK_SIZE))
+        async for row in result:
+            yield serialization.dumps(row._asdict()) + b"\n"
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+import models, schemas, dependencies, loaders, response_cache
+from database import get_async_db
+
+router = APIRouter(
+    prefix="/nominees",
+    tags=["nominees"]
+)
+
+@router.get("/", response_model=List[schemas.Nominee])
+async def get_nominees(db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(dependencies.get_current_user_async)):
+    async def build():
+        result = await db.execute(select(*loaders.NOMINEE_COLUMNS).where(models.Nominee.user_id == current_user.id).order_by(models.Nominee.id))
+        return result.all()
+    return await response_cache.cached_response_async(current_user.id, "nominees.list", List[schemas.Nominee], build)
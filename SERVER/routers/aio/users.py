@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends
+import models, schemas, dependencies, response_cache
+
+router = APIRouter(
+    prefix="/users",
+    tags=["users"]
+)
+
+@router.get("/me", response_model=schemas.User)
+async def read_users_me(current_user: models.User = Depends(dependencies.get_current_user_async)):
+    async def build():
+        return current_user
+    return await response_cache.cached_response_async(current_user.id, "users.me", schemas.User, build)
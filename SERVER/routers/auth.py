@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-import models, schemas, dependencies
-from database import get_db
+import models, schemas, dependencies, revocation
+from database import get_db, retry_on_busy
 from config import settings
 
 router = APIRouter(
@@ -47,6 +47,7 @@ def login(request: schemas.LoginRequest, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer", "is_registered": True}
 
 @router.post("/register", response_model=schemas.Token)
+@retry_on_busy
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.phone == user.phone).first()
     if db_user:
@@ -61,6 +62,7 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     )
     db.add(new_user)
     db.commit()
+    dependencies.invalidate_user(new_user.phone)
     db.refresh(new_user)
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -69,3 +71,22 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     )
     
     return {"access_token": access_token, "token_type": "bearer", "is_registered": True}
+
+@router.post("/logout")
+def logout(db: Session = Depends(get_db), token_data: schemas.TokenData = Depends(dependencies.get_token_data)):
+    """Revoke the token used for this request."""
+    if token_data.jti and token_data.expires_at:
+        expires_at = datetime.fromtimestamp(token_data.expires_at, timezone.utc).replace(tzinfo=None)
+        revocation.revoke(db, jti=token_data.jti, expires_at=expires_at)
+    else:
+        # Tokens issued before jti existed, or without exp (which never expire and so
+        # would outlive a per-token entry), can only be revoked together
+        revocation.revoke(db, subject=token_data.phone)
+    return {"message": "Logged out"}
+
+@router.post("/logout-all")
+def logout_all(db: Session = Depends(get_db), token_data: schemas.TokenData = Depends(dependencies.get_token_data)):
+    """Forced sign-out: revoke every token issued to this user so far."""
+    revocation.revoke(db, subject=token_data.phone)
+    dependencies.invalidate_user(token_data.phone)
+    return {"message": "Signed out everywhere"}
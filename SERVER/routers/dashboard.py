@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.orm import Session
+from datetime import date
+from typing import Optional
+import hashlib
+import models, schemas, dependencies, serialization, writebehind
+from loaders import MEDICATION_COLUMNS, LOG_COLUMNS, NOMINEE_COLUMNS, ALERT_COLUMNS
+from database import get_db
+
+router = APIRouter(
+    prefix="/dashboard",
+    tags=["dashboard"]
+)
+
+def _etag(*parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+@router.get("/", response_model=schemas.Dashboard)
+def get_dashboard(request: Request, response: Response, day: Optional[date] = None, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    # Everything the dashboard shows, read as plain row tuples in one session
+    day = day or date.today()
+    writebehind.buffer.flush_user(current_user.id)
+    medications = db.query(*MEDICATION_COLUMNS).filter(models.Medication.user_id == current_user.id).order_by(models.Medication.id).all()
+    logs = db.query(*LOG_COLUMNS).filter(
+        models.MedicationLog.user_id == current_user.id,
+        models.MedicationLog.date == day
+    ).order_by(models.MedicationLog.id).all()
+    nominees = db.query(*NOMINEE_COLUMNS).filter(models.Nominee.user_id == current_user.id).order_by(models.Nominee.id).all()
+    active_alert = db.query(*ALERT_COLUMNS).filter(
+        models.EmergencyAlert.user_id == current_user.id,
+        models.EmergencyAlert.is_active == True
+    ).order_by(models.EmergencyAlert.created_at.desc()).first()
+
+    # The ETag is computed from the raw rows, so an unchanged dashboard is answered
+    # with 304 before any response model validation or JSON encoding happens.
+    etag = _etag(day, [tuple(r) for r in medications], [tuple(r) for r in logs],
+                 [tuple(r) for r in nominees], tuple(active_alert) if active_alert else None)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return serialization.respond({
+        "day": day,
+        "medications": medications,
+        "logs": logs,
+        "nominees": nominees,
+        "active_alert": active_alert,
+    }, schemas.Dashboard, response)
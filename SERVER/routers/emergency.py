@@ -1,20 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case
 from sqlalchemy.orm import Session
-from datetime import datetime
-import models, schemas, dependencies
-from database import get_db
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import json
+import models, schemas, dependencies, changes, dispatch, escalation, events, loaders
+from config import settings
+from database import get_db, insert_for, retry_on_busy
 
 router = APIRouter(
     prefix="/emergency",
     tags=["emergency"]
 )
 
-@router.get("/active", response_model=schemas.EmergencyAlert)
-def get_active_alert(db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    alert = db.query(models.EmergencyAlert).filter(
-        models.EmergencyAlert.user_id == current_user.id,
+STREAM_KEEPALIVE_SECONDS = 15
+
+def _alert_event(alert) -> dict:
+    return {"type": "alert", "data": schemas.from_orm(schemas.EmergencyAlert, alert)}
+
+def _active_alert(db: Session, user_id: int):
+    return db.query(models.EmergencyAlert).filter(
+        models.EmergencyAlert.user_id == user_id,
         models.EmergencyAlert.is_active == True
     ).order_by(models.EmergencyAlert.created_at.desc()).first()
+
+@router.get("/active", response_model=schemas.EmergencyAlert)
+def get_active_alert(db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    alert = _active_alert(db, current_user.id)
     
     if not alert:
         # Return a dummy or 404? 
@@ -24,31 +39,125 @@ def get_active_alert(db: Session = Depends(get_db), current_user: models.User =
     
     return alert
 
+@router.get("/stream")
+def stream_emergency(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_stream_user)):
+    """Server-Sent Events stream of this user's alert stage changes."""
+    user_id = current_user.id
+    alert = _active_alert(db, user_id)
+    initial = jsonable_encoder(_alert_event(alert)) if alert else None
+    # Release the pooled connection now; the stream can stay open for hours
+    db.close()
+
+    async def event_stream():
+        with events.hub.subscribe(user_id) as queue:
+            yield "retry: 3000\n\n"
+            if initial:
+                yield events.format_sse(initial)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield events.format_sse(event)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+def _claim_idempotency_key(db: Session, user_id: int, key: str):
+    """
+    Insert the key row; returns None if this request claimed the key, otherwise the
+    stored response of the request that did. Runs in the caller's transaction.
+    """
+    keys = models.IdempotencyKey.__table__
+    db.execute(keys.delete().where(
+        keys.c.user_id == user_id,
+        keys.c.created_at < datetime.utcnow() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    ))
+    insert = insert_for(db.get_bind())
+    claimed = db.execute(
+        insert(keys).values(user_id=user_id, key=key, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[keys.c.user_id, keys.c.key])
+        .returning(keys.c.key)
+    ).first()
+    if claimed is not None:
+        return None
+    stored = db.execute(keys.select().with_only_columns(keys.c.response).where(
+        keys.c.user_id == user_id, keys.c.key == key
+    )).scalar()
+    if stored is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    return json.loads(stored)
+
 @router.post("/", response_model=schemas.EmergencyAlert)
-def trigger_emergency(alert: schemas.EmergencyAlertCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    # Check if active exists
-    existing = db.query(models.EmergencyAlert).filter(
+@retry_on_busy
+def trigger_emergency(alert: schemas.EmergencyAlertCreate, response: Response, idempotency_key: Optional[str] = Header(None, max_length=255), db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    Raise the user's active alert, or move it forward to `stage` if one is already
+    active (an alert never moves back to an earlier stage). A single upsert against
+    the one-active-alert-per-user index, so concurrent taps converge on one row.
+    Retries carrying the same Idempotency-Key get the first response back (with
+    Idempotent-Replayed: true) without writing again.
+    """
+    if alert.stage not in escalation.STAGES:
+        raise HTTPException(status_code=422, detail=f"Unknown stage; expected one of {list(escalation.STAGES)}")
+    if idempotency_key:
+        replay = _claim_idempotency_key(db, current_user.id, idempotency_key)
+        if replay is not None:
+            db.rollback()
+            response.headers["Idempotent-Replayed"] = "true"
+            return replay
+
+    now = datetime.utcnow()
+    # stamp() takes the user's change counter, which serializes this user's writers: whether
+    # an alert is active cannot change between this read and the upsert below
+    stamp = changes.stamp(db, current_user.id)
+    raised = db.query(models.EmergencyAlert.id).filter(
         models.EmergencyAlert.user_id == current_user.id,
         models.EmergencyAlert.is_active == True
-    ).first()
-    
-    if existing:
-        existing.stage = alert.stage # Update stage
-        db.commit()
-        db.refresh(existing)
-        return existing
-
-    new_alert = models.EmergencyAlert(
+    ).first() is None
+    insert = insert_for(db.get_bind())
+    stmt = insert(models.EmergencyAlert).values(
         user_id=current_user.id,
         stage=alert.stage,
-        is_active=True
+        is_active=True,
+        created_at=now,
+        escalate_at=escalation.escalate_at(alert.stage, now),
+        **stamp
     )
-    db.add(new_alert)
+    advance = escalation.forward_only(models.EmergencyAlert.stage, stmt.excluded.stage)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.EmergencyAlert.user_id],
+        index_where=models.EmergencyAlert.is_active == True,
+        set_={
+            "stage": case((advance, stmt.excluded.stage), else_=models.EmergencyAlert.stage),
+            "escalate_at": case((advance, stmt.excluded.escalate_at), else_=models.EmergencyAlert.escalate_at),
+            "row_version": stmt.excluded.row_version,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    ).returning(*loaders.ALERT_COLUMNS)
+    row = db.execute(stmt).one()
+    body = jsonable_encoder(row._asdict())
+    notified = 0
+    if raised:
+        # A new alert (not a stage change): queue the nominees' messages in this transaction
+        notified = dispatch.enqueue(db, row.id, current_user.id,
+                                    f"Lumi: {current_user.fullname} has raised an emergency alert. Please check on them now.")
+
+    if idempotency_key:
+        keys = models.IdempotencyKey.__table__
+        db.execute(keys.update().where(keys.c.user_id == current_user.id, keys.c.key == idempotency_key).values(response=json.dumps(body)))
     db.commit()
-    db.refresh(new_alert)
-    return new_alert
+    if notified:
+        dispatch.dispatcher.wake()
+    escalation.arm(row.id, current_user.id, row.stage, row.escalate_at)
+    events.hub.publish(current_user.id, {"type": "alert", "data": body})
+    return body
 
 @router.post("/{alert_id}/resolve", response_model=schemas.EmergencyAlert)
+@retry_on_busy
 def resolve_emergency(alert_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     alert = db.query(models.EmergencyAlert).filter(
         models.EmergencyAlert.id == alert_id,
@@ -58,8 +167,18 @@ def resolve_emergency(alert_id: int, db: Session = Depends(get_db), current_user
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
     
+    notified = 0
+    if alert.is_active:
+        notified = dispatch.enqueue(db, alert.id, current_user.id,
+                                    f"Lumi: {current_user.fullname}'s emergency alert has been resolved.")
     alert.is_active = False
     alert.resolved_at = datetime.utcnow()
+    alert.escalate_at = None
+    alert.row_version = changes.bump(db, current_user.id)
     db.commit()
+    if notified:
+        dispatch.dispatcher.wake()
+    escalation.cancel(alert.id, current_user.id)
     db.refresh(alert)
+    events.hub.publish(current_user.id, _alert_event(alert))
     return alert
@@ -1,63 +1,157 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 from datetime import date, timedelta
-import models, schemas, dependencies
-from database import get_db
+import models, schemas, dependencies, loaders, adherence, changes, pagination, schedule_times, scheduling, response_cache, serialization, writebehind
+from database import get_db, insert_for, SessionLocal, retry_on_busy
 
 router = APIRouter(
     prefix="/medications",
     tags=["medications"]
 )
 
+MAX_BATCH_LOGS = 1000
+
+def _log_upsert(db: Session):
+    return writebehind.log_upsert(db.get_bind())
+
 @router.get("/", response_model=List[schemas.Medication])
 def get_medications(db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    return current_user.medications
+    return response_cache.cached_response(current_user.id, "medications.list", List[schemas.Medication], lambda: loaders.load_user_children(
+        db, current_user, "medications", loaders.MEDICATION_COLUMNS, "medications.list"
+    ))
 
 @router.post("/", response_model=schemas.Medication)
+@retry_on_busy
 def create_medication(med: schemas.MedicationCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_med = models.Medication(**med.dict(), user_id=current_user.id)
+    db_med = models.Medication(
+        **med.dict(),
+        user_id=current_user.id,
+        schedule_minutes=schedule_times.parse_scheduled_time(med.scheduled_time),
+        **changes.stamp(db, current_user.id)
+    )
     db.add(db_med)
     db.commit()
+    response_cache.bump(current_user.id)
     db.refresh(db_med)
+    scheduling.add(db_med)
     return db_med
 
-@router.post("/{med_id}/log", response_model=schemas.MedicationLog)
+@router.post("/{med_id}/log", response_model=schemas.MedicationLog, responses={202: {"model": schemas.MedicationLogAccepted, "description": "Queued by the write-behind buffer"}})
+@retry_on_busy
 def log_medication(med_id: int, log: schemas.MedicationLogCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     # Verify medication belongs to user
     med = db.query(models.Medication).filter(models.Medication.id == med_id, models.Medication.user_id == current_user.id).first()
     if not med:
         raise HTTPException(status_code=404, detail="Medication not found")
+
+    if writebehind.buffer.running:
+        entry = {"medication_id": med_id, "user_id": current_user.id, "date": log.date, "status": log.status, "taken_at": log.taken_at}
+        writebehind.buffer.submit({**entry, "scheduled_time": med.scheduled_time})
+        return serialization.FastJSONResponse(jsonable_encoder(entry), status_code=202)
     
-    # Check if log already exists for this date? (Optional logic, for now allow multi-entry for demo or assume rigid schedule)
-    # Ideally should check if entry exists for that `date` and `medication_id`.
-    existing_log = db.query(models.MedicationLog).filter(
-        models.MedicationLog.medication_id == med_id, 
-        models.MedicationLog.date == log.date
-    ).first()
-    
-    if existing_log:
-        existing_log.status = log.status
-        existing_log.taken_at = log.taken_at
-        db.commit()
-        db.refresh(existing_log)
-        return existing_log
-    
-    db_log = models.MedicationLog(**log.dict(), user_id=current_user.id) # log.dict() should contain medication_id technically but we passed it in URL. 
-    # Wait, schemas.MedicationLogCreate has medication_id. 
-    # Let's override or ensure consistency
-    db_log.medication_id = med_id
-    
-    db.add(db_log)
+    # Insert or update the single log for (medication_id, date) in one statement
+    stmt = _log_upsert(db).values(
+        medication_id=med_id,
+        user_id=current_user.id,
+        date=log.date,
+        status=log.status,
+        taken_at=log.taken_at,
+        **changes.stamp(db, current_user.id)
+    ).returning(*loaders.LOG_COLUMNS)
+    db_log = db.execute(stmt).one()
+    adherence.record(db, [{**db_log._mapping, "scheduled_time": med.scheduled_time}])
     db.commit()
-    db.refresh(db_log)
     return db_log
 
+@router.post("/logs/batch", response_model=schemas.MedicationLogBatchResult)
+@retry_on_busy
+def log_medications_batch(batch: schemas.MedicationLogBatch, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """Ingest many dose logs (e.g. an offline device catching up) in one transaction."""
+    if len(batch.logs) > MAX_BATCH_LOGS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_LOGS} logs per batch")
+    # Queued single writes must not land after (and overwrite) this batch
+    writebehind.buffer.flush_user(current_user.id)
+
+    # Ownership of every referenced medication in a single IN query
+    med_ids = {log.medication_id for log in batch.logs}
+    owned = {row.id: row.scheduled_time for row in db.query(models.Medication.id, models.Medication.scheduled_time).filter(
+        models.Medication.id.in_(med_ids),
+        models.Medication.user_id == current_user.id
+    )} if med_ids else {}
+
+    # Later entries for the same (medication_id, date) win, as if replayed one by one
+    rows = {}
+    for log in batch.logs:
+        if log.medication_id in owned:
+            rows[(log.medication_id, log.date)] = {
+                "medication_id": log.medication_id,
+                "user_id": current_user.id,
+                "date": log.date,
+                "status": log.status,
+                "taken_at": log.taken_at,
+            }
+
+    written = {}
+    if rows:
+        db.execute(_log_upsert(db), changes.stamp_rows(db, rows.values()))
+        stored = db.query(*loaders.LOG_COLUMNS).filter(
+            models.MedicationLog.medication_id.in_({key[0] for key in rows}),
+            models.MedicationLog.date.in_({key[1] for key in rows})
+        )
+        written = {(row.medication_id, row.date): row for row in stored if (row.medication_id, row.date) in rows}
+        adherence.record(db, [{**row._mapping, "scheduled_time": owned[row.medication_id]} for row in written.values()])
+        db.commit()
+
+    results = []
+    for index, log in enumerate(batch.logs):
+        if log.medication_id in owned:
+            results.append({"index": index, "medication_id": log.medication_id, "result": "written", "log": written.get((log.medication_id, log.date))})
+        else:
+            results.append({"index": index, "medication_id": log.medication_id, "result": "not_found"})
+    return {"written": len(rows), "results": results}
+
+@router.get("/stats", response_model=List[schemas.AdherenceStat])
+def get_adherence_stats(start_date: date, end_date: date, period: Literal["day", "week"] = "day", medication_id: Optional[int] = None, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """Adherence rollups per medication and day/week, read from adherence_rollups."""
+    writebehind.buffer.flush_user(current_user.id)
+    return serialization.respond(adherence.stats(db, current_user.id, period, start_date, end_date, medication_id), List[schemas.AdherenceStat])
+
 @router.get("/logs", response_model=List[schemas.MedicationLog])
-def get_medication_logs(start_date: date, end_date: date, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    logs = db.query(models.MedicationLog).filter(
-        models.MedicationLog.user_id == current_user.id,
-        models.MedicationLog.date >= start_date,
-        models.MedicationLog.date <= end_date
-    ).all()
-    return logs
+def get_medication_logs(response: Response, start_date: date, end_date: date, limit: Optional[int] = None, cursor: Optional[str] = None, format: Literal["json", "ndjson"] = "json", db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    Logs in (date, id) order. With `limit`, returns one page and sets X-Next-Cursor
+    when more rows follow; pass it back as `cursor`. format=ndjson streams one log per
+    line with flat memory regardless of the range size.
+    """
+    pagination.check_limit(limit)
+    writebehind.buffer.flush_user(current_user.id)
+    if format == "ndjson":
+        # Built here rather than in the generator, so a bad cursor is a 400 before the response starts
+        stmt = pagination.log_range(select(*loaders.LOG_COLUMNS), current_user.id, start_date, end_date, cursor)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        db.close()
+        return StreamingResponse(_stream_logs(stmt), media_type="application/x-ndjson")
+
+    query = pagination.log_range(db.query(*loaders.LOG_COLUMNS), current_user.id, start_date, end_date, cursor)
+    if limit is None:
+        return serialization.respond(query.all(), List[schemas.MedicationLog])
+
+    logs = query.limit(limit + 1).all()
+    if len(logs) > limit:
+        logs = logs[:limit]
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(logs[-1].date, logs[-1].id)
+    return serialization.respond(logs, List[schemas.MedicationLog], response)
+
+def _stream_logs(stmt):
+    # Own session: the request's session is closed before the body is streamed
+    db = SessionLocal()
+    try:
+        for row in db.execute(stmt.execution_options(yield_per=pagination.STREAM_CHUNK_SIZE)):
+            yield serialization.dumps(row._asdict()) + b"\n"
+    finally:
+        db.close()
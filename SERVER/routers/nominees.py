@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-import models, schemas, dependencies
-from database import get_db
+import models, schemas, dependencies, loaders, response_cache, changes
+from database import get_db, retry_on_busy
 
 router = APIRouter(
     prefix="/nominees",
@@ -11,21 +11,28 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas.Nominee])
 def get_nominees(db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    return current_user.nominees
+    return response_cache.cached_response(current_user.id, "nominees.list", List[schemas.Nominee], lambda: loaders.load_user_children(
+        db, current_user, "nominees", loaders.NOMINEE_COLUMNS, "nominees.list"
+    ))
 
 @router.post("/", response_model=schemas.Nominee)
+@retry_on_busy
 def create_nominee(nominee: schemas.NomineeCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_nominee = models.Nominee(**nominee.dict(), user_id=current_user.id)
+    db_nominee = models.Nominee(**nominee.dict(), user_id=current_user.id, **changes.stamp(db, current_user.id))
     db.add(db_nominee)
     db.commit()
+    response_cache.bump(current_user.id)
     db.refresh(db_nominee)
     return db_nominee
 
 @router.delete("/{nominee_id}")
+@retry_on_busy
 def delete_nominee(nominee_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     db_nominee = db.query(models.Nominee).filter(models.Nominee.id == nominee_id, models.Nominee.user_id == current_user.id).first()
     if not db_nominee:
         raise HTTPException(status_code=404, detail="Nominee not found")
     db.delete(db_nominee)
+    changes.tombstone(db, current_user.id, "nominee", nominee_id)
     db.commit()
+    response_cache.bump(current_user.id)
     return {"message": "Nominee deleted"}
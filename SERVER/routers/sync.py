@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from datetime import date, timedelta
+import models, schemas, dependencies, changes, serialization, writebehind
+from loaders import MEDICATION_COLUMNS, LOG_COLUMNS, NOMINEE_COLUMNS, ALERT_COLUMNS
+from config import settings
+from database import get_db
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["sync"]
+)
+
+@router.get("", response_model=schemas.SyncChanges)
+def get_changes(since: int = Query(0, ge=0), db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    Everything that changed for this user after change version `since`, and the
+    version to send next time. since=0 (or a version this server never issued)
+    returns a full snapshot, with logs limited to the last SYNC_FULL_LOG_DAYS.
+    """
+    writebehind.buffer.flush_user(current_user.id)
+    # Read the version before the rows: a write committed in between is sent
+    # now and again next time, never skipped
+    version = changes.current_version(db, current_user.id)
+    full = since == 0 or since > version
+
+    def changed(model, columns):
+        query = db.query(*columns).filter(model.user_id == current_user.id)
+        if not full:
+            query = query.filter(model.row_version > since)
+        return query
+
+    logs = changed(models.MedicationLog, LOG_COLUMNS)
+    if full:
+        logs = logs.filter(models.MedicationLog.date >= date.today() - timedelta(days=settings.SYNC_FULL_LOG_DAYS))
+    deleted = [] if full else db.query(models.SyncTombstone.entity, models.SyncTombstone.entity_id.label("id")).filter(
+        models.SyncTombstone.user_id == current_user.id,
+        models.SyncTombstone.row_version > since
+    ).order_by(models.SyncTombstone.row_version).all()
+
+    return serialization.respond({
+        "version": version,
+        "full": full,
+        "medications": changed(models.Medication, MEDICATION_COLUMNS).order_by(models.Medication.id).all(),
+        "nominees": changed(models.Nominee, NOMINEE_COLUMNS).order_by(models.Nominee.id).all(),
+        "logs": logs.order_by(models.MedicationLog.date, models.MedicationLog.id).all(),
+        "alerts": changed(models.EmergencyAlert, ALERT_COLUMNS).order_by(models.EmergencyAlert.id).all(),
+        "deleted": deleted,
+    }, schemas.SyncChanges)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-import models, schemas, dependencies
-from database import get_db
+import models, schemas, dependencies, response_cache
+from database import get_db, retry_on_busy
 
 router = APIRouter(
     prefix="/users",
@@ -10,9 +10,10 @@ router = APIRouter(
 
 @router.get("/me", response_model=schemas.User)
 def read_users_me(current_user: models.User = Depends(dependencies.get_current_user)):
-    return current_user
+    return response_cache.cached_response(current_user.id, "users.me", schemas.User, lambda: current_user)
 
 @router.put("/me", response_model=schemas.User)
+@retry_on_busy
 def update_user_me(user_update: schemas.UserCreate, db: Session = Depends(get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     # Update fields
     current_user.fullname = user_update.fullname
@@ -22,5 +23,7 @@ def update_user_me(user_update: schemas.UserCreate, db: Session = Depends(get_db
     # Phone usually shouldn't change easily as it is the ID, but for now we skip updating phone or strictly validation
     
     db.commit()
+    dependencies.invalidate_user(current_user.phone)
+    response_cache.bump(current_user.id)
     db.refresh(current_user)
     return current_user
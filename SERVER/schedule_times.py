@@ -0,0 +1,32 @@
+"""
+Parsing of medication schedule times.
+
+A leaf module (no app imports) shared by the dose scheduler, the adherence
+rollups and the medication routes.
+"""
+from datetime import datetime
+from typing import Optional
+
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p", "%I%p")
+
+
+def parse_scheduled_time(value: Optional[str]) -> Optional[int]:
+    """Normalize a free-form time ("08:00", "8:00 pm", "20:00:00") to minutes after midnight."""
+    if not value:
+        return None
+    # Fast path for the canonical "HH:MM" form, which is what almost every row holds
+    if len(value) == 5 and value[2] == ":" and value[:2].isdigit() and value[3:].isdigit():
+        hours, minutes = int(value[:2]), int(value[3:])
+        return hours * 60 + minutes if hours < 24 and minutes < 60 else None
+    text = value.strip().upper()
+    for fmt in TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed.hour * 60 + parsed.minute
+    return None
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
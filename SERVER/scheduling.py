@@ -0,0 +1,261 @@
+"""
+Dose schedule engine.
+
+Every schedulable medication has exactly one pending timer in a TimerQueue
+(min-heap): either its next "due" time or, once due, its "missed" deadline.
+When a timer fires, the scheduler writes the batch of due doses as "pending"
+logs and the batch of overdue ones as "missed", then arms the next timer for
+that medication. The table is read once at startup; after that, each event
+costs O(log n) with no periodic scans.
+
+Doses whose missed deadline passed while the scheduler was not running (a
+restart or deploy) are written as "missed" at startup, back to the medication's
+last settled log but no further than SCHEDULER_BACKFILL_DAYS.
+
+With several workers the scheduler runs in the one holding the scheduler lock;
+the others reach it through the notifier (schedule messages on CHANNEL).
+"""
+import logging
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, select
+
+from config import settings
+from database import SessionLocal, insert_for
+from timers import TimerQueue
+import models, adherence, broadcast, changes
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 30
+CHANNEL = "scheduler"
+
+# What the scheduler keeps in memory per medication
+Dose = namedtuple("Dose", "kind day user_id minutes start_date end_date scheduled_time")
+# The medication columns the scheduler reads, as sent to the worker running it
+Schedule = namedtuple("Schedule", "id user_id schedule_minutes start_date end_date scheduled_time")
+
+
+class DoseScheduler:
+    def __init__(self, session_factory=SessionLocal, missed_after_minutes: int = None, now=datetime.now):
+        self.session_factory = session_factory
+        self.missed_after = timedelta(minutes=missed_after_minutes if missed_after_minutes is not None else settings.SCHEDULER_MISSED_AFTER_MINUTES)
+        self.now = now
+        self.timers = TimerQueue(self._fire, name="dose-scheduler", max_batch=settings.SCHEDULER_BATCH_SIZE)
+        self.running = False
+
+    def __len__(self):
+        return len(self.timers)
+
+    # --- timer bookkeeping -------------------------------------------------
+
+    def _due_at(self, dose: Dose) -> datetime:
+        return datetime.combine(dose.day, datetime.min.time()) + timedelta(minutes=dose.minutes)
+
+    def _deadline(self, dose: Dose) -> float:
+        at = self._due_at(dose)
+        if dose.kind == "miss":
+            at += self.missed_after
+        return at.timestamp()
+
+    def _in_range(self, dose: Dose, day: date) -> bool:
+        return (dose.start_date is None or day >= dose.start_date) and (dose.end_date is None or day <= dose.end_date)
+
+    def first_dose(self, med, now: datetime) -> Optional[Dose]:
+        """The next event for a medication as seen at `now`, or None once its end_date has passed."""
+        minutes = med.schedule_minutes
+        if minutes is None:
+            return None
+        day = max(now.date(), med.start_date) if med.start_date else now.date()
+        dose = Dose("due", day, med.user_id, minutes, med.start_date, med.end_date, med.scheduled_time)
+        if not self._in_range(dose, day):
+            return None
+        # A dose still inside its missed window fires "due" right away, then "miss" later
+        if self._due_at(dose) + self.missed_after > now:
+            return dose
+        next_day = day + timedelta(days=1)
+        return dose._replace(day=next_day) if self._in_range(dose, next_day) else None
+
+    def overdue_doses(self, med, last_settled: Optional[date], now: datetime) -> list:
+        """"miss" doses past their deadline at `now` after `last_settled` (the last non-pending log day)."""
+        if med.schedule_minutes is None:
+            return []
+        dose = Dose("miss", now.date(), med.user_id, med.schedule_minutes, med.start_date, med.end_date, med.scheduled_time)
+        last = now.date()
+        while self._due_at(dose._replace(day=last)) + self.missed_after > now:
+            last -= timedelta(days=1)
+        first = last - timedelta(days=settings.SCHEDULER_BACKFILL_DAYS - 1)
+        if last_settled is not None:
+            first = max(first, last_settled + timedelta(days=1))
+        days = (first + timedelta(days=n) for n in range((last - first).days + 1))
+        return [dose._replace(day=day) for day in days if self._in_range(dose, day)]
+
+    def add(self, med):
+        dose = self.first_dose(med, self.now())
+        if dose is None:
+            self.timers.cancel(med.id)
+        else:
+            self.timers.schedule(med.id, self._deadline(dose), dose)
+
+    def remove(self, med_id: int):
+        self.timers.cancel(med_id)
+
+    def _on_message(self, message: dict):
+        # Every worker receives the message; only the one running the scheduler keeps timers
+        if not self.running:
+            return
+        schedule = message["schedule"]
+        if schedule is None:
+            self.remove(message["id"])
+            return
+        for name in ("start_date", "end_date"):
+            if schedule[name]:
+                schedule[name] = date.fromisoformat(schedule[name])
+        self.add(Schedule(**schedule))
+
+    def load(self):
+        """
+        Write the doses missed while the scheduler was down and arm timers for every
+        active medication (the only full read of the table).
+        """
+        now = self.now()
+        horizon = now.date() - timedelta(days=settings.SCHEDULER_BACKFILL_DAYS + 1)
+        meds = models.Medication.__table__
+        logs = models.MedicationLog.__table__
+        db = self.session_factory()
+        try:
+            settled = dict(db.execute(
+                select(logs.c.medication_id, func.max(logs.c.date))
+                .where(logs.c.date >= horizon, logs.c.status != "pending")
+                .group_by(logs.c.medication_id)
+            ).all())
+            rows = db.execute(
+                select(meds.c.id, meds.c.user_id, meds.c.schedule_minutes, meds.c.start_date, meds.c.end_date, meds.c.scheduled_time)
+                .where(meds.c.schedule_minutes.isnot(None))
+                .where((meds.c.end_date.is_(None)) | (meds.c.end_date >= horizon))
+                .execution_options(yield_per=10000)
+            )
+            items, overdue = [], []
+            for med in rows:
+                overdue.extend((med.id, dose) for dose in self.overdue_doses(med, settled.get(med.id), now))
+                dose = self.first_dose(med, now)
+                if dose is not None:
+                    items.append((med.id, self._deadline(dose), dose))
+        finally:
+            db.close()
+        for start in range(0, len(overdue), settings.SCHEDULER_BATCH_SIZE):
+            self._write_logs(overdue[start:start + settings.SCHEDULER_BATCH_SIZE])
+        if overdue:
+            logger.info("Dose scheduler recorded %d doses missed while it was not running", len(overdue))
+        self.timers.schedule_many(items)
+        return len(items)
+
+    def start(self):
+        if self.running:
+            return
+        count = self.load()
+        self.timers.start()
+        self.running = True
+        logger.info("Dose scheduler started with %d medications", count)
+
+    def stop(self):
+        self.timers.stop()
+        self.running = False
+
+    # --- firing ------------------------------------------------------------
+
+    def _fire(self, batch):
+        try:
+            self.process(batch)
+        except Exception:
+            logger.exception("Dose scheduler batch failed; retrying in %ss", RETRY_SECONDS)
+            retry_at = self.now().timestamp() + RETRY_SECONDS
+            for med_id, dose in batch:
+                if med_id not in self.timers:
+                    self.timers.schedule(med_id, retry_at, dose)
+
+    def process(self, batch):
+        """Write pending/missed logs for a batch of fired (med_id, Dose) timers and re-arm them."""
+        self._write_logs(batch)
+
+        for med_id, dose in batch:
+            if med_id in self.timers:
+                continue  # re-armed concurrently (e.g. medication re-added)
+            if dose.kind == "due":
+                follow = dose._replace(kind="miss")
+            else:
+                next_day = dose.day + timedelta(days=1)
+                follow = dose._replace(kind="due", day=next_day) if self._in_range(dose, next_day) else None
+            if follow is not None:
+                self.timers.schedule(med_id, self._deadline(follow), follow)
+
+    def _write_logs(self, batch):
+        pending = [self._log_row(med_id, dose, "pending") for med_id, dose in batch if dose.kind == "due"]
+        missed = [self._log_row(med_id, dose, "missed") for med_id, dose in batch if dose.kind == "miss"]
+
+        db = self.session_factory()
+        try:
+            insert = insert_for(db.get_bind())
+            # One change version per user for the whole batch
+            stamped = changes.stamp_rows(db, pending + missed)
+            pending, missed = [], []
+            for row in stamped:
+                (pending if row["status"] == "pending" else missed).append(row)
+            if pending:
+                db.execute(insert(models.MedicationLog).on_conflict_do_nothing(
+                    index_elements=[models.MedicationLog.medication_id, models.MedicationLog.date]
+                ), pending)
+            if missed:
+                stmt = insert(models.MedicationLog)
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=[models.MedicationLog.medication_id, models.MedicationLog.date],
+                    set_={"status": stmt.excluded.status, "row_version": stmt.excluded.row_version,
+                          "updated_at": stmt.excluded.updated_at},
+                    where=models.MedicationLog.status == "pending"
+                ), missed)
+            self._record_adherence(db, batch)
+            db.commit()
+        finally:
+            db.close()
+
+    def _log_row(self, med_id: int, dose: Dose, status: str) -> dict:
+        return {"medication_id": med_id, "user_id": dose.user_id, "date": dose.day, "status": status, "taken_at": None}
+
+    def _record_adherence(self, db, batch):
+        scheduled = {med_id: dose.scheduled_time for med_id, dose in batch}
+        logs = db.query(models.MedicationLog.user_id, models.MedicationLog.medication_id, models.MedicationLog.date,
+                        models.MedicationLog.status, models.MedicationLog.taken_at).filter(
+            models.MedicationLog.medication_id.in_(scheduled),
+            models.MedicationLog.date.in_({dose.day for _, dose in batch})
+        )
+        days = {(med_id, dose.day) for med_id, dose in batch}
+        adherence.record(db, [
+            {**log._mapping, "scheduled_time": scheduled[log.medication_id]}
+            for log in logs if (log.medication_id, log.date) in days
+        ])
+
+
+scheduler = DoseScheduler()
+
+
+def add(med):
+    """Arm a medication's doses in the scheduler, wherever it runs."""
+    if scheduler.running:
+        scheduler.add(med)
+    if broadcast.notifier.running:
+        schedule = {name: getattr(med, name) for name in Schedule._fields}
+        broadcast.notifier.publish(CHANNEL, jsonable_encoder({"id": med.id, "schedule": schedule}))
+
+
+def remove(med_id: int):
+    if scheduler.running:
+        scheduler.remove(med_id)
+    if broadcast.notifier.running:
+        broadcast.notifier.publish(CHANNEL, {"id": med_id, "schedule": None})
+
+
+def subscribe(notifier):
+    notifier.subscribe(CHANNEL, scheduler._on_message)
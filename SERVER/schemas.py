@@ -2,6 +2,12 @@ from pydantic import BaseModel
 from typing import List, Optional
 from datetime import date, datetime
 
+def from_orm(schema, obj):
+    """Build `schema` from an ORM object or result row on both Pydantic v1 and v2."""
+    if hasattr(schema, "model_validate"):
+        return schema.model_validate(obj, from_attributes=True)
+    return schema.from_orm(obj)
+
 # Token Schemas
 class Token(BaseModel):
     access_token: str
@@ -10,6 +16,9 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     phone: Optional[str] = None
+    jti: Optional[str] = None
+    issued_at: Optional[float] = None
+    expires_at: Optional[float] = None
 
 # User Schemas
 class UserBase(BaseModel):
@@ -91,6 +100,34 @@ class MedicationLog(MedicationLogBase):
     class Config:
         orm_mode = True
 
+class MedicationLogAccepted(MedicationLogBase):
+    # 202 body when the write is queued (write-behind); the row id is not known yet
+    medication_id: int
+    user_id: int
+    date: date
+
+class MedicationLogBatch(BaseModel):
+    logs: List[MedicationLogCreate]
+
+class MedicationLogBatchItem(BaseModel):
+    index: int
+    medication_id: int
+    result: str # 'written', 'not_found'
+    log: Optional[MedicationLog] = None
+
+class MedicationLogBatchResult(BaseModel):
+    written: int
+    results: List[MedicationLogBatchItem]
+
+class AdherenceStat(BaseModel):
+    medication_id: int
+    period: str # 'day' or 'week'
+    period_start: date
+    taken: int
+    missed: int
+    pending: int
+    mean_delay_minutes: Optional[float] = None
+
 # Emergency Alert Schemas
 class EmergencyAlertBase(BaseModel):
     stage: str
@@ -104,6 +141,29 @@ class EmergencyAlert(EmergencyAlertBase):
     is_active: bool
     created_at: datetime
     resolved_at: Optional[datetime] = None
+    escalate_at: Optional[datetime] = None # when the server moves it to the next stage
 
     class Config:
         orm_mode = True
+
+# Delta sync Schemas
+class SyncDeletion(BaseModel):
+    entity: str # 'nominee'
+    id: int
+
+class SyncChanges(BaseModel):
+    version: int
+    full: bool
+    medications: List[Medication]
+    nominees: List[Nominee]
+    logs: List[MedicationLog]
+    alerts: List[EmergencyAlert]
+    deleted: List[SyncDeletion]
+
+# Dashboard Schemas
+class Dashboard(BaseModel):
+    day: date
+    medications: List[Medication]
+    logs: List[MedicationLog]
+    nominees: List[Nominee]
+    active_alert: Optional[EmergencyAlert] = None
@@ -1,22 +1,39 @@
-from database import SessionLocal, engine, Base
-import models
+"""
+Demo and synthetic data.
+
+    python seed.py                      # one demo user (9876543210) with 14 days of logs
+    python seed.py --users 20000 --meds-per-user 4 --days 90 --seed 7
+        # bulk generator: Core inserts in chunked transactions, deterministic per --seed
+"""
+from database import SessionLocal, engine, build_engine
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+import models, adherence, migrations, schedule_times
 from datetime import date, datetime, timedelta
+from collections import defaultdict
+import argparse
 import random
+import time
 
-# Ensure tables exist
-Base.metadata.create_all(bind=engine)
-
-db = SessionLocal()
+def seed_data(db=None, phone="9876543210", fullname="Surya Tester", verbose=True):
+    """Create a demo user with medications and two weeks of logs. Returns the user."""
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        return _seed_user(db, phone, fullname, print if verbose else (lambda *args: None))
+    finally:
+        if own_session:
+            db.close()
 
-def seed_data():
+def _seed_user(db, phone, fullname, log):
     # 1. Create a demo user if not exists
-    phone = "9876543210"
     user = db.query(models.User).filter(models.User.phone == phone).first()
     
     if not user:
-        print("Creating demo user...")
+        log("Creating demo user...")
         user = models.User(
-            fullname="Surya Tester",
+            fullname=fullname,
             phone=phone,
             dob=date(1950, 1, 1),
             blood_group="O+",
@@ -40,6 +57,7 @@ def seed_data():
                 name=m["name"],
                 dosage=m["dosage"],
                 scheduled_time=m["scheduled_time"],
+                schedule_minutes=schedule_times.parse_scheduled_time(m["scheduled_time"]),
                 start_date=date.today() - timedelta(days=30)
             )
             db.add(med)
@@ -51,8 +69,9 @@ def seed_data():
             
         # 3. Add Logs for past 2 weeks
         # Iterate simply: for last 14 days, random chance of taken/missed
-        print("Seeding logs for past 2 weeks...")
+        log("Seeding logs for past 2 weeks...")
         today = date.today()
+        entries = []
         for i in range(14):
             day = today - timedelta(days=i)
             # For each med on this day
@@ -74,19 +93,185 @@ def seed_data():
                     jitter = random.randint(-30, 30)
                     taken_at = taken_time + timedelta(minutes=jitter)
                 
-                log = models.MedicationLog(
+                db_log = models.MedicationLog(
                     medication_id=med.id,
                     user_id=user.id,
                     date=day,
                     status=status,
                     taken_at=taken_at
                 )
-                db.add(log)
+                db.add(db_log)
+                entries.append({"user_id": user.id, "medication_id": med.id, "date": day, "status": status,
+                                "taken_at": taken_at, "scheduled_time": med.scheduled_time})
         
+        db.flush()
+        # Logs were inserted directly, so refresh this user's adherence rollups in one pass
+        adherence.record(db, entries)
         db.commit()
-        print("Seeding complete!")
+        log("Seeding complete!")
+    else:
+        log("Demo user already exists.")
+    return user
+
+MED_CATALOG = [
+    ("Aspirin", "100mg"), ("Vitamin D", "1000IU"), ("Metformin", "500mg"), ("Lisinopril", "10mg"),
+    ("Atorvastatin", "20mg"), ("Levothyroxine", "50mcg"), ("Amlodipine", "5mg"), ("Omeprazole", "20mg"),
+]
+BLOOD_GROUPS = ["O+", "O-", "A+", "A-", "B+", "B-", "AB+", "AB-"]
+ALERT_STAGES = ["voice_alert", "waiting_response", "notifying_relatives", "calling_ambulance"]
+
+def _next_id(conn, table):
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+def _default(column):
+    default = column.default
+    if default is None:
+        return None
+    return default.arg(None) if default.is_callable else default.arg
+
+def _flush(conn, table, rows):
+    """executemany a list of row dicts, applying column type conversion once per value."""
+    if not rows:
+        return
+    compiled = table.insert().compile(dialect=conn.dialect, column_keys=list(rows[0]))
+    keys = compiled.positiontup if conn.dialect.positional else list(rows[0])
+    processors = {key: table.c[key].type.bind_processor(conn.dialect) for key in keys}
+    convert = [(key, processors[key]) for key in keys]
+    # Columns the rows leave out get their Python-side default, evaluated once per chunk
+    missing = {key: _default(table.c[key]) for key in keys if key not in rows[0]}
+    if missing:
+        rows[:] = [{**missing, **row} for row in rows]
+    if conn.dialect.positional:
+        params = [tuple(fn(row[key]) if fn else row[key] for key, fn in convert) for row in rows]
     else:
-        print("Demo user already exists.")
+        params = [{key: fn(row[key]) if fn else row[key] for key, fn in convert} for row in rows]
+    conn.exec_driver_sql(compiled.string, params)
+    rows.clear()
+
+def generate(bind, users=1000, meds_per_user=3, days=30, alert_rate=0.01, seed=42, chunk_size=20000, rollups=True, log=print):
+    """
+    Bulk-generate users with medications, `days` of dose logs, emergency alerts
+    (each user has an `alert_rate` chance per day) and their adherence rollups.
+    Rows are written with executemany Core inserts and committed in transactions
+    of about `chunk_size` users' worth of rows. The same seed produces the same data.
+    """
+    rng = random.Random(seed)
+    tables = {name: model.__table__ for name, model in (
+        ("users", models.User), ("medications", models.Medication), ("logs", models.MedicationLog),
+        ("alerts", models.EmergencyAlert), ("rollups", models.AdherenceRollup),
+    )}
+    with bind.connect() as conn:
+        next_ids = {name: _next_id(conn, tables[name]) for name in ("users", "medications")}
+
+    today = date.today()
+    first_day = today - timedelta(days=days - 1)
+    calendar = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        calendar.append((day, datetime.combine(day, datetime.min.time()), adherence.week_start(day)))
+    counts = defaultdict(int)
+    started = time.perf_counter()
+
+    user_id = next_ids["users"]
+    med_id = next_ids["medications"]
+    remaining = users
+    while remaining > 0:
+        batch = {name: [] for name in tables}
+        # Size each transaction by the number of log rows it will hold
+        per_user_rows = max(1, meds_per_user * days)
+        batch_users = min(remaining, max(1, chunk_size // per_user_rows))
+        for _ in range(batch_users):
+            batch["users"].append({
+                "id": user_id,
+                "fullname": f"Synthetic User {user_id}",
+                "phone": f"6{user_id:09d}",
+                "dob": date(1930 + rng.randrange(60), rng.randrange(1, 13), rng.randrange(1, 29)),
+                "blood_group": rng.choice(BLOOD_GROUPS),
+                "address": f"{rng.randrange(1, 999)} Generated Street",
+                "created_at": datetime.combine(first_day, datetime.min.time()),
+            })
+            for name, dosage in rng.sample(MED_CATALOG, min(meds_per_user, len(MED_CATALOG))) + [
+                (f"Supplement {n}", "1 tab") for n in range(max(0, meds_per_user - len(MED_CATALOG)))
+            ]:
+                minutes = rng.randrange(6 * 60, 22 * 60, 15)
+                batch["medications"].append({
+                    "id": med_id,
+                    "user_id": user_id,
+                    "name": name,
+                    "dosage": dosage,
+                    "scheduled_time": schedule_times.format_minutes(minutes),
+                    "schedule_minutes": minutes,
+                    "start_date": first_day,
+                    "end_date": None,
+                })
+                weeks = defaultdict(lambda: dict.fromkeys(adherence.COUNTERS, 0))
+                for day, midnight, week_start in calendar:
+                    roll = rng.random()
+                    status = "pending" if day == today and roll > 0.5 else ("missed" if roll > 0.85 else "taken")
+                    taken_at = None
+                    delay = 0
+                    if status == "taken":
+                        # Same counters adherence.contribution() would derive, without re-parsing the time
+                        delay = rng.randint(-30, 45)
+                        taken_at = midnight + timedelta(minutes=minutes + delay)
+                    batch["logs"].append({"medication_id": med_id, "user_id": user_id, "date": day, "status": status, "taken_at": taken_at})
+                    if rollups:
+                        counters = {"taken": 0, "missed": 0, "pending": 0, "delay_minutes_total": delay, "delay_samples": int(taken_at is not None)}
+                        counters[status] = 1
+                        batch["rollups"].append({"user_id": user_id, "medication_id": med_id, "period": "day", "period_start": day, **counters})
+                        week = weeks[week_start]
+                        for key, value in counters.items():
+                            week[key] += value
+                for start, counters in weeks.items():
+                    batch["rollups"].append({"user_id": user_id, "medication_id": med_id, "period": "week", "period_start": start, **counters})
+                med_id += 1
+            for offset in range(days):
+                if rng.random() < alert_rate:
+                    created = datetime.combine(first_day + timedelta(days=offset), datetime.min.time()) + timedelta(minutes=rng.randrange(24 * 60))
+                    batch["alerts"].append({
+                        "user_id": user_id,
+                        "stage": rng.choice(ALERT_STAGES),
+                        "is_active": False,
+                        "created_at": created,
+                        "resolved_at": created + timedelta(minutes=rng.randrange(1, 30)),
+                    })
+            user_id += 1
+        remaining -= batch_users
+
+        with bind.begin() as conn:
+            for name, rows in batch.items():
+                counts[name] += len(rows)
+                _flush(conn, tables[name], rows)
+        log(f"  {users - remaining}/{users} users, {counts['logs']} logs ({time.perf_counter() - started:.1f}s)")
+
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return dict(counts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the Lumi database with demo or synthetic data.")
+    parser.add_argument("--users", type=int, help="generate this many synthetic users (omit for the single demo user)")
+    parser.add_argument("--meds-per-user", type=int, default=3)
+    parser.add_argument("--days", type=int, default=30, help="days of medication log history")
+    parser.add_argument("--alert-rate", type=float, default=0.01, help="chance of an emergency alert per user per day")
+    parser.add_argument("--seed", type=int, default=42, help="random seed; the same seed yields the same data")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="approximate rows per transaction")
+    parser.add_argument("--no-rollups", action="store_true", help="skip adherence rollups")
+    parser.add_argument("--database-url", help="target database (defaults to DATABASE_URL)")
+    args = parser.parse_args()
+
+    bind = build_engine(args.database_url) if args.database_url else engine
+    # Ensure tables exist
+    migrations.upgrade(bind)
+
+    if args.users is None:
+        random.seed(args.seed)
+        with Session(bind) as db:
+            seed_data(db=db)
+        return
+
+    print(f"Generating {args.users} users x {args.meds_per_user} medications x {args.days} days...")
+    counts = generate(bind, args.users, args.meds_per_user, args.days, args.alert_rate, args.seed, args.chunk_size, not args.no_rollups)
+    print(f"Done: {counts}")
 
 if __name__ == "__main__":
-    seed_data()
+    main()
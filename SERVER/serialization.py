@@ -0,0 +1,99 @@
+"""
+Fast JSON responses for read endpoints.
+
+Listings are queried as column projections (see loaders.py) and encoded straight from
+the row tuples with orjson, skipping response-model validation and jsonable_encoder.
+The projections match the `schemas` models field for field; with FAST_JSON_VALIDATE=1
+(set by the test suite) every fast response is also run through its schema and must
+encode identically, so the wire format cannot drift.
+"""
+import json
+from datetime import date, datetime
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: FastAPI's validated output, rendered with orjson."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def plain(content):
+    """Result rows (and lists/dicts of them) as JSON-ready dicts."""
+    if isinstance(content, list):
+        if content and hasattr(content[0], "_asdict"):
+            return [row._asdict() for row in content]
+        return [plain(item) for item in content]
+    if isinstance(content, dict):
+        return {key: plain(value) for key, value in content.items()}
+    if hasattr(content, "_asdict"):
+        return content._asdict()
+    return content
+
+
+def _through_schema(schema, content):
+    """What FastAPI's response_model handling would send for `content`."""
+    try:
+        from pydantic import TypeAdapter
+        return jsonable_encoder(TypeAdapter(schema).validate_python(content, from_attributes=True))
+    except ImportError:
+        from pydantic import parse_obj_as
+        return jsonable_encoder(parse_obj_as(schema, content))
+
+
+def _validate(schema, content, body: bytes):
+    expected = _through_schema(schema, content)
+    actual = json.loads(body)
+    if actual != expected:
+        raise AssertionError(f"Fast serialization drifted from {schema!r}: {actual!r} != {expected!r}")
+
+
+def encode(content, schema) -> bytes:
+    """JSON body for `content` shaped like `schema`; ORM objects go through the schema."""
+    content = plain(content)
+    try:
+        body = dumps(content)
+    except TypeError:
+        # ORM objects (relationship loader strategies, the current user)
+        return dumps(_through_schema(schema, content))
+    if settings.FAST_JSON_VALIDATE:
+        _validate(schema, content, body)
+    return body
+
+
+def respond(content, schema, response: Response = None):
+    """
+    Return `content` (rows or dicts shaped like `schema`) as a FastJSONResponse,
+    carrying over headers set on the endpoint's injected `response`. With FAST_JSON=0
+    the content is returned as-is for FastAPI's regular response_model handling.
+    """
+    if not settings.FAST_JSON:
+        return content
+    fast = Response(encode(content, schema), media_type="application/json")
+    if response is not None:
+        for key, value in response.headers.items():
+            if key != "content-length":
+                fast.headers[key] = value
+    return fast
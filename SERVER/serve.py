@@ -0,0 +1,60 @@
+"""
+Production launcher: migrate once, then run uvicorn with one worker per core.
+
+    python serve.py                      # WORKERS or the cores available to this process
+    python serve.py --workers 4 --port 8000
+
+The schema is migrated here, in the parent, before any worker starts. With more
+than one worker the workers share SSE events and cache invalidation through the
+notifications table (BROADCAST_BACKEND=sqlite), only one of them runs the dose
+scheduler and escalation engine (SCHEDULER_LOCK_FILE), the response cache is
+the shared SQLite backend (emptied here at every start) and lumi.db is opened in
+WAL mode with busy retries on writes.
+"""
+import argparse
+import os
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS / Windows
+        return os.cpu_count() or 1
+
+
+def main():
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Run the Lumi API with multiple worker processes.")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS or available_cores())
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--no-migrate", action="store_true", help="skip the migrate step (already run by the deploy)")
+    args = parser.parse_args()
+
+    if not args.no_migrate:
+        import migrations
+        applied = migrations.upgrade()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+
+    if args.workers > 1:
+        if settings.LOG_WRITE_BEHIND:
+            # Queued writes live in one worker's memory; another worker's reads would miss them
+            raise SystemExit("LOG_WRITE_BEHIND=1 needs a single worker (--workers 1)")
+        # Inherited by the worker processes, whose settings are read at import
+        if settings.DATABASE_URL.startswith("sqlite") and settings.SQLITE_JOURNAL_MODE.lower() != "wal":
+            raise SystemExit("Multiple workers on SQLite need SQLITE_JOURNAL_MODE=WAL")
+        os.environ.setdefault("BROADCAST_BACKEND", "sqlite")
+        os.environ.setdefault("RESPONSE_CACHE", "sqlite")
+        os.environ.setdefault("SCHEDULER_LOCK_FILE", os.path.abspath(".lumi-scheduler.lock"))
+    os.environ["AUTO_MIGRATE"] = "0"
+    # Cached bodies and versions from the previous run may not match lumi.db any more
+    import response_cache
+    response_cache.clear(os.environ.get("RESPONSE_CACHE_PATH"))
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
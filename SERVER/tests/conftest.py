@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+# In-process tests run against a throwaway SQLite file; this must be set before the
+# app modules (and their engine) are imported.
+_tmpdir = tempfile.mkdtemp(prefix="lumi-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'test.db')}")
+# ...and so does RESPONSE_CACHE=sqlite: a cache left by an earlier run would answer for reused user ids
+os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(_tmpdir, "cache.db"))
+# Every fast-path JSON response is re-checked against its response schema
+os.environ.setdefault("FAST_JSON_VALIDATE", "1")
+# Fresh database per run: let the app lifespan apply migrations
+os.environ.setdefault("AUTO_MIGRATE", "1")
+# Admission control is opt-in; the suite runs with it on so its lanes and limits are covered
+os.environ.setdefault("ADMISSION_ENABLED", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register_user(client):
+    def _register(prefix="Test"):
+        phone = str(uuid.uuid4().int)[:10]
+        resp = client.post("/auth/register", json={
+            "fullname": f"{prefix} User",
+            "phone": phone,
+            "dob": "1980-01-01",
+            "blood_group": "O+",
+            "address": f"{prefix} Address",
+        })
+        assert resp.status_code == 200, resp.text
+        return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    return _register
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_queries():
+    """Context manager collecting every SQL statement sent through the app engine."""
+    from sqlalchemy import event
+    from database import engine
+
+    @contextmanager
+    def _count():
+        counter = QueryCounter()
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            counter.statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return _count
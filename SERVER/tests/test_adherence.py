@@ -0,0 +1,63 @@
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import adherence
+
+
+def test_contribution_counts_status_and_delay():
+    day = date(2024, 3, 4)
+    taken = adherence.contribution(day, "taken", datetime(2024, 3, 4, 8, 20), "08:00")
+    assert taken["taken"] == 1 and taken["delay_minutes_total"] == 20 and taken["delay_samples"] == 1
+
+    missed = adherence.contribution(day, "missed", None, "08:00")
+    assert missed["missed"] == 1 and missed["delay_samples"] == 0
+
+    assert adherence.contribution(day, "taken", datetime(2024, 3, 4, 9), "not a time")["delay_samples"] == 0
+
+
+@pytest.mark.parametrize("tz", ["Asia/Kolkata", "America/New_York"])
+def test_aware_taken_at_is_compared_in_the_schedule_zone(monkeypatch, tz):
+    # The web client sends UTC (toISOString); scheduled_time is local wall-clock time
+    monkeypatch.setenv("TZ", tz)
+    time.tzset()
+    try:
+        day = date(2024, 3, 4)
+        local_taken = datetime(2024, 3, 4, 8, 20)
+        utc_taken = local_taken.astimezone().astimezone(timezone.utc)
+        assert adherence.contribution(day, "taken", utc_taken, "08:00")["delay_minutes_total"] == 20
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_stats_follow_log_writes(client, register_user):
+    headers = register_user("Stats")
+    monday = date.today() - timedelta(days=date.today().weekday() + 7)
+    med = client.post("/medications/", json={
+        "name": "Metformin", "dosage": "500mg", "scheduled_time": "08:00", "start_date": str(monday),
+    }, headers=headers).json()
+
+    def log(day, status, taken_at=None):
+        resp = client.post(f"/medications/{med['id']}/log", json={
+            "medication_id": med["id"], "status": status, "date": str(day), "taken_at": taken_at,
+        }, headers=headers)
+        assert resp.status_code == 200, resp.text
+
+    log(monday, "pending")
+    log(monday, "taken", f"{monday}T08:10:00")  # overwrite: pending -> taken
+    client.post("/medications/logs/batch", json={"logs": [
+        {"medication_id": med["id"], "status": "missed", "date": str(monday + timedelta(days=1))},
+        {"medication_id": med["id"], "status": "taken", "date": str(monday + timedelta(days=2)), "taken_at": f"{monday + timedelta(days=2)}T07:50:00"},
+    ]}, headers=headers)
+
+    params = {"start_date": str(monday), "end_date": str(monday + timedelta(days=6))}
+    daily = client.get("/medications/stats", params=params, headers=headers).json()
+    assert [(d["taken"], d["missed"], d["pending"]) for d in daily] == [(1, 0, 0), (0, 1, 0), (1, 0, 0)]
+    assert daily[0]["mean_delay_minutes"] == 10
+
+    weekly = client.get("/medications/stats", params={**params, "period": "week"}, headers=headers).json()
+    assert len(weekly) == 1
+    assert (weekly[0]["taken"], weekly[0]["missed"], weekly[0]["pending"]) == (2, 1, 0)
+    assert weekly[0]["mean_delay_minutes"] == 0
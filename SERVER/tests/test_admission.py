@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionController, AdmissionMiddleware, TokenBucket
+
+
+def test_routes_are_classified_into_lanes():
+    assert admission.classify("POST", "/emergency/") == admission.EMERGENCY
+    assert admission.classify("POST", "/emergency/12/resolve") == admission.EMERGENCY
+    assert admission.classify("GET", "/emergency/stream") is None
+    assert admission.classify("GET", "/medications/logs") == admission.BULK
+    assert admission.classify("POST", "/medications/logs/batch") == admission.BULK
+    assert admission.classify("POST", "/medications/3/log") == admission.INTERACTIVE
+    assert admission.classify("OPTIONS", "/medications/logs") is None
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2, burst=2)
+    now = bucket.updated
+    assert bucket.take(now) == 0 and bucket.take(now) == 0
+    assert bucket.take(now) == 0.5
+    assert bucket.take(now + 0.5) == 0
+
+
+def test_freed_slots_go_to_interactive_before_bulk():
+    async def scenario():
+        control = AdmissionController(max_concurrency=1, bulk_concurrency=1, queue_timeout=5)
+        assert await control.acquire(admission.BULK)
+        order = []
+
+        async def request(lane):
+            assert await control.acquire(lane)
+            order.append(lane)
+            control.release(lane)
+
+        bulk = asyncio.ensure_future(request(admission.BULK))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(request(admission.INTERACTIVE))
+        await asyncio.sleep(0)
+        assert control.stats()["queue_depth"] == {admission.INTERACTIVE: 1, admission.BULK: 1}
+        control.release(admission.BULK)
+        await asyncio.gather(bulk, interactive)
+        return order, control
+
+    order, control = asyncio.run(scenario())
+    assert order == [admission.INTERACTIVE, admission.BULK]
+    assert control.active == 0
+
+
+def test_full_queues_shed_but_emergency_is_always_admitted():
+    sent = []
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/medications/logs":
+            await asyncio.sleep(0.2)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    def call(middleware, method, path):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": method, "path": path, "headers": [], "client": ("10.0.0.1", 1)}
+        sent.append(messages)
+        return middleware(scope, None, send)
+
+    async def scenario():
+        control = AdmissionController(max_concurrency=1, bulk_concurrency=1, bulk_queue_limit=1, queue_timeout=0.05, user_rate=0)
+        middleware = AdmissionMiddleware(app, control)
+        await asyncio.gather(
+            call(middleware, "GET", "/medications/logs"),   # runs
+            call(middleware, "GET", "/medications/logs"),   # queued, times out
+            call(middleware, "GET", "/medications/logs"),   # queue full
+            call(middleware, "POST", "/emergency/"),        # bypasses the lanes
+        )
+        return control
+
+    control = asyncio.run(scenario())
+    statuses = [messages[0]["status"] for messages in sent]
+    assert statuses == [200, 503, 503, 200]
+    assert (b"retry-after", b"1") in sent[2][0]["headers"]
+    assert control.stats()["shed"] == {"bulk:queue_timeout": 1, "bulk:queue_full": 1}
+    assert control.admitted[admission.EMERGENCY] == 1
+
+
+@pytest.mark.skipif(not admission.settings.ADMISSION_ENABLED, reason="AdmissionMiddleware is not installed")
+def test_user_rate_limit_answers_429(client, register_user):
+    headers = register_user("Rate")
+    control = admission.controller
+    rate, burst = control.user_rate, control.user_burst
+    control.user_rate, control.user_burst = 1, 2
+    control._user_buckets.clear()
+    try:
+        statuses = [client.get("/nominees/", headers=headers).status_code for _ in range(3)]
+        assert client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).status_code == 200
+    finally:
+        control.user_rate, control.user_burst = rate, burst
+        control._user_buckets.clear()
+    assert statuses == [200, 200, 429]
+
+
+def test_auth_routes_have_their_own_per_address_buckets(monkeypatch):
+    monkeypatch.setattr(admission.settings, "RATE_LIMIT_TRUSTED_PROXIES", {"10.0.0.1"})
+    statuses = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    def call(middleware, path, forwarded_for):
+        scope = {"type": "http", "method": "POST", "path": path, "client": ("10.0.0.1", 1),
+                 "headers": [(b"x-forwarded-for", forwarded_for.encode())]}
+        return middleware(scope, None, send)
+
+    async def scenario():
+        control = AdmissionController(user_rate=1, user_burst=1, auth_rate=1, auth_burst=2)
+        middleware = AdmissionMiddleware(app, control)
+        await call(middleware, "/nominees/", "203.0.113.7")        # uses up the address's user bucket
+        await call(middleware, "/auth/login", "203.0.113.7")       # separate bucket
+        await call(middleware, "/auth/login", "203.0.113.7")
+        await call(middleware, "/auth/login", "203.0.113.7")       # over the auth burst
+        await call(middleware, "/auth/login", "1.2.3.4, 198.51.100.9")  # another client behind the proxy
+
+    asyncio.run(scenario())
+    assert statuses == [200, 200, 200, 429, 200]
+    assert admission._client_address({"client": ("192.0.2.1", 1), "headers": [(b"x-forwarded-for", b"1.2.3.4")]}) == "192.0.2.1"
+
+
+def test_client_key_hashes_the_token_without_decoding_it(monkeypatch):
+    import dependencies
+    monkeypatch.setattr(dependencies, "_token_data", lambda token: pytest.fail("token decoded in the middleware"))
+
+    def scope(token):
+        return {"client": ("10.0.0.1", 1), "headers": [(b"authorization", b"Bearer " + token)]}
+
+    assert admission._client_key(scope(b"abc")) == admission._client_key(scope(b"abc")) != admission._client_key(scope(b"abd"))
+    assert admission._client_key({"client": ("10.0.0.1", 1), "headers": []}) == "addr:10.0.0.1"
@@ -0,0 +1,31 @@
+"""
+The async router tree (DB_ASYNC=1) is chosen when main is imported, so it is
+exercised by running the route tests again in a separate interpreter.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from config import settings
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTE_TESTS = ["tests/test_medication_logs.py", "tests/test_response_cache.py", "tests/test_query_counts.py", "tests/test_emergency.py"]
+
+
+@pytest.mark.skipif(settings.DB_ASYNC, reason="the whole run already uses the async routers")
+@pytest.mark.parametrize("cache", ["memory", "sqlite"])
+def test_route_tests_pass_with_async_routers(tmp_path, cache):
+    env = {
+        **os.environ,
+        "DB_ASYNC": "1",
+        "RESPONSE_CACHE": cache,
+        "RESPONSE_CACHE_PATH": str(tmp_path / "cache.db"),
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'async.db'}",
+    }
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", *ROUTE_TESTS],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True, timeout=300,
+    )
+    assert result.returncode == 0, result.stdout[-4000:]
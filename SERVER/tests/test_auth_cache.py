@@ -0,0 +1,43 @@
+import dependencies
+import response_cache
+from config import settings
+
+
+def _me(client, headers):
+    return client.get("/users/me", headers=headers).json()
+
+
+def test_principal_and_token_caches_count_hits(client, register_user, count_queries):
+    headers = register_user("Hits")
+    client.get("/dashboard/", headers=headers)
+    principals, tokens = dependencies.principal_cache.stats(), dependencies.token_cache.stats()
+
+    with count_queries() as queries:
+        client.get("/dashboard/", headers=headers)
+    assert not any("FROM users" in statement for statement in queries.statements)
+    assert dependencies.principal_cache.stats()["hits"] == principals["hits"] + 1
+    assert dependencies.token_cache.stats()["hits"] == tokens["hits"] + 1
+    if settings.METRICS_ENABLED:
+        stats = client.get("/stats").json()
+        assert stats["auth_cache"]["hits"] > principals["hits"] and stats["token_cache"]["hits"] > tokens["hits"]
+
+
+def test_update_is_not_served_a_stale_principal(client, register_user, monkeypatch):
+    # Without the response cache /users/me returns the principal itself
+    monkeypatch.setattr(response_cache, "backend", None)
+    headers = register_user("Stale")
+    phone = _me(client, headers)["phone"]
+    assert dependencies.principal_cache.get(phone)["fullname"] == "Stale User"
+
+    client.put("/users/me", json={"fullname": "Fresh User", "phone": phone, "dob": "1980-01-01", "blood_group": "A+"}, headers=headers)
+    assert dependencies.principal_cache.get(phone) is None
+    assert _me(client, headers)["fullname"] == "Fresh User"
+    assert dependencies.principal_cache.get(phone)["fullname"] == "Fresh User"
+
+
+def test_register_drops_a_cached_principal_for_the_phone(client):
+    phone = "5550001234"
+    dependencies.principal_cache.set(phone, {"id": -1, "phone": phone, "fullname": "Someone Else"})
+    resp = client.post("/auth/register", json={"fullname": "New Owner", "phone": phone, "dob": "1990-01-01", "blood_group": "B+"})
+    assert resp.status_code == 200
+    assert dependencies.principal_cache.get(phone) is None
@@ -0,0 +1,58 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+import broadcast
+import database
+import events
+import migrations
+
+
+def _engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    migrations.upgrade(engine)
+    return engine
+
+
+def test_notifications_reach_every_subscriber_once():
+    # Two notifiers on one database stand in for two worker processes
+    engine = _engine()
+    worker_a, worker_b = broadcast.SQLiteNotifier(engine), broadcast.SQLiteNotifier(engine)
+    received = []
+    worker_a.subscribe("auth.invalidate", lambda phone: received.append(("a", phone)))
+    worker_b.subscribe("auth.invalidate", lambda phone: received.append(("b", phone)))
+
+    worker_a.publish("auth.invalidate", "123")
+    assert worker_a.poll() == 1 and worker_b.poll() == 1
+    assert worker_a.poll() == 0
+    assert sorted(received) == [("a", "123"), ("b", "123")]
+
+
+def test_notifier_broker_fans_out_through_the_table():
+    notifier = broadcast.SQLiteNotifier(_engine())
+    hub = events.EventHub(broker=broadcast.NotifierBroker(notifier))
+
+    async def scenario():
+        with hub.subscribe(7) as queue:
+            hub.publish(7, {"type": "alert", "data": {"id": 1}})
+            assert queue.empty()
+            notifier.poll()
+            return await asyncio.wait_for(queue.get(), 1)
+
+    assert asyncio.run(scenario()) == {"type": "alert", "data": {"id": 1}}
+
+
+def test_retry_on_busy_retries_only_lock_errors(monkeypatch):
+    monkeypatch.setattr(database.time, "sleep", lambda seconds: None)
+    calls = []
+
+    @database.retry_on_busy
+    def write():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return "ok"
+
+    assert write() == "ok" and len(calls) == 3
@@ -0,0 +1,21 @@
+from datetime import date
+
+
+def test_unchanged_dashboard_answers_304_until_a_write(client, register_user):
+    headers = register_user("Etag")
+    first = client.get("/dashboard/", headers=headers)
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and etag.startswith('W/"')
+
+    again = client.get("/dashboard/", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag and again.content == b""
+    assert client.get("/dashboard/", headers={**headers, "If-None-Match": 'W/"other", ' + etag}).status_code == 304
+
+    med = client.post("/medications/", json={"name": "Aspirin", "dosage": "100mg", "scheduled_time": "08:00", "start_date": str(date.today())}, headers=headers).json()
+    changed = client.get("/dashboard/", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert [m["id"] for m in changed.json()["medications"]] == [med["id"]]
+
+    client.post(f"/medications/{med['id']}/log", json={"medication_id": med["id"], "date": str(date.today()), "status": "taken"}, headers=headers)
+    logged = client.get("/dashboard/", headers={**headers, "If-None-Match": changed.headers["etag"]})
+    assert logged.status_code == 200 and logged.headers["etag"] != changed.headers["etag"]
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import database
+import dispatch
+import models
+
+
+class FlakyGateway(dispatch.LoggingGateway):
+    """Fails the first send to each number, and every send to a blocked number."""
+
+    concurrency = 2
+
+    def __init__(self):
+        super().__init__(delay=0.01)
+        self.seen = set()
+        self.active = 0
+        self.peak = 0
+
+    async def send(self, channel, phone, message):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            if phone == "blocked":
+                raise dispatch.DeliveryError("invalid number", permanent=True)
+            if phone not in self.seen:
+                self.seen.add(phone)
+                raise dispatch.DeliveryError("provider timeout")
+            await super().send(channel, phone, message)
+        finally:
+            self.active -= 1
+
+
+def _outbox(alert_id):
+    with database.engine.connect() as conn:
+        return conn.execute(dispatch.outbox.select().where(dispatch.outbox.c.alert_id == alert_id).order_by(dispatch.outbox.c.id)).all()
+
+
+def test_trigger_queues_one_message_per_nominee(client, register_user):
+    headers = register_user("Outbox")
+    for n in range(3):
+        client.post("/nominees/", json={"name": f"N{n}", "relationship": "child", "phone": f"90000000{n}"}, headers=headers)
+
+    alert = client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()
+    # A stage change on the same alert does not notify again
+    client.post("/emergency/", json={"stage": "calling_ambulance"}, headers=headers)
+    rows = _outbox(alert["id"])
+    assert [(r.phone, r.status) for r in rows] == [(f"90000000{n}", "pending") for n in range(3)]
+
+    client.post(f"/emergency/{alert['id']}/resolve", headers=headers)
+    assert len(_outbox(alert["id"])) == 6
+
+
+def test_stage_change_in_the_same_instant_does_not_notify_again(client, register_user, monkeypatch):
+    from datetime import datetime
+    from routers import emergency
+
+    frozen = datetime.utcnow()
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return frozen
+
+    monkeypatch.setattr(emergency, "datetime", FrozenDatetime)
+    headers = register_user("Instant")
+    client.post("/nominees/", json={"name": "Kin", "relationship": "child", "phone": "900000100"}, headers=headers)
+    alert = client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()
+    client.post("/emergency/", json={"stage": "waiting_response"}, headers=headers)
+    assert len(_outbox(alert["id"])) == 1
+    client.post(f"/emergency/{alert['id']}/resolve", headers=headers)
+
+
+def test_dispatcher_retries_and_respects_provider_limit(client, register_user, monkeypatch):
+    monkeypatch.setattr(dispatch, "backoff", lambda attempts: 0)
+    headers = register_user("Dispatch")
+    for phone in ("911000001", "911000002", "911000003", "911000004", "blocked"):
+        client.post("/nominees/", json={"name": phone, "relationship": "friend", "phone": phone}, headers=headers)
+    alert = client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()
+
+    gateway = FlakyGateway()
+
+    async def scenario():
+        dispatcher = dispatch.Dispatcher(gateway, poll_interval=0.01)
+        dispatcher.start()
+        for _ in range(300):
+            rows = _outbox(alert["id"])
+            if all(r.status in ("sent", "failed") for r in rows):
+                break
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return dispatcher.stats
+
+    stats = asyncio.run(scenario())
+    rows = {r.phone: r for r in _outbox(alert["id"])}
+    assert rows["blocked"].status == "failed" and rows["blocked"].attempts == 1
+    assert all(rows[p].status == "sent" and rows[p].attempts == 2 for p in rows if p != "blocked")
+    assert stats["failed"] == 1
+    assert gateway.peak <= FlakyGateway.concurrency
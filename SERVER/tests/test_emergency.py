@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+
+import migrations
+
+
+def _active(client, headers):
+    return client.get("/dashboard/", headers=headers).json()["active_alert"]
+
+
+def test_concurrent_triggers_share_one_active_alert(client, register_user):
+    headers = register_user("Burst")
+    stages = ["voice_alert", "waiting_response"] * 8
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda stage: client.post("/emergency/", json={"stage": stage}, headers=headers), stages))
+
+    assert all(r.status_code == 200 for r in results)
+    assert len({r.json()["id"] for r in results}) == 1
+
+    alert_id = results[0].json()["id"]
+    client.post(f"/emergency/{alert_id}/resolve", headers=headers)
+    assert _active(client, headers) is None
+    # A new trigger after resolving opens a new alert
+    assert client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()["id"] != alert_id
+
+
+def test_idempotency_key_replays_first_response(client, register_user):
+    headers = register_user("Retry")
+    first = client.post("/emergency/", json={"stage": "voice_alert"}, headers={**headers, "Idempotency-Key": "tap-1"})
+    replay = client.post("/emergency/", json={"stage": "calling_ambulance"}, headers={**headers, "Idempotency-Key": "tap-1"})
+
+    assert replay.json() == first.json()
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert _active(client, headers)["stage"] == "voice_alert"
+
+    # Keys are scoped per user
+    other = register_user("Other")
+    assert "idempotent-replayed" not in client.post("/emergency/", json={"stage": "voice_alert"}, headers={**other, "Idempotency-Key": "tap-1"}).headers
+
+
+def test_migration_keeps_newest_duplicate_active_alert():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        # Pre-migration table: no partial unique index yet
+        conn.exec_driver_sql("CREATE TABLE emergency_alerts (id INTEGER PRIMARY KEY, user_id INTEGER, stage VARCHAR, is_active BOOLEAN, created_at DATETIME, resolved_at DATETIME)")
+        conn.exec_driver_sql("INSERT INTO emergency_alerts (user_id, stage, is_active) VALUES (1, 'a', 1), (1, 'b', 1), (2, 'c', 1)")
+        migrations._single_active_alert(conn)
+        active = conn.execute(text("SELECT id FROM emergency_alerts WHERE is_active = 1 ORDER BY id")).scalars().all()
+    assert active == [2, 3]
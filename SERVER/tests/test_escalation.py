@@ -0,0 +1,70 @@
+import time
+from datetime import datetime, timedelta
+
+import escalation
+from escalation import EscalationEngine
+
+
+def _active(client, headers):
+    return client.get("/dashboard/", headers=headers).json()["active_alert"]
+
+
+def test_stages_only_move_forward(client, register_user):
+    headers = register_user("Forward")
+    first = client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()
+    assert first["escalate_at"] is not None
+
+    moved = client.post("/emergency/", json={"stage": "notifying_relatives"}, headers=headers).json()
+    assert moved["stage"] == "notifying_relatives" and moved["escalate_at"] > first["escalate_at"]
+    # A late tap from the first screen does not undo the escalation
+    late = client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()
+    assert (late["stage"], late["escalate_at"]) == ("notifying_relatives", moved["escalate_at"])
+
+    assert client.post("/emergency/", json={"stage": "panic"}, headers=headers).status_code == 422
+
+
+def test_engine_advances_and_skips_resolved_alerts(client, register_user):
+    headers = register_user("Escalate")
+    client.post("/nominees/", json={"name": "Kin", "relationship": "child", "phone": "700000201"}, headers=headers)
+    alert = client.post("/emergency/", json={"stage": "waiting_response"}, headers=headers).json()
+
+    clock = {"now": datetime.utcnow()}
+    engine = EscalationEngine(now=lambda: clock["now"])
+    assert engine.load() >= 1 and alert["id"] in engine.timers
+
+    def fire(after):
+        clock["now"] += after
+        batch = [item for item in engine.timers.pop_due(now=escalation._timestamp(clock["now"]) + 1) if item[0] == alert["id"]]
+        engine.process(batch)
+        return batch
+
+    assert fire(timedelta(seconds=1)) == []
+    assert len(fire(timedelta(seconds=escalation.STAGES["waiting_response"].timeout))) == 1
+    assert _active(client, headers)["stage"] == "notifying_relatives"
+    assert alert["id"] in engine.timers
+
+    client.post(f"/emergency/{alert['id']}/resolve", headers=headers)
+    assert len(fire(timedelta(seconds=escalation.STAGES["notifying_relatives"].timeout))) == 1
+    assert engine.stats == {"escalated": 1, "stale": 1, "failed_batches": 0}
+    assert alert["id"] not in engine.timers
+
+
+def test_running_engine_escalates_within_a_second(client, register_user, monkeypatch):
+    monkeypatch.setitem(escalation.STAGES, "voice_alert", escalation.STAGES["voice_alert"]._replace(timeout=0.2))
+    assert escalation.engine.running
+    headers = register_user("Timer")
+    client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers)
+
+    deadline = time.monotonic() + 1.2
+    while _active(client, headers)["stage"] == "voice_alert" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert _active(client, headers)["stage"] == "waiting_response"
+
+
+def test_only_the_running_engine_takes_broadcast_messages():
+    message = {"id": 1, "user_id": 1, "stage": "voice_alert", "escalate_at": datetime.utcnow().isoformat()}
+    idle, owner = EscalationEngine(), EscalationEngine()
+    owner.running = True
+    idle._on_message(message)
+    owner._on_message(message)
+    assert 1 not in idle.timers and 1 in owner.timers
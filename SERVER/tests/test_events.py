@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+from events import EventHub, format_sse
+
+
+def test_hub_fans_out_per_user_from_threads():
+    hub = EventHub()
+
+    async def scenario():
+        with hub.subscribe(1) as alice, hub.subscribe(1) as alice_tab, hub.subscribe(2) as bob:
+            # Sync endpoints publish from threadpool threads
+            publisher = threading.Thread(target=hub.publish, args=(1, {"type": "alert", "data": {"stage": "voice_alert"}}))
+            publisher.start()
+            publisher.join()
+
+            got = await asyncio.wait_for(alice.get(), timeout=1)
+            got_tab = await asyncio.wait_for(alice_tab.get(), timeout=1)
+            assert got == got_tab == {"type": "alert", "data": {"stage": "voice_alert"}}
+            assert bob.empty()
+        assert hub.subscriber_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_keeps_latest_events():
+    hub = EventHub(queue_size=2)
+
+    async def scenario():
+        with hub.subscribe(1) as queue:
+            for stage in ("a", "b", "c"):
+                hub.publish(1, {"type": "alert", "data": {"stage": stage}})
+            await asyncio.sleep(0)
+            stages = [queue.get_nowait()["data"]["stage"] for _ in range(queue.qsize())]
+            assert stages == ["b", "c"]
+
+    asyncio.run(scenario())
+
+
+def test_format_sse():
+    assert format_sse({"type": "alert", "data": {"id": 1}}) == 'event: alert\ndata: {"id": 1}\n\n'
+
+
+def test_stream_endpoint_authenticates_by_query_token(client, register_user):
+    import json
+    import main
+
+    headers = register_user("Stream")
+    alert = client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()
+    token = headers["Authorization"].split(" ", 1)[1]
+
+    assert client.get("/emergency/stream").status_code == 401
+    assert client.get("/emergency/stream", params={"access_token": token + "x"}).status_code == 401
+
+    # The stream never ends on its own: drive the app directly and hang up after the first event
+    async def scenario():
+        messages, gone = [], asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if message["type"] == "http.response.body" and b"\ndata: " in message.get("body", b""):
+                gone.set()
+
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+                 "path": "/emergency/stream", "raw_path": b"/emergency/stream", "root_path": "",
+                 "query_string": f"access_token={token}".encode(), "headers": [(b"host", b"testserver")],
+                 "client": ("127.0.0.1", 1), "server": ("testserver", 80)}
+        await asyncio.wait_for(main.app(scope, receive, send), timeout=10)
+        return messages
+
+    messages = asyncio.run(scenario())
+    assert messages[0]["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in messages[0]["headers"]
+    event = next(m["body"].decode() for m in messages[1:] if b"\ndata: " in m.get("body", b""))
+    name, data = event.strip().split("\n")
+    assert name == "event: alert" and json.loads(data[len("data: "):])["id"] == alert["id"]
+    client.post(f"/emergency/{alert['id']}/resolve", headers=headers)
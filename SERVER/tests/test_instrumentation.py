@@ -0,0 +1,53 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import instrumentation
+
+
+def _app():
+    engine = create_engine("sqlite://")
+    instrumentation.instrument_engine(engine)
+    app = FastAPI()
+    app.add_middleware(instrumentation.InstrumentationMiddleware)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        with engine.connect() as conn:
+            for _ in range(3):
+                conn.execute(text("SELECT 1"))
+        return {"id": item_id}
+
+    return app
+
+
+def test_server_timing_counts_statements_per_request():
+    client = TestClient(_app())
+    resp = client.get("/items/1")
+    assert resp.status_code == 200
+    timing = resp.headers["server-timing"]
+    assert timing.startswith("app;dur=")
+    assert 'desc="3 queries"' in timing
+
+
+def test_metrics_are_labelled_by_route_template():
+    client = TestClient(_app())
+    client.get("/items/1")
+    client.get("/items/2")
+    body = instrumentation.registry.render()
+    assert 'lumi_request_duration_seconds_count{method="GET",route="/items/{item_id}"}' in body
+    assert 'lumi_requests_total{method="GET",route="/items/{item_id}",status="200"}' in body
+    assert 'lumi_db_statements_total{route="/items/{item_id}"}' in body
+
+
+def test_failed_statements_do_not_leak_start_times():
+    engine = create_engine("sqlite://")
+    instrumentation.instrument_engine(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            try:
+                conn.execute(text("SELECT * FROM missing"))
+            except Exception:
+                pass
+        conn.execute(text("SELECT 1"))
+        assert conn.connection.info.get("lumi_query_start") == []
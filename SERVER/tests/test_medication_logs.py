@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+
+def _create_medication(client, headers):
+    resp = client.post("/medications/", json={
+        "name": "Aspirin", "dosage": "100mg", "scheduled_time": "08:00", "start_date": str(date.today() - timedelta(days=7)),
+    }, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_log_upsert_keeps_one_row_per_day(client, register_user):
+    headers = register_user("Upsert")
+    med = _create_medication(client, headers)
+    today = str(date.today())
+
+    first = client.post(f"/medications/{med['id']}/log", json={"medication_id": med["id"], "status": "pending", "date": today}, headers=headers)
+    second = client.post(f"/medications/{med['id']}/log", json={"medication_id": med["id"], "status": "taken", "date": today}, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["id"] == second.json()["id"]
+    assert second.json()["status"] == "taken"
+
+    logs = client.get("/medications/logs", params={"start_date": today, "end_date": today}, headers=headers).json()
+    assert [log["status"] for log in logs] == ["taken"]
+
+
+def test_log_requires_owned_medication(client, register_user):
+    owner = register_user("Owner")
+    other = register_user("Other")
+    med = _create_medication(client, owner)
+
+    resp = client.post(f"/medications/{med['id']}/log", json={"medication_id": med["id"], "status": "taken", "date": str(date.today())}, headers=other)
+    assert resp.status_code == 404
+
+
+def test_batch_log_ingestion(client, register_user):
+    headers = register_user("Batch")
+    other = register_user("BatchOther")
+    med_a = _create_medication(client, headers)
+    med_b = _create_medication(client, headers)
+    foreign = _create_medication(client, other)
+    day = date.today() - timedelta(days=1)
+
+    resp = client.post("/medications/logs/batch", json={"logs": [
+        {"medication_id": med_a["id"], "status": "pending", "date": str(day)},
+        {"medication_id": med_b["id"], "status": "missed", "date": str(day)},
+        {"medication_id": foreign["id"], "status": "taken", "date": str(day)},
+        {"medication_id": med_a["id"], "status": "taken", "date": str(day), "taken_at": f"{day}T08:05:00"},
+    ]}, headers=headers)
+
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["written"] == 2
+    assert [r["result"] for r in body["results"]] == ["written", "written", "not_found", "written"]
+    assert body["results"][0]["log"]["status"] == "taken"
+    assert body["results"][1]["log"]["status"] == "missed"
+
+    logs = client.get("/medications/logs", params={"start_date": str(day), "end_date": str(day)}, headers=headers).json()
+    assert sorted((log["medication_id"], log["status"]) for log in logs) == [(med_a["id"], "taken"), (med_b["id"], "missed")]
+
+
+def _log_days(client, headers, days):
+    med = _create_medication(client, headers)
+    start = date.today() - timedelta(days=days - 1)
+    client.post("/medications/logs/batch", json={"logs": [
+        {"medication_id": med["id"], "status": "taken", "date": str(start + timedelta(days=i))} for i in range(days)
+    ]}, headers=headers)
+    return start
+
+
+def test_logs_keyset_pagination(client, register_user):
+    headers = register_user("Pages")
+    start = _log_days(client, headers, 7)
+    params = {"start_date": str(start), "end_date": str(date.today()), "limit": 3}
+
+    pages, cursor = [], None
+    while True:
+        resp = client.get("/medications/logs", params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert resp.status_code == 200, resp.text
+        pages.append([log["date"] for log in resp.json()])
+        cursor = resp.headers.get("x-next-cursor")
+        if not cursor:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == [str(start + timedelta(days=i)) for i in range(7)]
+
+    assert client.get("/medications/logs", params={**params, "cursor": "bogus"}, headers=headers).status_code == 400
+
+
+def test_logs_ndjson_stream(client, register_user):
+    import json
+
+    headers = register_user("Stream")
+    start = _log_days(client, headers, 4)
+    resp = client.get("/medications/logs", params={"start_date": str(start), "end_date": str(date.today()), "format": "ndjson"}, headers=headers)
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert [row["date"] for row in rows] == [str(start + timedelta(days=i)) for i in range(4)]
+
+    # The cursor is checked before the stream starts
+    bad = client.get("/medications/logs", params={"start_date": str(start), "end_date": str(date.today()), "format": "ndjson", "cursor": "bogus"}, headers=headers)
+    assert bad.status_code == 400 and bad.json() == {"detail": "Invalid cursor"}
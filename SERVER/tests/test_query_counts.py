@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+
+import pytest
+
+from config import settings
+
+# Upper bound on SQL statements per request (auth lookup + the listing itself),
+# independent of how many rows the user has.
+MAX_STATEMENTS = {
+    "/medications/": 3,
+    "/nominees/": 3,
+    "/medications/logs": 2,
+    "/dashboard/": 5,
+}
+
+
+@pytest.fixture
+def populated_headers(client, register_user):
+    headers = register_user("Counter")
+    today = date.today()
+    for i in range(5):
+        client.post("/nominees/", json={"name": f"Nominee {i}", "relationship": "Friend", "phone": f"55500{i}"}, headers=headers)
+        med = client.post("/medications/", json={
+            "name": f"Med {i}", "dosage": "10mg", "scheduled_time": "08:00", "start_date": str(today - timedelta(days=7)),
+        }, headers=headers).json()
+        for d in range(3):
+            client.post(f"/medications/{med['id']}/log", json={
+                "medication_id": med["id"], "status": "taken", "date": str(today - timedelta(days=d)),
+            }, headers=headers)
+    return headers
+
+
+@pytest.mark.parametrize("strategy", ["projection", "selectin", "joined"])
+@pytest.mark.parametrize("path,params", [
+    ("/medications/", None),
+    ("/nominees/", None),
+    ("/medications/logs", {"start_date": str(date.today() - timedelta(days=7)), "end_date": str(date.today())}),
+    ("/dashboard/", None),
+])
+def test_listing_statement_budget(client, populated_headers, count_queries, monkeypatch, strategy, path, params):
+    monkeypatch.setitem(settings.LOADER_STRATEGIES, "medications.list", strategy)
+    monkeypatch.setitem(settings.LOADER_STRATEGIES, "nominees.list", strategy)
+
+    with count_queries() as queries:
+        resp = client.get(path, params=params, headers=populated_headers)
+
+    assert resp.status_code == 200, resp.text
+    assert len(resp.json()) > 0
+    assert queries.count <= MAX_STATEMENTS[path], "\n".join(queries.statements)
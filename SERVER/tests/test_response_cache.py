@@ -0,0 +1,71 @@
+import pytest
+
+import response_cache
+
+
+def test_repeat_reads_skip_the_database_until_a_write(client, register_user, count_queries):
+    headers = register_user("Cache")
+    client.post("/nominees/", json={"name": "A", "relationship": "child", "phone": "700000001"}, headers=headers)
+    first = client.get("/nominees/", headers=headers)
+    assert first.headers["x-cache"] == "miss"
+
+    with count_queries() as queries:
+        again = client.get("/nominees/", headers=headers)
+    assert again.headers["x-cache"] == "hit" and again.json() == first.json()
+    assert queries.count == 0, queries.statements
+
+    created = client.post("/nominees/", json={"name": "B", "relationship": "child", "phone": "700000002"}, headers=headers).json()
+    assert [n["name"] for n in client.get("/nominees/", headers=headers).json()] == ["A", "B"]
+    client.delete(f"/nominees/{created['id']}", headers=headers)
+    assert [n["name"] for n in client.get("/nominees/", headers=headers).json()] == ["A"]
+
+    client.get("/users/me", headers=headers)
+    client.put("/users/me", json={"fullname": "Renamed", "phone": "ignored", "dob": "1980-01-01", "blood_group": "A+"}, headers=headers)
+    assert client.get("/users/me", headers=headers).json()["fullname"] == "Renamed"
+
+
+def test_memory_backend_is_bounded_by_bytes():
+    backend = response_cache.MemoryBackend(max_bytes=10)
+    backend.set("a", b"12345")
+    backend.set("b", b"12345")
+    backend.get("a")
+    backend.set("c", b"123")
+    assert backend.get("b") is None and backend.get("a") == b"12345"
+    assert backend.size <= 10
+
+
+def test_memory_backend_bounds_versions_without_reviving_old_entries():
+    backend = response_cache.MemoryBackend(max_bytes=100, max_users=2)
+    stale = f"1:{backend.bump(1)}:/users/me"
+    backend.set(stale, b"old")
+    backend.bump(2)
+    backend.bump(3)  # evicts user 1's version
+
+    assert len(backend._versions) == 2
+    assert f"1:{backend.get_version(1)}:/users/me" != stale
+    assert backend.get(f"1:{backend.get_version(1)}:/users/me") is None
+
+
+def test_sqlite_backend_versions_and_pruning(tmp_path):
+    backend = response_cache.SQLiteBackend(str(tmp_path / "cache.db"), max_bytes=10)
+    assert backend.get_version(1) == 0
+    assert backend.bump(1) == 1 and backend.bump(1) == 2
+    # Another worker opening the same file sees the same versions
+    assert response_cache.SQLiteBackend(str(tmp_path / "cache.db"), max_bytes=10).get_version(1) == 2
+
+    for n in range(4):
+        backend.set(f"k{n}", b"1234")
+    backend.prune()
+    assert [backend.get(f"k{n}") is not None for n in range(4)] == [False, False, True, True]
+
+
+def test_clear_drops_versions_and_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = response_cache.SQLiteBackend(path, max_bytes=100)
+    backend.bump(1)
+    backend.set("1:1:/users/me", b"{}")
+    backend.engine.dispose()
+
+    response_cache.clear(path)
+    fresh = response_cache.SQLiteBackend(path, max_bytes=100)
+    assert fresh.get_version(1) == 0 and fresh.get("1:1:/users/me") is None
@@ -0,0 +1,111 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import broadcast
+import database
+import scheduling
+from schedule_times import parse_scheduled_time
+from scheduling import DoseScheduler
+from timers import TimerQueue
+
+
+@pytest.mark.parametrize("value,minutes", [
+    ("08:00", 480), ("8:05", 485), ("20:00:00", 1200), ("8:30 pm", 1230), ("12 AM", 0), ("later", None), (None, None),
+])
+def test_parse_scheduled_time(value, minutes):
+    assert parse_scheduled_time(value) == minutes
+
+
+def test_timer_queue_orders_and_cancels():
+    queue = TimerQueue(handler=None)
+    queue.schedule("b", 20)
+    queue.schedule("a", 10)
+    queue.schedule("c", 30)
+    queue.schedule("a", 25, "moved")  # reschedule replaces the old timer
+    queue.cancel("c")
+
+    assert queue.pop_due(now=15) == []
+    assert queue.pop_due(now=100) == [("b", None), ("a", "moved")]
+    assert len(queue) == 0
+
+
+def test_scheduler_creates_pending_then_missed_logs(client, register_user):
+    headers = register_user("Schedule")
+    today = date.today()
+    med = client.post("/medications/", json={
+        "name": "Aspirin", "dosage": "100mg", "scheduled_time": "8:00 AM", "start_date": str(today), "end_date": str(today),
+    }, headers=headers).json()
+
+    clock = {"now": datetime.combine(today, datetime.min.time()) + timedelta(hours=7)}
+    scheduler = DoseScheduler(missed_after_minutes=60, now=lambda: clock["now"])
+    assert scheduler.load() >= 1
+
+    def fire_until(moment):
+        clock["now"] = moment
+        batch = [item for item in scheduler.timers.pop_due(now=moment.timestamp()) if item[0] == med["id"]]
+        scheduler.process(batch)
+        return batch
+
+    def statuses():
+        logs = client.get("/medications/logs", params={"start_date": str(today), "end_date": str(today)}, headers=headers).json()
+        return [log["status"] for log in logs if log["medication_id"] == med["id"]]
+
+    assert fire_until(clock["now"]) == []
+    assert [dose.kind for _, dose in fire_until(clock["now"] + timedelta(hours=1, minutes=1))] == ["due"]
+    assert statuses() == ["pending"]
+
+    assert [dose.kind for _, dose in fire_until(clock["now"] + timedelta(hours=1))] == ["miss"]
+    assert statuses() == ["missed"]
+    # end_date reached: nothing re-armed for tomorrow
+    assert med["id"] not in scheduler.timers
+
+    stats = client.get("/medications/stats", params={"start_date": str(today), "end_date": str(today)}, headers=headers).json()
+    assert [(s["medication_id"], s["missed"]) for s in stats] == [(med["id"], 1)]
+
+
+def test_load_records_doses_missed_while_down(client, register_user):
+    headers = register_user("Backfill")
+    today = date.today()
+    med = client.post("/medications/", json={
+        "name": "Statin", "dosage": "10mg", "scheduled_time": "08:00", "start_date": str(today - timedelta(days=3)),
+    }, headers=headers).json()
+    client.post(f"/medications/{med['id']}/log", json={
+        "medication_id": med["id"], "date": str(today - timedelta(days=3)), "status": "taken",
+    }, headers=headers)
+
+    scheduler = DoseScheduler(missed_after_minutes=60, now=lambda: datetime.combine(today, datetime.min.time()) + timedelta(hours=7))
+    scheduler.load()
+
+    logs = client.get("/medications/logs", params={"start_date": str(today - timedelta(days=3)), "end_date": str(today)}, headers=headers).json()
+    assert [(log["date"], log["status"]) for log in sorted(logs, key=lambda log: log["date"]) if log["medication_id"] == med["id"]] == [
+        (str(today - timedelta(days=3)), "taken"), (str(today - timedelta(days=2)), "missed"), (str(today - timedelta(days=1)), "missed"),
+    ]
+    # Today's dose is still ahead
+    assert med["id"] in scheduler.timers
+
+
+def test_medication_created_on_another_worker_is_armed_by_the_owner(client, register_user, monkeypatch):
+    # This process handles the request without running the scheduler; `owner` stands in
+    # for the worker holding the scheduler lock, reached through the notifications table
+    monkeypatch.setattr(scheduling, "scheduler", DoseScheduler())
+    notifier = broadcast.SQLiteNotifier(database.engine, poll_interval=3600)
+    monkeypatch.setattr(broadcast, "notifier", notifier)
+    owner = DoseScheduler()
+    owner.running = True
+    notifier.subscribe(scheduling.CHANNEL, owner._on_message)
+    notifier.subscribe(scheduling.CHANNEL, scheduling.scheduler._on_message)
+    notifier.start()
+    try:
+        headers = register_user("Remote")
+        med = client.post("/medications/", json={
+            "name": "Insulin", "dosage": "10u", "scheduled_time": "21:00", "start_date": str(date.today()),
+        }, headers=headers).json()
+        notifier.poll()
+    finally:
+        notifier.stop()
+
+    [(med_id, dose)] = owner.timers.pop_due(now=float("inf"))
+    assert (med_id, dose.user_id, dose.minutes, dose.start_date) == (med["id"], med["user_id"], 21 * 60, date.today())
+    # The handling worker keeps no timers of its own
+    assert med["id"] not in scheduling.scheduler.timers
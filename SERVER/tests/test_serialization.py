@@ -0,0 +1,25 @@
+from datetime import date, datetime
+from typing import List
+
+import pytest
+
+import schemas
+import serialization
+
+
+def test_fast_path_matches_schema_encoding(client, register_user):
+    headers = register_user("Serialize")
+    med = client.post("/medications/", json={"name": "Aspirin", "dosage": "100mg", "scheduled_time": "08:00", "start_date": "2024-01-01"}, headers=headers).json()
+    client.post(f"/medications/{med['id']}/log", json={"medication_id": med["id"], "date": "2024-01-02", "status": "taken", "taken_at": "2024-01-02T08:05:30.250000"}, headers=headers)
+
+    # FAST_JSON_VALIDATE (conftest) raises inside the endpoint if the encodings differ
+    resp = client.get("/medications/logs", params={"start_date": "2024-01-01", "end_date": "2024-01-31"}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/json"
+    assert resp.json()[0]["taken_at"] == "2024-01-02T08:05:30.250000"
+
+
+def test_drift_is_detected():
+    row = {"id": 1, "medication_id": 2, "user_id": 3, "status": "taken", "taken_at": datetime(2024, 1, 2, 8), "date": date(2024, 1, 2), "extra": 1}
+    with pytest.raises(AssertionError):
+        serialization._validate(List[schemas.MedicationLog], [row], serialization.dumps([row]))
@@ -0,0 +1,23 @@
+from sqlalchemy import create_engine
+
+import migrations
+from config import settings
+
+
+def test_ready_after_lifespan_startup(client):
+    resp = client.get("/ready")
+    assert resp.status_code == 200
+    assert resp.json() == {"ready": True, "schema_version": migrations.latest_version()}
+
+
+def test_stats_are_served_only_with_metrics_enabled(client):
+    assert client.get("/stats").status_code == (200 if settings.METRICS_ENABLED else 404)
+
+
+def test_unmigrated_database_reports_pending_versions():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        assert migrations.pending(conn) == sorted(version for version, _, _ in migrations.MIGRATIONS)
+    migrations.upgrade(engine)
+    with engine.connect() as conn:
+        assert migrations.pending(conn) == []
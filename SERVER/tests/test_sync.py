@@ -0,0 +1,55 @@
+from datetime import date
+
+
+def test_full_sync_then_deltas(client, register_user):
+    headers = register_user("Sync")
+    med = client.post("/medications/", json={"name": "Aspirin", "dosage": "100mg", "scheduled_time": "08:00", "start_date": "2024-01-01"}, headers=headers).json()
+    nominee = client.post("/nominees/", json={"name": "A", "relationship": "child", "phone": "700000101"}, headers=headers).json()
+
+    full = client.get("/sync", headers=headers).json()
+    assert full["full"] and full["deleted"] == []
+    assert [m["id"] for m in full["medications"]] == [med["id"]]
+    assert [n["id"] for n in full["nominees"]] == [nominee["id"]]
+    version = full["version"]
+
+    # Nothing changed since the last sync
+    empty = client.get(f"/sync?since={version}", headers=headers).json()
+    assert empty["version"] == version and not empty["full"]
+    assert not any(empty[key] for key in ("medications", "nominees", "logs", "alerts", "deleted"))
+
+    # Only the changed rows come back, plus a tombstone for the delete
+    today = date.today().isoformat()
+    client.post(f"/medications/{med['id']}/log", json={"status": "taken", "medication_id": med["id"], "date": today}, headers=headers)
+    client.delete(f"/nominees/{nominee['id']}", headers=headers)
+    delta = client.get(f"/sync?since={version}", headers=headers).json()
+    assert delta["version"] == version + 2
+    assert delta["medications"] == [] and delta["nominees"] == []
+    assert [(log["medication_id"], log["status"]) for log in delta["logs"]] == [(med["id"], "taken")]
+    assert delta["deleted"] == [{"entity": "nominee", "id": nominee["id"]}]
+
+    # Updating the same log moves it to a new version
+    version = delta["version"]
+    client.post(f"/medications/{med['id']}/log", json={"status": "missed", "medication_id": med["id"], "date": today}, headers=headers)
+    delta = client.get(f"/sync?since={version}", headers=headers).json()
+    assert [log["status"] for log in delta["logs"]] == ["missed"] and delta["deleted"] == []
+
+
+def test_alert_changes_are_synced(client, register_user):
+    headers = register_user("SyncAlert")
+    version = client.get("/sync", headers=headers).json()["version"]
+    alert = client.post("/emergency/", json={"stage": "voice_alert"}, headers=headers).json()
+    client.post("/emergency/", json={"stage": "waiting_response"}, headers=headers)
+    delta = client.get(f"/sync?since={version}", headers=headers).json()
+    assert [(a["id"], a["stage"]) for a in delta["alerts"]] == [(alert["id"], "waiting_response")]
+
+    version = delta["version"]
+    client.post(f"/emergency/{alert['id']}/resolve", headers=headers)
+    delta = client.get(f"/sync?since={version}", headers=headers).json()
+    assert [a["is_active"] for a in delta["alerts"]] == [False]
+
+
+def test_unknown_version_falls_back_to_full_sync(client, register_user):
+    headers = register_user("SyncReset")
+    client.post("/nominees/", json={"name": "A", "relationship": "child", "phone": "700000102"}, headers=headers)
+    response = client.get("/sync?since=100000", headers=headers).json()
+    assert response["full"] and len(response["nominees"]) == 1
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+import dependencies
+
+
+def _phone(client, headers):
+    return client.get("/users/me", headers=headers).json()["phone"]
+
+
+def _login(client, phone):
+    token = client.post("/auth/login", json={"phone": phone, "otp": "1234"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_verified_tokens_are_not_decoded_again(client, register_user, monkeypatch):
+    headers = register_user("Cached")
+    client.get("/users/me", headers=headers)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("token decoded again")
+
+    monkeypatch.setattr(dependencies.jwt, "decode", fail)
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+
+def test_logout_revokes_only_that_token(client, register_user):
+    headers = register_user("Logout")
+    other = _login(client, _phone(client, headers))
+
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.get("/users/me", headers=other).status_code == 200
+
+
+def test_logout_all_revokes_tokens_issued_before(client, register_user):
+    headers = register_user("Everywhere")
+    phone = _phone(client, headers)
+    other = _login(client, phone)
+
+    assert client.post("/auth/logout-all", headers=other).status_code == 200
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.get("/users/me", headers=other).status_code == 401
+    assert client.get("/users/me", headers=_login(client, phone)).status_code == 200
+
+
+@pytest.mark.parametrize("tz", ["Asia/Kolkata", "America/New_York"])
+def test_logout_all_cutoff_is_independent_of_local_timezone(client, register_user, monkeypatch, tz):
+    monkeypatch.setenv("TZ", tz)
+    time.tzset()
+    try:
+        headers = register_user("Zoned")
+        phone = _phone(client, headers)
+        assert client.post("/auth/logout-all", headers=headers).status_code == 200
+        assert client.get("/users/me", headers=headers).status_code == 401
+        assert client.get("/users/me", headers=_login(client, phone)).status_code == 200
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_logout_of_a_token_without_exp(client, register_user):
+    from jose import jwt
+    from config import settings
+
+    phone = _phone(client, register_user("NoExp"))
+    token = jwt.encode({"sub": phone, "iat": time.time() - 1, "jti": "no-exp"}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert client.get("/users/me", headers=headers).status_code == 401
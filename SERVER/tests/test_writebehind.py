@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import writebehind
+
+
+@pytest.fixture
+def log_buffer(client, tmp_path, monkeypatch):
+    buffer = writebehind.LogBuffer(journal_dir=str(tmp_path), flush_interval=60)
+    monkeypatch.setattr(writebehind, "buffer", buffer)
+    buffer.start()
+    yield buffer
+    buffer.stop()
+
+
+def _medication(client, headers):
+    return client.post("/medications/", json={"name": "Aspirin", "dosage": "100mg", "scheduled_time": "08:00", "start_date": "2024-01-01"}, headers=headers).json()
+
+
+def test_updates_are_acknowledged_coalesced_and_read_back(client, register_user, log_buffer):
+    headers = register_user("Behind")
+    med = _medication(client, headers)
+    for status in ("pending", "taken", "missed", "taken"):
+        resp = client.post(f"/medications/{med['id']}/log", json={"medication_id": med["id"], "date": "2024-01-02", "status": status}, headers=headers)
+        assert resp.status_code == 202
+        assert resp.json()["status"] == status
+
+    assert log_buffer.stats["coalesced"] == 3
+    assert os.path.getsize(log_buffer.journal_path) > 0
+
+    # Reading the user's logs flushes their queued writes first
+    logs = client.get("/medications/logs", params={"start_date": "2024-01-01", "end_date": "2024-01-31"}, headers=headers).json()
+    assert [(log["date"], log["status"]) for log in logs] == [("2024-01-02", "taken")]
+    assert log_buffer.stats["written"] == 1
+    assert sorted(os.listdir(log_buffer.journal_dir)) == [f"medication-logs.{os.getpid()}.{ext}" for ext in ("jsonl", "lock")]
+
+
+def test_journal_of_dead_process_is_replayed(client, register_user, tmp_path):
+    headers = register_user("Crash")
+    med = _medication(client, headers)
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    entry = {"medication_id": med["id"], "user_id": user_id, "status": "taken", "scheduled_time": "08:00"}
+    # Journal segment of a process that has exited without flushing it
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    with open(tmp_path / f"medication-logs.{dead.pid}.jsonl.1", "w") as fh:
+        fh.write(writebehind._encode({**entry, "date": writebehind.date(2024, 2, 1), "taken_at": None}) + "\n")
+        fh.write('{"torn": ')
+
+    assert writebehind.LogBuffer(journal_dir=str(tmp_path)).recover() == 1
+    assert not os.listdir(tmp_path)
+    logs = client.get("/medications/logs", params={"start_date": "2024-02-01", "end_date": "2024-02-01"}, headers=headers).json()
+    assert [log["status"] for log in logs] == ["taken"]
+
+
+def test_journal_of_a_live_owner_is_left_alone(client, register_user, tmp_path):
+    headers = register_user("Owner")
+    med = _medication(client, headers)
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    entry = {"medication_id": med["id"], "user_id": user_id, "status": "taken", "scheduled_time": "08:00",
+             "date": writebehind.date(2024, 3, 1), "taken_at": None}
+    # The pid is irrelevant: ownership is the lock on the journal's lock file
+    with open(tmp_path / "medication-logs.4194301.jsonl", "w") as fh:
+        fh.write(writebehind._encode(entry) + "\n")
+    owner = writebehind._try_lock(str(tmp_path / "medication-logs.4194301.lock"))
+
+    assert writebehind.LogBuffer(journal_dir=str(tmp_path)).recover() == 0
+    owner.close()
+    assert writebehind.LogBuffer(journal_dir=str(tmp_path)).recover() == 1
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,131 @@
+"""
+Min-heap timer queue driven by one background thread.
+
+Each key has at most one pending timer; rescheduling or cancelling a key marks
+its old heap entry dead (lazy deletion), so schedule, cancel and fire are all
+O(log n). Due timers are handed to the handler in batches.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerQueue:
+    def __init__(self, handler, name: str = "timers", max_batch: int = 1000, clock=time.time):
+        self.handler = handler  # handler(list of (key, payload)) called on the timer thread
+        self.name = name
+        self.max_batch = max_batch
+        self.clock = clock
+        self._heap = []
+        self._live = {}  # key -> heap entry [deadline, seq, key, payload, alive]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, key):
+        return key in self._live
+
+    def schedule(self, key, deadline: float, payload=None):
+        with self._cond:
+            self._push(key, deadline, payload)
+            # Wake the timer thread only if this became the earliest deadline
+            if self._heap[0][2] == key:
+                self._cond.notify()
+
+    def schedule_many(self, items):
+        """Bulk load (key, deadline, payload) tuples with a single heapify."""
+        with self._cond:
+            for key, deadline, payload in items:
+                self._kill(key)
+                entry = [deadline, next(self._seq), key, payload, True]
+                self._live[key] = entry
+                self._heap.append(entry)
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def cancel(self, key) -> bool:
+        with self._cond:
+            return self._kill(key)
+
+    def next_deadline(self):
+        with self._cond:
+            self._drop_dead()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float = None):
+        """Remove and return up to max_batch (key, payload) pairs whose deadline has passed."""
+        now = self.clock() if now is None else now
+        due = []
+        with self._cond:
+            while self._heap and len(due) < self.max_batch:
+                entry = self._heap[0]
+                if not entry[4]:
+                    heapq.heappop(self._heap)
+                    continue
+                if entry[0] > now:
+                    break
+                heapq.heappop(self._heap)
+                del self._live[entry[2]]
+                due.append((entry[2], entry[3]))
+        return due
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _push(self, key, deadline, payload):
+        self._kill(key)
+        entry = [deadline, next(self._seq), key, payload, True]
+        self._live[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _kill(self, key) -> bool:
+        entry = self._live.pop(key, None)
+        if entry is None:
+            return False
+        entry[4] = False
+        return True
+
+    def _drop_dead(self):
+        while self._heap and not self._heap[0][4]:
+            heapq.heappop(self._heap)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    self._drop_dead()
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - self.clock()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+            batch = self.pop_due()
+            if batch:
+                try:
+                    self.handler(batch)
+                except Exception:
+                    logger.exception("%s: timer handler failed", self.name)
@@ -0,0 +1,267 @@
+"""
+Write-behind buffer for medication log updates (LOG_WRITE_BEHIND=1).
+
+POST /medications/{id}/log hands the update to `buffer` and answers 202 right away.
+Updates are coalesced per (medication_id, date), the last one winning, and written
+by a background thread in one transaction every LOG_FLUSH_INTERVAL_MS or as soon as
+LOG_FLUSH_MAX_PENDING keys are waiting. Readers of a user's logs call
+flush_user() first, so a client always reads its own writes.
+
+Each accepted update is first appended to a per-process journal file
+(LOG_JOURNAL_DIR/medication-logs.<pid>.jsonl). A flush rotates the journal and
+deletes the rotated segment once the transaction has committed; on startup,
+segments left behind by processes that are no longer running are replayed.
+The journal is flushed to the OS on every append, so it survives a crash of
+the process; LOG_JOURNAL_FSYNC=1 also fsyncs it to survive power loss.
+
+A running buffer holds an exclusive lock on medication-logs.<pid>.lock; journals
+whose lock can be taken belong to a process that is gone (a live process that
+merely reuses the pid cannot hold the old lock open).
+
+Queued writes and flush_user() are local to one process, so a read served by
+another worker would not see them: serve.py refuses LOG_WRITE_BEHIND=1 with
+more than one worker.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+
+from config import settings
+from database import SessionLocal, insert_for
+import adherence, changes, models
+
+logger = logging.getLogger(__name__)
+
+
+def log_upsert(bind):
+    """INSERT ... ON CONFLICT (medication_id, date) DO UPDATE for medication logs."""
+    insert = insert_for(bind)
+    stmt = insert(models.MedicationLog)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.MedicationLog.medication_id, models.MedicationLog.date],
+        set_={"status": stmt.excluded.status, "taken_at": stmt.excluded.taken_at,
+              "row_version": stmt.excluded.row_version, "updated_at": stmt.excluded.updated_at}
+    )
+
+
+def _encode(entry: dict) -> str:
+    return json.dumps({**entry, "date": entry["date"].isoformat(),
+                       "taken_at": entry["taken_at"].isoformat() if entry["taken_at"] else None})
+
+
+def _decode(line: str) -> dict:
+    entry = json.loads(line)
+    entry["date"] = date.fromisoformat(entry["date"])
+    entry["taken_at"] = datetime.fromisoformat(entry["taken_at"]) if entry["taken_at"] else None
+    return entry
+
+
+def _try_lock(path: str):
+    """Open and exclusively lock `path`; returns the handle, or None if another process holds it."""
+    import fcntl
+    handle = open(path, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+class LogBuffer:
+    def __init__(self, session_factory=SessionLocal, journal_dir: str = None, flush_interval: float = None,
+                 max_pending: int = None, fsync: bool = None):
+        self.session_factory = session_factory
+        self.journal_dir = journal_dir or settings.LOG_JOURNAL_DIR
+        self.flush_interval = flush_interval if flush_interval is not None else settings.LOG_FLUSH_INTERVAL_MS / 1000
+        self.max_pending = max_pending or settings.LOG_FLUSH_MAX_PENDING
+        self.fsync = settings.LOG_JOURNAL_FSYNC if fsync is None else fsync
+        self.stats = {"submitted": 0, "coalesced": 0, "flushes": 0, "written": 0, "recovered": 0, "failed_flushes": 0}
+
+        self._pending = {}  # (medication_id, date) -> entry
+        self._users = set()
+        self._segments = []  # rotated journal segments not yet known to be committed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wakeup = threading.Condition(self._lock)
+        self._journal = None
+        self._owner_lock = None
+        self._sequence = 0
+        self._stopping = False
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.journal_dir, f"medication-logs.{os.getpid()}.jsonl")
+
+    def _lock_path(self, pid: int) -> str:
+        return os.path.join(self.journal_dir, f"medication-logs.{pid}.lock")
+
+    def start(self):
+        if self.running:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        # Held until stop(); files under our pid left by an earlier process are replayed below
+        self._owner_lock = _try_lock(self._lock_path(os.getpid()))
+        self.recover()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="log-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything still pending and close the journal."""
+        if not self.running:
+            return
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join(timeout=10)
+        self._thread = None
+        self.flush()
+        with self._lock:
+            self._journal.close()
+            self._journal = None
+        if not self._segments and os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) == 0:
+            os.remove(self.journal_path)
+            os.remove(self._lock_path(os.getpid()))
+        if self._owner_lock is not None:
+            self._owner_lock.close()
+            self._owner_lock = None
+
+    def submit(self, entry: dict):
+        """
+        Queue a log write. `entry` has medication_id, user_id, date, status, taken_at and
+        scheduled_time (for the adherence rollup). Durable once this returns.
+        """
+        line = _encode(entry) + "\n"
+        key = (entry["medication_id"], entry["date"])
+        with self._lock:
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self.stats["submitted"] += 1
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+            self._pending[key] = entry
+            self._users.add(entry["user_id"])
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.notify()
+
+    def has_pending(self, user_id: int) -> bool:
+        with self._lock:
+            return user_id in self._users
+
+    def flush_user(self, user_id: int):
+        """Read-your-writes: flush before reading a user's logs if any of theirs are queued."""
+        if self.has_pending(user_id):
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all pending entries in one transaction; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending, self._users = self._pending, {}, set()
+                self._rotate()
+            try:
+                self._write(list(batch.values()))
+            except Exception:
+                # Put back whatever was not superseded meanwhile; the segments stay on disk
+                with self._lock:
+                    for key, entry in batch.items():
+                        if key not in self._pending:
+                            self._pending[key] = entry
+                            self._users.add(entry["user_id"])
+                    self.stats["failed_flushes"] += 1
+                raise
+            for segment in self._segments:
+                os.remove(segment)
+            self._segments = []
+            self.stats["flushes"] += 1
+            self.stats["written"] += len(batch)
+            return len(batch)
+
+    def recover(self):
+        """Replay journal segments left by processes that are no longer running."""
+        entries = {}
+        segments = []
+        locks = []  # owner locks of dead processes, held until their segments are gone
+        orphaned = {}
+        try:
+            for path in sorted(glob.glob(os.path.join(self.journal_dir, "medication-logs.*.jsonl*")), key=os.path.getmtime):
+                pid = int(os.path.basename(path).split(".")[1])
+                if pid != os.getpid() and pid not in orphaned:
+                    handle = _try_lock(self._lock_path(pid))
+                    orphaned[pid] = handle is not None
+                    if handle is not None:
+                        locks.append((pid, handle))
+                if pid != os.getpid() and not orphaned[pid]:
+                    continue  # owner is running
+                try:
+                    with open(path, encoding="utf-8") as fh:
+                        for line in fh:
+                            if not line.endswith("\n"):
+                                break  # torn final write
+                            entry = _decode(line)
+                            entries[(entry["medication_id"], entry["date"])] = entry
+                except FileNotFoundError:
+                    continue  # replayed by another worker meanwhile
+                segments.append(path)
+            if entries:
+                self._write(list(entries.values()))
+                logger.info("Recovered %d medication log writes from %d journal segments", len(entries), len(segments))
+            for path in segments:
+                os.remove(path)
+        finally:
+            for pid, handle in locks:
+                if os.path.exists(self._lock_path(pid)):
+                    os.remove(self._lock_path(pid))
+                handle.close()
+        self.stats["recovered"] += len(entries)
+        return len(entries)
+
+    def _rotate(self):
+        # Caller holds self._lock
+        if self._journal is None or self._journal.tell() == 0:
+            return
+        self._journal.close()
+        self._sequence += 1
+        segment = f"{self.journal_path}.{self._sequence}"
+        os.replace(self.journal_path, segment)
+        self._segments.append(segment)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _write(self, entries):
+        db = self.session_factory()
+        try:
+            rows = [{key: entry[key] for key in ("medication_id", "user_id", "date", "status", "taken_at")} for entry in entries]
+            db.execute(log_upsert(db.get_bind()), changes.stamp_rows(db, rows))
+            adherence.record(db, entries)
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopping and len(self._pending) < self.max_pending:
+                    self._wakeup.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("medication log flush failed; retrying")
+
+
+buffer = LogBuffer()
@@ -47,25 +47,75 @@ export interface MedicationLog {
     taken_at?: string;
 }
 
+export interface EmergencyAlert {
+    id: number;
+    user_id: number;
+    stage: string;
+    is_active: boolean;
+    created_at: string;
+    resolved_at?: string;
+    // When the server moves the alert to its next stage (null once it cannot escalate further)
+    escalate_at?: string | null;
+}
+
+export interface Dashboard {
+    day: string;
+    medications: Medication[];
+    logs: MedicationLog[];
+    nominees: Nominee[];
+    active_alert: EmergencyAlert | null;
+}
+
+export interface AdherenceStat {
+    medication_id: number;
+    period: 'day' | 'week';
+    period_start: string;
+    taken: number;
+    missed: number;
+    pending: number;
+    mean_delay_minutes: number | null;
+}
+
+export interface SyncChanges {
+    version: number;
+    full: boolean;
+    medications: Medication[];
+    nominees: Nominee[];
+    logs: MedicationLog[];
+    alerts: EmergencyAlert[];
+    deleted: { entity: 'nominee'; id: number }[];
+}
+
 export const auth = {
     checkUser: (phone: string) => api.post<{ exists: boolean }>('/auth/check-user', { phone }),
     login: (phone: string, otp: string) => api.post<{ access_token: string; is_registered: boolean }>('/auth/login', { phone, otp }),
     register: (data: any) => api.post<{ access_token: string }>('/auth/register', data),
     me: () => api.get<User>('/users/me'),
+    logout: () => api.post('/auth/logout'),
+    logoutAll: () => api.post('/auth/logout-all'),
 };
 
 export const data = {
+    getDashboard: (day: string) => api.get<Dashboard>('/dashboard/', { params: { day } }),
     getMedications: () => api.get<Medication[]>('/medications'),
     getMedicationLogs: (start: string, end: string) => api.get<MedicationLog[]>('/medications/logs', { params: { start_date: start, end_date: end } }),
+    getAdherenceStats: (start: string, end: string, period: 'day' | 'week' = 'day') => api.get<AdherenceStat[]>('/medications/stats', { params: { start_date: start, end_date: end, period } }),
     recordCompliance: (medId: number, date: string, status: string, takenAt?: string) => api.post(`/medications/${medId}/log`, { date, status, taken_at: takenAt }),
+    recordComplianceBatch: (logs: { medication_id: number; date: string; status: string; taken_at?: string }[]) => api.post('/medications/logs/batch', { logs }),
     getNominees: () => api.get<Nominee[]>('/nominees'),
     createNominee: (data: Omit<Nominee, 'id'>) => api.post<Nominee>('/nominees', data),
+    // Rows changed after `since` (the `version` of the previous response; 0 for a full sync)
+    getChanges: (since = 0) => api.get<SyncChanges>('/sync', { params: { since } }),
 }
 
 export const emergency = {
     getActive: () => api.get<any>('/emergency/active'),
-    trigger: (stage: string) => api.post<any>('/emergency', { stage }),
-    resolve: (id: number) => api.post<any>(`/emergency/${id}/resolve`)
+    trigger: (stage: string, idempotencyKey?: string) => api.post<EmergencyAlert>('/emergency', { stage }, {
+        headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+    }),
+    resolve: (id: number) => api.post<any>(`/emergency/${id}/resolve`),
+    // Server-Sent Events push of alert stage changes (EventSource cannot send headers)
+    stream: () => new EventSource(`/api/emergency/stream?access_token=${encodeURIComponent(localStorage.getItem('token') ?? '')}`),
 }
 
 export default api;
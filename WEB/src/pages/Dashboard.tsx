@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { VoiceButton } from "@/components/lumi/VoiceButton";
 import { MedicationCard } from "@/components/lumi/MedicationCard";
 import { MedicationStats } from "@/components/lumi/MedicationStats";
@@ -7,7 +7,7 @@ import { NomineeCard } from "@/components/lumi/NomineeCard";
 import { SettingsPanel } from "@/components/lumi/SettingsPanel";
 import { Heart, Sun } from "lucide-react";
 import type { Medication, EmergencyStatus as EmergencyStatusType, Nominee } from "@/types/lumi";
-import { data, emergency } from "@/lib/api";
+import { data, emergency, type EmergencyAlert } from "@/lib/api";
 import { toast } from "sonner";
 import { format } from "date-fns";
 
@@ -20,26 +20,49 @@ export default function Dashboard() {
     lastEmergencyTime: "No active alerts",
   });
   const [alertId, setAlertId] = useState<number | null>(null);
+  // One key per emergency, so repeated taps and network retries replay the first trigger
+  const triggerKey = useRef<string | null>(null);
   const [isListening, setIsListening] = useState(false);
 
   useEffect(() => {
     loadDashboardData();
-    checkEmergencyStatus();
+  }, []);
+
+  useEffect(() => {
+    const source = emergency.stream();
+    source.addEventListener("alert", (event) => {
+      const alert: EmergencyAlert = JSON.parse((event as MessageEvent).data);
+      if (alert.is_active) {
+        setEmergencyStatus({
+          isActive: true,
+          stage: alert.stage as any,
+          lastEmergencyTime: new Date(alert.created_at).toLocaleTimeString()
+        });
+        setAlertId(alert.id);
+      } else {
+        setEmergencyStatus({
+          isActive: false,
+          stage: "none",
+          lastEmergencyTime: "Resolved just now",
+        });
+        setAlertId(null);
+        // Resolved elsewhere (another tab, device or a nominee): the next tap is a new emergency
+        triggerKey.current = null;
+      }
+    });
+    return () => source.close();
   }, []);
 
   const loadDashboardData = async () => {
     try {
       const today = format(new Date(), 'yyyy-MM-dd');
 
-      const [medsRes, logsRes, nomineesRes] = await Promise.all([
-        data.getMedications(),
-        data.getMedicationLogs(today, today),
-        data.getNominees()
-      ]);
+      // One aggregated request; unchanged dashboards come back as 304 from the browser cache
+      const { data: dashboard } = await data.getDashboard(today);
 
       // Map backend data to frontend types
-      const mappedMeds: Medication[] = medsRes.data.map(m => {
-        const log = logsRes.data.find(l => l.medication_id === m.id);
+      const mappedMeds: Medication[] = dashboard.medications.map(m => {
+        const log = dashboard.logs.find(l => l.medication_id === m.id);
         return {
           id: m.id.toString(),
           name: m.name,
@@ -50,7 +73,7 @@ export default function Dashboard() {
         };
       });
 
-      const mappedNominees: Nominee[] = nomineesRes.data.map(n => ({
+      const mappedNominees: Nominee[] = dashboard.nominees.map(n => ({
         id: n.id.toString(),
         name: n.name,
         relationship: n.relationship,
@@ -60,25 +83,21 @@ export default function Dashboard() {
       setMedications(mappedMeds);
       setNominees(mappedNominees);
 
-    } catch (error) {
-      console.error("Failed to load dashboard data", error);
-      toast.error("Could not load data");
-    }
-  };
-
-  const checkEmergencyStatus = async () => {
-    try {
-      const { data } = await emergency.getActive();
-      if (data && data.is_active) {
+      const alert = dashboard.active_alert;
+      if (alert && alert.is_active) {
         setEmergencyStatus({
           isActive: true,
-          stage: data.stage as any,
-          lastEmergencyTime: new Date(data.created_at).toLocaleTimeString()
+          stage: alert.stage as any,
+          lastEmergencyTime: new Date(alert.created_at).toLocaleTimeString()
         });
-        setAlertId(data.id);
+        setAlertId(alert.id);
+      } else {
+        triggerKey.current = null;
       }
-    } catch (e) {
-      // No active emergency, logic relies on 404 or empty
+
+    } catch (error) {
+      console.error("Failed to load dashboard data", error);
+      toast.error("Could not load data");
     }
   };
 
@@ -110,7 +129,8 @@ export default function Dashboard() {
         isActive: true,
         stage: "voice_alert",
       });
-      const { data } = await emergency.trigger("voice_alert");
+      triggerKey.current ??= crypto.randomUUID();
+      const { data } = await emergency.trigger("voice_alert", triggerKey.current);
       setAlertId(data.id);
       toast.error("Emergency Alert Triggered!");
     } catch (error) {
@@ -137,6 +157,7 @@ export default function Dashboard() {
         lastEmergencyTime: "Resolved just now",
       });
       setAlertId(null);
+      triggerKey.current = null;
       toast.success("Emergency Cancelled");
     } catch (error) {
       toast.error("Failed to resolve emergency");